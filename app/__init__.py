@@ -1,4 +1,4 @@
-from flask import Flask
+from flask import Flask, request
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 
@@ -34,4 +34,19 @@ def create_app():
     def getattr_filter(obj, attr):
         return getattr(obj, attr, None)
     
+    # Datos de referencia en memoria: una lectura del contador de versión por petición
+    from app.utils.reference import check_version
+
+    @app.before_request
+    def check_reference_version():
+        if request.endpoint != 'static':
+            check_version()
+    
+    # Claves enteras (supplier_id, material_id, ...) y renombres de códigos en cada flush
+    from app.utils import surrogates  # noqa: F401
+
+    # Token para el campo oculto idempotency_key de los formularios
+    from app.utils.idempotency import idempotency_token
+    app.jinja_env.globals['idempotency_token'] = idempotency_token
+    
     return app
\ No newline at end of file
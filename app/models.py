@@ -2,6 +2,38 @@ from app import db, login_manager
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
+from decimal import Decimal, ROUND_HALF_UP
+from sqlalchemy.types import TypeDecorator, BigInteger
+
+# ------------- tipo de dato para importes monetarios -------------------------------------------
+class Money(TypeDecorator):
+    """Importe monetario guardado como entero en centavos.
+
+    En Python se trabaja con Decimal de 2 decimales; en la base de datos los
+    importes son enteros, así que SUM() y demás agregados son exactos.
+    """
+    impl = BigInteger
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return to_cents(value)
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return from_cents(value)
+
+def to_cents(value):
+    """Convierte un importe (Decimal, float, int o texto) a centavos enteros"""
+    if not isinstance(value, Decimal):
+        value = Decimal(str(value))
+    return int((value * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+
+def from_cents(cents):
+    """Convierte centavos enteros a Decimal con 2 decimales"""
+    return Decimal(int(cents)).scaleb(-2)
 
 # ------------- seccion de base de datos para la tabla roles------------------------------------- 
 class Role(db.Model):
@@ -43,10 +75,13 @@ class User(UserMixin, db.Model):
         if self.is_superuser:
             return True
         
-        if not self.role:
+        # Rol desde la copia en memoria de los datos de referencia (sin consulta por petición)
+        from app.utils.reference import reference_cache
+        role = reference_cache.get().roles_by_id.get(self.role_id)
+        if not role:
             return False
             
-        permission_level = getattr(self.role, f"{module}_permission", 0)
+        permission_level = getattr(role, f"{module}_permission", 0) or 0
         return permission_level >= required_level
 
 @login_manager.user_loader
@@ -57,7 +92,7 @@ def load_user(id):
 class Unit(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False, unique=True)
-    symbol = db.Column(db.String(10), nullable=False)
+    symbol = db.Column(db.String(10), nullable=False, unique=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 class MaterialType(db.Model):
@@ -73,7 +108,11 @@ class Material(db.Model):
     description = db.Column(db.Text)
     unit = db.Column(db.String(20), nullable=False)
     type = db.Column(db.String(50), nullable=False)
+    # Claves enteras de unit (símbolo) y type (nombre); las mantiene app/utils/surrogates.py
+    unit_id = db.Column(db.Integer, db.ForeignKey('unit.id'), index=True)
+    type_id = db.Column(db.Integer, db.ForeignKey('material_type.id'), index=True)
     status = db.Column(db.Boolean, default=True)
+    archived_at = db.Column(db.DateTime)  # Inactivo archivado (app/utils/archive.py)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     created_by = db.Column(db.String(100), nullable=False)
@@ -91,6 +130,22 @@ class Material(db.Model):
             'updated_at': self.updated_at.strftime('%Y-%m-%d %H:%M:%S'),
             'created_by': self.created_by
         }
+
+# Autocompletado por prefijo sin distinguir mayúsculas (app/utils/autocomplete.py), solo filas activas
+db.Index('ix_material_id_material_lower', db.func.lower(Material.id_material),
+         sqlite_where=Material.status == db.true(), postgresql_where=Material.status == db.true())
+db.Index('ix_material_name_lower', db.func.lower(Material.name),
+         sqlite_where=Material.status == db.true(), postgresql_where=Material.status == db.true())
+
+# Orden por keyset (columna, id) y facetas de la grilla (app/utils/grid.py), sin filas archivadas
+db.Index('ix_material_grid_name', Material.name, Material.id,
+         sqlite_where=Material.archived_at.is_(None), postgresql_where=Material.archived_at.is_(None))
+db.Index('ix_material_grid_type', Material.type, Material.id,
+         sqlite_where=Material.archived_at.is_(None), postgresql_where=Material.archived_at.is_(None))
+db.Index('ix_material_grid_created_at', Material.created_at, Material.id,
+         sqlite_where=Material.archived_at.is_(None), postgresql_where=Material.archived_at.is_(None))
+db.Index('ix_material_grid_status', Material.status, Material.id,
+         sqlite_where=Material.archived_at.is_(None), postgresql_where=Material.archived_at.is_(None))
     
 # --------------------------- seccion de proveedores -----------------------------------------------
 class Country(db.Model):
@@ -126,6 +181,7 @@ class Supplier(db.Model):
     payment_method = db.Column(db.String(100))
     bank_account = db.Column(db.String(100))
     status = db.Column(db.Boolean, default=True)
+    archived_at = db.Column(db.DateTime)  # Inactivo archivado (app/utils/archive.py)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     created_by = db.Column(db.String(100), nullable=False)
@@ -156,6 +212,22 @@ class Supplier(db.Model):
             'updated_at': self.updated_at.strftime('%Y-%m-%d %H:%M:%S'),
             'created_by': self.created_by
         }        
+
+# Autocompletado por prefijo sin distinguir mayúsculas (app/utils/autocomplete.py), solo filas activas
+db.Index('ix_supplier_id_suplier_lower', db.func.lower(Supplier.id_suplier),
+         sqlite_where=Supplier.status == db.true(), postgresql_where=Supplier.status == db.true())
+db.Index('ix_supplier_name_lower', db.func.lower(Supplier.name),
+         sqlite_where=Supplier.status == db.true(), postgresql_where=Supplier.status == db.true())
+
+# Orden por keyset (columna, id) y facetas de la grilla (app/utils/grid.py), sin filas archivadas
+db.Index('ix_supplier_grid_name', Supplier.name, Supplier.id,
+         sqlite_where=Supplier.archived_at.is_(None), postgresql_where=Supplier.archived_at.is_(None))
+db.Index('ix_supplier_grid_country', Supplier.country, Supplier.id,
+         sqlite_where=Supplier.archived_at.is_(None), postgresql_where=Supplier.archived_at.is_(None))
+db.Index('ix_supplier_grid_created_at', Supplier.created_at, Supplier.id,
+         sqlite_where=Supplier.archived_at.is_(None), postgresql_where=Supplier.archived_at.is_(None))
+db.Index('ix_supplier_grid_status', Supplier.status, Supplier.id,
+         sqlite_where=Supplier.archived_at.is_(None), postgresql_where=Supplier.archived_at.is_(None))
         
 # ------------------------------- clientes modelo base de datos ------------------------------------------
 class Customer(db.Model):
@@ -178,7 +250,10 @@ class Customer(db.Model):
     payments_terms = db.Column(db.String(200))
     payment_method = db.Column(db.String(100))
     bank_account = db.Column(db.String(100))
+    credit_limit = db.Column(Money)  # None = sin límite
+    receivable_balance = db.Column(Money, nullable=False, default=0)  # Saldo por cobrar, se mantiene al registrar ventas y cobros
     status = db.Column(db.Boolean, default=True)
+    archived_at = db.Column(db.DateTime)  # Inactivo archivado (app/utils/archive.py)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     created_by = db.Column(db.String(100), nullable=False)
@@ -209,7 +284,34 @@ class Customer(db.Model):
             'updated_at': self.updated_at.strftime('%Y-%m-%d %H:%M:%S'),
             'created_by': self.created_by
         }
-    
+
+# Autocompletado por prefijo sin distinguir mayúsculas (app/utils/autocomplete.py), solo filas activas
+db.Index('ix_customer_id_customer_lower', db.func.lower(Customer.id_customer),
+         sqlite_where=Customer.status == db.true(), postgresql_where=Customer.status == db.true())
+db.Index('ix_customer_name_lower', db.func.lower(Customer.name),
+         sqlite_where=Customer.status == db.true(), postgresql_where=Customer.status == db.true())
+
+# Orden por keyset (columna, id) y facetas de la grilla (app/utils/grid.py), sin filas archivadas
+db.Index('ix_customer_grid_name', Customer.name, Customer.id,
+         sqlite_where=Customer.archived_at.is_(None), postgresql_where=Customer.archived_at.is_(None))
+db.Index('ix_customer_grid_country', Customer.country, Customer.id,
+         sqlite_where=Customer.archived_at.is_(None), postgresql_where=Customer.archived_at.is_(None))
+db.Index('ix_customer_grid_created_at', Customer.created_at, Customer.id,
+         sqlite_where=Customer.archived_at.is_(None), postgresql_where=Customer.archived_at.is_(None))
+db.Index('ix_customer_grid_status', Customer.status, Customer.id,
+         sqlite_where=Customer.archived_at.is_(None), postgresql_where=Customer.archived_at.is_(None))
+
+
+class CustomerPayment(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    id_customer = db.Column(db.String(50), nullable=False, index=True)
+    date = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    amount = db.Column(Money, nullable=False)
+    reference = db.Column(db.String(100))
+    entry_id = db.Column(db.Integer, db.ForeignKey('journal_entry.id'))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_by = db.Column(db.String(100), nullable=False)
+
 # ------------------------------- seccion de Compras ------------------------------------------------
 # Agregar al final de models.py
 
@@ -217,10 +319,11 @@ class PurchaseOrder(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     id_purchase_order = db.Column(db.String(50), unique=True, nullable=False)
     id_supplier = db.Column(db.String(50), nullable=False)
+    supplier_id = db.Column(db.Integer, db.ForeignKey('supplier.id'), index=True)
     issue_date = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     estimated_delivery_date = db.Column(db.DateTime, nullable=False)
     status = db.Column(db.String(20), default='Pendiente')  # Pendiente, Aprobada, Enviada, Recibida, Cancelada
-    total_amount = db.Column(db.Float, default=0.0)
+    total_amount = db.Column(Money, default=0)
     currency = db.Column(db.String(10), nullable=False)
     notes = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -234,7 +337,7 @@ class PurchaseOrder(db.Model):
             'issue_date': self.issue_date.strftime('%Y-%m-%d'),
             'estimated_delivery_date': self.estimated_delivery_date.strftime('%Y-%m-%d'),
             'status': self.status,
-            'total_amount': self.total_amount,
+            'total_amount': str(self.total_amount),
             'currency': self.currency,
             'notes': self.notes or '',
             'created_at': self.created_at.strftime('%Y-%m-%d %H:%M:%S'),
@@ -247,10 +350,12 @@ class PurchaseOrderLine(db.Model):
     id_purchase_order_line = db.Column(db.String(50), unique=True, nullable=False)
     id_purchase_order = db.Column(db.String(50), nullable=False)
     id_material = db.Column(db.String(50), nullable=False)
+    purchase_order_id = db.Column(db.Integer, db.ForeignKey('purchase_order.id'), index=True)
+    material_id = db.Column(db.Integer, db.ForeignKey('material.id'), index=True)
     position = db.Column(db.Integer, nullable=False)
     quantity = db.Column(db.Integer, nullable=False)
     unit_material = db.Column(db.String(20), nullable=False)
-    price = db.Column(db.Float, nullable=False)
+    price = db.Column(Money, nullable=False)
     currency_suppliers = db.Column(db.String(10), nullable=False)
     resolved_quantity = db.Column(db.Integer, default=0)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -265,7 +370,7 @@ class PurchaseOrderLine(db.Model):
             'position': self.position,
             'quantity': self.quantity,
             'unit_material': self.unit_material,
-            'price': self.price,
+            'price': str(self.price),
             'currency_suppliers': self.currency_suppliers,
             'resolved_quantity': self.resolved_quantity,
             'created_at': self.created_at.strftime('%Y-%m-%d %H:%M:%S'),
@@ -281,6 +386,7 @@ class Location(db.Model):
     name = db.Column(db.String(200), nullable=False)
     code = db.Column(db.String(50), unique=True, nullable=False)
     main_location = db.Column(db.Boolean, default=False)
+    priority = db.Column(db.Integer, default=0)  # Cercanía para asignación de stock (menor = más cerca)
     location = db.Column(db.String(500))  # Dirección física
     status = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -293,6 +399,7 @@ class Location(db.Model):
             'name': self.name,
             'code': self.code,
             'main_location': self.main_location,
+            'priority': self.priority,
             'location': self.location,
             'status': 'Activo' if self.status else 'Inactivo',
             'created_at': self.created_at.strftime('%Y-%m-%d %H:%M:%S'),
@@ -300,11 +407,15 @@ class Location(db.Model):
             'created_by': self.created_by
         }
 
+# Autocompletado por prefijo sin distinguir mayúsculas (app/utils/autocomplete.py)
+db.Index('ix_locations_inventory_code_lower', db.func.lower(Location.code))
+db.Index('ix_locations_inventory_name_lower', db.func.lower(Location.name))
+
 class InventoryMovement(db.Model):
     __tablename__ = 'inventory_movements'
     id = db.Column(db.Integer, primary_key=True)
     id_location = db.Column(db.Integer, db.ForeignKey('locations_inventory.id'), nullable=False)
-    id_material = db.Column(db.String(50), db.ForeignKey('material.id_material'), nullable=False)
+    id_material = db.Column(db.String(50), db.ForeignKey('material.id_material', onupdate='CASCADE'), nullable=False)
     quantity = db.Column(db.Integer, nullable=False)
     unit_type = db.Column(db.String(20), nullable=False)
     movement_type = db.Column(db.String(20), nullable=False)  # ENTRADA, SALIDA, AJUSTE
@@ -335,7 +446,7 @@ class InventoryStock(db.Model):
     __tablename__ = 'inventory_stock'
     id = db.Column(db.Integer, primary_key=True)
     id_location = db.Column(db.Integer, db.ForeignKey('locations_inventory.id'), nullable=False)
-    id_material = db.Column(db.String(50), db.ForeignKey('material.id_material'), nullable=False)
+    id_material = db.Column(db.String(50), db.ForeignKey('material.id_material', onupdate='CASCADE'), nullable=False)
     quantity = db.Column(db.Integer, default=0)
     unit_type = db.Column(db.String(20), nullable=False)
     min_stock = db.Column(db.Integer, default=0)
@@ -364,6 +475,23 @@ class InventoryStock(db.Model):
             'created_by': self.created_by
         }   
 
+class StockReservation(db.Model):
+    """Cantidad apartada de una bodega para una venta"""
+    __tablename__ = 'stock_reservation'
+    __table_args__ = (db.Index('ix_stock_reservation_material_location_status', 'id_material', 'id_location', 'status'),)
+    id = db.Column(db.Integer, primary_key=True)
+    id_sale_order = db.Column(db.String(50), nullable=False, index=True)
+    id_location = db.Column(db.Integer, db.ForeignKey('locations_inventory.id'), nullable=False)
+    id_material = db.Column(db.String(50), db.ForeignKey('material.id_material', onupdate='CASCADE'), nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    returned_quantity = db.Column(db.Integer, nullable=False, default=0)  # Devuelto a la bodega tras consumir
+    status = db.Column(db.String(20), nullable=False, default='reservado')  # reservado, consumido, liberado, vencido
+    expires_at = db.Column(db.DateTime, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_by = db.Column(db.String(100), nullable=False)
+
+    location = db.relationship('Location')
+
 # --------------------------- Modulo de contabilidad ------------------------
 class AccountType(db.Model):
     __tablename__ = 'account_type'
@@ -439,9 +567,13 @@ class AccountAccount(db.Model):
     account_type = db.Column(db.String(50), nullable=False)  # Referencia a id_account_type
     account_group = db.Column(db.String(50), nullable=False)  # Referencia a id_account_group
     nature = db.Column(db.String(50), nullable=False)  # Referencia a id_account_nature
+    account_type_id = db.Column(db.Integer, db.ForeignKey('account_type.id'), index=True)
+    account_group_id = db.Column(db.Integer, db.ForeignKey('account_group.id'), index=True)
+    nature_id = db.Column(db.Integer, db.ForeignKey('account_nature.id'), index=True)
     currency_id = db.Column(db.String(10), nullable=False)  # Referencia a currencies.symbol
     country_id = db.Column(db.String(10), nullable=False)  # Referencia a countries.symbol
     parent_account = db.Column(db.String(50))  # Referencia a id_account (jerarquía)
+    path = db.Column(db.String(500), index=True)  # Ruta materializada: /raiz/.../id_account/
     status = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -487,7 +619,8 @@ class JournalEntry(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     date = db.Column(db.Date, nullable=False, default=datetime.utcnow)
     description = db.Column(db.String(255), nullable=False) # Glosa o detalle
-    reference = db.Column(db.String(50)) # Nro de factura o documento
+    reference = db.Column(db.String(50), index=True) # Nro de factura o documento
+    number = db.Column(db.String(30), unique=True) # Folio de la secuencia de asientos
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     created_by = db.Column(db.String(100))
     
@@ -501,20 +634,47 @@ class JournalItem(db.Model):
     entry_id = db.Column(db.Integer, db.ForeignKey('journal_entry.id'), nullable=False)
     account_id = db.Column(db.String(50), db.ForeignKey('account_account.id_account'), nullable=False)
     
-    # Usamos Numeric para evitar errores de redondeo en dinero
-    debit = db.Column(db.Numeric(15, 2), default=0.0)
-    credit = db.Column(db.Numeric(15, 2), default=0.0)  
+    # Importes en centavos enteros (Money) para evitar errores de redondeo en dinero
+    debit = db.Column(Money, default=0)
+    credit = db.Column(Money, default=0)
+    # Importe en la moneda de la cuenta (positivo al debe, negativo al haber), solo cuentas en moneda extranjera
+    amount_currency = db.Column(Money)
+
+class ExchangeRate(db.Model):
+    """Tipo de cambio diario: unidades de moneda funcional por 1 unidad de la moneda"""
+    __tablename__ = 'exchange_rate'
+    __table_args__ = (db.UniqueConstraint('currency', 'date', name='uq_exchange_rate_currency_date'),)
+    id = db.Column(db.Integer, primary_key=True)
+    currency = db.Column(db.String(10), nullable=False, index=True)  # Referencia a currencies.symbol
+    date = db.Column(db.Date, nullable=False)
+    rate = db.Column(db.Numeric(18, 6), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_by = db.Column(db.String(100), nullable=False)
+
+    def to_dict(self):
+        return {
+            'currency': self.currency,
+            'date': self.date.strftime('%Y-%m-%d'),
+            'rate': str(self.rate),
+            'created_at': self.created_at.strftime('%Y-%m-%d %H:%M:%S'),
+            'created_by': self.created_by
+        }
 
 #------------------------------- Modulo de ventas ---------------------------------------------
 class SaleOrder(db.Model):
     """Cabecera de la Venta"""
     __tablename__ = 'sale_order'
+    __table_args__ = (
+        # Listado paginado por fecha (keyset) y filtrado por cliente
+        db.Index('ix_sale_order_issue_date_id', 'issue_date', 'id'),
+        db.Index('ix_sale_order_customer_issue_date', 'id_customer', 'issue_date', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     id_sale_order = db.Column(db.String(50), unique=True, nullable=False) # ID personalizado
-    id_customer = db.Column(db.String(50), db.ForeignKey('customer.id_customer'), nullable=False)
+    id_customer = db.Column(db.String(50), db.ForeignKey('customer.id_customer', onupdate='CASCADE'), nullable=False)
     issue_date = db.Column(db.Date, default=datetime.utcnow)
-    status = db.Column(db.String(20), default='en tramite') # en tramite, enviado, aprobado, recibido
-    total_amount = db.Column(db.Float, default=0.0)
+    status = db.Column(db.String(20), default='en tramite') # reservado, aprobado, devuelto parcial, devuelto, cancelado, vencido
+    total_amount = db.Column(Money, default=0)
     currency = db.Column(db.String(10), nullable=False)
     customer_purchase_id = db.Column(db.String(50)) # Orden de compra del cliente
     notes = db.Column(db.Text)
@@ -528,8 +688,133 @@ class SaleOrderLine(db.Model):
     """Detalle de la Venta"""
     __tablename__ = 'sale_order_line'
     id = db.Column(db.Integer, primary_key=True)
-    id_sale_order = db.Column(db.String(50), db.ForeignKey('sale_order.id_sale_order'))
-    id_material = db.Column(db.String(50), db.ForeignKey('material.id_material'))
+    id_sale_order = db.Column(db.String(50), db.ForeignKey('sale_order.id_sale_order'), index=True)
+    id_material = db.Column(db.String(50), db.ForeignKey('material.id_material', onupdate='CASCADE'))
+    quantity = db.Column(db.Integer, nullable=False)
+    returned_quantity = db.Column(db.Integer, nullable=False, default=0)
+    unit_price = db.Column(Money, nullable=False)
+    subtotal = db.Column(Money, nullable=False)         
+
+class SaleQuotation(db.Model):
+    """Cabecera de la Cotización"""
+    __tablename__ = 'sale_quotation'
+    id = db.Column(db.Integer, primary_key=True)
+    id_quotation = db.Column(db.String(50), unique=True, nullable=False)
+    id_customer = db.Column(db.String(50), db.ForeignKey('customer.id_customer', onupdate='CASCADE'), nullable=False)
+    issue_date = db.Column(db.Date, default=datetime.utcnow)
+    valid_until = db.Column(db.Date, nullable=False)
+    status = db.Column(db.String(20), default='borrador', index=True) # borrador, aceptada, rechazada, convertida
+    total_amount = db.Column(Money, default=0)
+    currency = db.Column(db.String(10), nullable=False)
+    id_sale_order = db.Column(db.String(50)) # Venta generada al convertir
+    notes = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_by = db.Column(db.String(100))
+
+    items = db.relationship('SaleQuotationLine', backref='quotation', cascade="all, delete-orphan")
+
+class SaleQuotationLine(db.Model):
+    """Detalle de la Cotización"""
+    __tablename__ = 'sale_quotation_line'
+    id = db.Column(db.Integer, primary_key=True)
+    id_quotation = db.Column(db.String(50), db.ForeignKey('sale_quotation.id_quotation'), index=True)
+    id_material = db.Column(db.String(50), db.ForeignKey('material.id_material', onupdate='CASCADE'))
     quantity = db.Column(db.Integer, nullable=False)
-    unit_price = db.Column(db.Float, nullable=False)
-    subtotal = db.Column(db.Float, nullable=False)         
\ No newline at end of file
+    unit_price = db.Column(Money, nullable=False)
+    subtotal = db.Column(Money, nullable=False)
+
+class PriceList(db.Model):
+    """Lista de precios por categoría de cliente y moneda, con vigencia"""
+    __tablename__ = 'price_list'
+    id = db.Column(db.Integer, primary_key=True)
+    code = db.Column(db.String(50), unique=True, nullable=False)
+    name = db.Column(db.String(200), nullable=False)
+    category = db.Column(db.String(100))  # Customer.category; vacío = todas las categorías
+    currency = db.Column(db.String(10), nullable=False)
+    valid_from = db.Column(db.Date)
+    valid_to = db.Column(db.Date)
+    priority = db.Column(db.Integer, default=0)  # Menor número = se aplica primero
+    status = db.Column(db.Boolean, default=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_by = db.Column(db.String(100), nullable=False)
+
+    items = db.relationship('PriceListItem', backref='price_list', cascade="all, delete-orphan")
+
+class PriceListItem(db.Model):
+    """Precio de un material a partir de una cantidad mínima (escalón)"""
+    __tablename__ = 'price_list_item'
+    __table_args__ = (
+        db.UniqueConstraint('price_list_id', 'id_material', 'min_quantity', name='uq_price_list_item_break'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    price_list_id = db.Column(db.Integer, db.ForeignKey('price_list.id'), nullable=False)
+    id_material = db.Column(db.String(50), db.ForeignKey('material.id_material', onupdate='CASCADE'), nullable=False)
+    min_quantity = db.Column(db.Integer, nullable=False, default=1)
+    price = db.Column(Money, nullable=False)
+
+class DiscountRule(db.Model):
+    """Descuento porcentual por categoría de cliente y/o material desde una cantidad"""
+    __tablename__ = 'discount_rule'
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(200), nullable=False)
+    category = db.Column(db.String(100))  # vacío = todas las categorías
+    # vacío = todos los materiales
+    id_material = db.Column(db.String(50), db.ForeignKey('material.id_material', onupdate='CASCADE'))
+    min_quantity = db.Column(db.Integer, nullable=False, default=1)
+    percent = db.Column(db.Numeric(5, 2), nullable=False)
+    valid_from = db.Column(db.Date)
+    valid_to = db.Column(db.Date)
+    status = db.Column(db.Boolean, default=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_by = db.Column(db.String(100), nullable=False)
+
+class SalesDailySummary(db.Model):
+    """Ventas despachadas agregadas por día, cliente, material y moneda"""
+    __tablename__ = 'sales_daily_summary'
+    __table_args__ = (
+        db.UniqueConstraint('day', 'id_customer', 'id_material', 'currency', name='uq_sales_daily_summary_key'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False, index=True)
+    id_customer = db.Column(db.String(50), nullable=False)
+    id_material = db.Column(db.String(50), nullable=False)
+    currency = db.Column(db.String(10), nullable=False)
+    quantity = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(Money, nullable=False, default=0)
+    line_count = db.Column(db.Integer, nullable=False, default=0)
+
+#------------------------------- Claves de idempotencia ---------------------------------------------
+class IdempotencyKey(db.Model):
+    """Resultado guardado de una solicitud POST para responder igual a los reintentos"""
+    __tablename__ = 'idempotency_key'
+    __table_args__ = (
+        db.UniqueConstraint('key', 'user_id', 'endpoint', name='uq_idempotency_key_scope'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.String(100), nullable=False)
+    user_id = db.Column(db.Integer, nullable=False)
+    endpoint = db.Column(db.String(100), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='en proceso')  # en proceso, completado
+    response_status = db.Column(db.Integer)
+    response_location = db.Column(db.String(500))
+    response_body = db.Column(db.Text)
+    response_mimetype = db.Column(db.String(100))
+    flashes = db.Column(db.Text)  # Mensajes flash emitidos, en JSON
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+#------------------------------- Secuencias de documentos ---------------------------------------------
+class DocumentSequence(db.Model):
+    """Contador de folios por tipo de documento (venta, compra, asiento)"""
+    __tablename__ = 'document_sequence'
+    code = db.Column(db.String(20), primary_key=True)
+    next_value = db.Column(db.Integer, nullable=False, default=1) # Primer número aún no reservado
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+#------------------------------- Versión de datos de referencia ---------------------------------------------
+class ReferenceVersion(db.Model):
+    """Contador que se incrementa al modificar tablas de referencia (unidades, países, bodegas...)"""
+    __tablename__ = 'reference_version'
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
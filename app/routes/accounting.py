@@ -1,12 +1,22 @@
 # app/routes/accounting.py
-from flask import Blueprint, render_template, request, flash, redirect, url_for, jsonify, send_file
+from flask import Blueprint, render_template, request, flash, redirect, url_for, jsonify, send_file, current_app
 from flask_login import login_required, current_user
 from app import db
-from app.models import AccountType, AccountGroup, AccountNature, AccountAccount, Currency, Country, JournalEntry, JournalItem
+from app.models import AccountType, AccountGroup, AccountNature, AccountAccount, Currency, JournalEntry, JournalItem, ExchangeRate, to_cents
 from app.utils.auth import permission_required
+from app.utils.reference import bump_version, reference_cache
+from app.utils.idempotency import idempotent
+from app.utils.cache import account_cache
+from app.utils import statements
+from app.utils.account_tree import update_account_path, descendants, has_descendants, subtree_balance
+from app.utils.currency import (
+    RATES_VERSION, set_amount_currency, backfill_amount_currency, compute_revaluation, post_revaluation
+)
+from app.utils.sequences import next_number
 import csv
 import io
 from datetime import datetime
+from decimal import Decimal
 from sqlalchemy import func
 
 bp = Blueprint('accounting', __name__)
@@ -71,7 +81,7 @@ def account_type_delete(type_id):
     
     try:
         # Verificar si hay cuentas usando este tipo
-        accounts = AccountAccount.query.filter_by(account_type=type_id).first()
+        accounts = AccountAccount.query.filter_by(account_type_id=account_type.id).first()
         if accounts:
             flash('No se puede eliminar el tipo de cuenta porque está siendo usado en una o más cuentas.', 'error')
         else:
@@ -146,7 +156,7 @@ def account_group_delete(group_id):
     
     try:
         # Verificar si hay cuentas usando este grupo
-        accounts = AccountAccount.query.filter_by(account_group=group_id).first()
+        accounts = AccountAccount.query.filter_by(account_group_id=account_group.id).first()
         if accounts:
             flash('No se puede eliminar el grupo de cuenta porque está siendo usado en una o más cuentas.', 'error')
         else:
@@ -221,7 +231,7 @@ def account_nature_delete(nature_id):
     
     try:
         # Verificar si hay cuentas usando esta naturaleza
-        accounts = AccountAccount.query.filter_by(nature=nature_id).first()
+        accounts = AccountAccount.query.filter_by(nature_id=account_nature.id).first()
         if accounts:
             flash('No se puede eliminar la naturaleza de cuenta porque está siendo usada en una o más cuentas.', 'error')
         else:
@@ -250,9 +260,9 @@ def account_list():
 
     accounts_with_balance = []
     for account, total_debit, total_credit in results:
-        # Convertimos explícitamente a float para evitar el choque de tipos
-        debe = float(total_debit) if total_debit is not None else 0.0
-        haber = float(total_credit) if total_credit is not None else 0.0
+        # Las sumas se hacen en centavos enteros y llegan como Decimal exacto
+        debe = total_debit if total_debit is not None else Decimal('0')
+        haber = total_credit if total_credit is not None else Decimal('0')
         
         account.balance = debe - haber 
         accounts_with_balance.append(account)
@@ -279,6 +289,7 @@ def account_create():
                 status=bool(request.form.get('status', False)),
                 created_by=current_user.username
             )
+            update_account_path(account)
             db.session.add(account)
             db.session.commit()
             flash('Cuenta contable creada exitosamente', 'success')
@@ -291,8 +302,8 @@ def account_create():
     account_types = AccountType.query.all()
     account_groups = AccountGroup.query.all()
     account_natures = AccountNature.query.all()
-    currencies = Currency.query.all()
-    countries = Country.query.all()
+    currencies = reference_cache.get().currencies
+    countries = reference_cache.get().countries
     parent_accounts = AccountAccount.query.filter_by(status=True).all()
     
     return render_template('accounting/accounts/create.html',
@@ -321,6 +332,8 @@ def account_edit(account_id):
             account.country_id = request.form['country_id']
             account.parent_account = request.form.get('parent_account', '')
             account.status = bool(request.form.get('status', False))
+            # Si cambió el padre se reescribe la ruta de todo el subárbol
+            update_account_path(account)
             
             db.session.commit()
             flash('Cuenta contable actualizada exitosamente', 'success')
@@ -333,8 +346,8 @@ def account_edit(account_id):
     account_types = AccountType.query.all()
     account_groups = AccountGroup.query.all()
     account_natures = AccountNature.query.all()
-    currencies = Currency.query.all()
-    countries = Country.query.all()
+    currencies = reference_cache.get().currencies
+    countries = reference_cache.get().countries
     parent_accounts = AccountAccount.query.filter(AccountAccount.id_account != account_id).filter_by(status=True).all()
     
     return render_template('accounting/accounts/edit.html',
@@ -354,8 +367,7 @@ def account_delete(account_id):
     
     try:
         # Verificar si hay cuentas hijas
-        child_accounts = AccountAccount.query.filter_by(parent_account=account_id).first()
-        if child_accounts:
+        if has_descendants(account):
             flash('No se puede eliminar la cuenta porque tiene cuentas hijas asignadas.', 'error')
         else:
             # En un sistema real, también deberíamos verificar si hay transacciones asociadas
@@ -418,19 +430,56 @@ def export_accounts_csv():
     )
 
 # API para obtener cuentas en formato JSON (útil para select2 o similar)
+# Parámetros opcionales: q (prefijo de código o nombre) y limit
 @bp.route('/api/accounting/accounts')
 @login_required
 def get_accounts_json():
-    accounts = AccountAccount.query.filter_by(status=True).order_by(AccountAccount.code).all()
-    account_list = [{'id': acc.id_account, 'text': f"{acc.code} - {acc.name}"} for acc in accounts]
-    return jsonify(account_list)
+    snapshot = account_cache.get()
+    prefix = request.args.get('q', '').strip()
+    limit = request.args.get('limit', type=int)
+
+    # El contenido solo depende del snapshot y de los parámetros de la URL
+    if request.if_none_match.contains(snapshot.etag):
+        response = current_app.response_class(status=304)
+        response.set_etag(snapshot.etag)
+        return response
+
+    if prefix:
+        accounts = snapshot.search(prefix, limit=limit or 50)
+    else:
+        accounts = snapshot.accounts[:limit] if limit else snapshot.accounts
+
+    response = jsonify([{'id': acc.id_account, 'text': acc.text} for acc in accounts])
+    response.set_etag(snapshot.etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+# Subcuentas a cualquier profundidad y saldo consolidado del subárbol
+@bp.route('/api/accounting/accounts/<string:account_id>/subtree')
+@login_required
+@permission_required('accounting', 1)
+def get_account_subtree(account_id):
+    account = AccountAccount.query.filter_by(id_account=account_id).first_or_404()
+    total_debit, total_credit, balance = subtree_balance(account)
+
+    return jsonify({
+        'id': account.id_account,
+        'text': f"{account.code} - {account.name}",
+        'descendants': [
+            {'id': acc.id_account, 'text': f"{acc.code} - {acc.name}", 'parent': acc.parent_account or ''}
+            for acc in descendants(account)
+        ],
+        'total_debit': str(total_debit),
+        'total_credit': str(total_credit),
+        'balance': str(balance)
+    })
 
 @bp.route('/accounting/journal/create', methods=['GET', 'POST'])
 @login_required
 @permission_required('accounting', 2)
+@idempotent
 def journal_entry_create():
-    accounts = AccountAccount.query.filter_by(status=True).order_by(AccountAccount.code).all()
-    
     if request.method == 'POST':
         try:
             # 1. Obtener datos del formulario
@@ -442,16 +491,17 @@ def journal_entry_create():
             debits = request.form.getlist('debit[]')
             credits = request.form.getlist('credit[]')
             
-            # 2. Validación de Partida Doble (Cuadre)
-            total_debit = sum(float(d) for d in debits if d)
-            total_credit = sum(float(c) for c in credits if c)
+            # 2. Validación de Partida Doble (Cuadre) en centavos exactos
+            total_debit = sum(to_cents(d) for d in debits if d)
+            total_credit = sum(to_cents(c) for c in credits if c)
             
-            if abs(total_debit - total_credit) > 0.001:
+            if total_debit != total_credit:
                 flash('Error: El asiento no está cuadrado (Debe != Haber).', 'error')
                 return redirect(url_for('accounting.journal_entry_create'))
 
             # 3. Guardar el asiento
             entry = JournalEntry(
+                number=next_number('journal'),
                 date=date,
                 description=description,
                 created_by=current_user.username
@@ -459,9 +509,10 @@ def journal_entry_create():
             db.session.add(entry)
             db.session.flush() # Para obtener el ID de entry antes del commit
 
+            items = []
             for i in range(len(acc_ids)):
-                val_debit = float(debits[i] or 0)
-                val_credit = float(credits[i] or 0)
+                val_debit = Decimal(debits[i] or 0)
+                val_credit = Decimal(credits[i] or 0)
                 
                 if val_debit > 0 or val_credit > 0:
                     item = JournalItem(
@@ -470,8 +521,11 @@ def journal_entry_create():
                         debit=val_debit,
                         credit=val_credit
                     )
-                    db.session.add(item)
+                    items.append(item)
             
+            # Cuentas en moneda extranjera guardan también el importe en su moneda
+            set_amount_currency(items, date)
+            db.session.add_all(items)
             db.session.commit()
             flash('Asiento contable registrado exitosamente', 'success')
             return redirect(url_for('accounting.account_list'))
@@ -480,4 +534,264 @@ def journal_entry_create():
             db.session.rollback()
             flash(f'Error al registrar asiento: {str(e)}', 'error')
 
-    return render_template('accounting/journal/create.html', accounts=accounts)
\ No newline at end of file
+    # Las cuentas se buscan con el autocompletado (/api/accounting/accounts)
+    return render_template('accounting/journal/create.html')
+
+# ================================
+# Estados Financieros
+# ================================
+
+def _parse_date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        return None
+
+@bp.route('/accounting/reports/balance_sheet')
+@login_required
+@permission_required('reporting', 1)
+def balance_sheet():
+    date_to = _parse_date(request.args.get('date_to')) or datetime.now().date()
+    compare_to = _parse_date(request.args.get('compare_to')) or statements.previous_year(date_to)
+
+    statement_html = statements.statement_cache.get_or_render(
+        ('balance_sheet', date_to, compare_to),
+        [(None, date_to), (None, compare_to)],
+        lambda: render_template('accounting/reports/_statement.html',
+                                statement=statements.balance_sheet(date_to, compare_to))
+    )
+    return render_template('accounting/reports/balance_sheet.html',
+                         statement_html=statement_html,
+                         date_to=date_to,
+                         compare_to=compare_to)
+
+@bp.route('/accounting/reports/income_statement')
+@login_required
+@permission_required('reporting', 1)
+def income_statement():
+    today = datetime.now().date()
+    date_from = _parse_date(request.args.get('date_from')) or today.replace(month=1, day=1)
+    date_to = _parse_date(request.args.get('date_to')) or today
+    compare_from = _parse_date(request.args.get('compare_from')) or statements.previous_year(date_from)
+    compare_to = _parse_date(request.args.get('compare_to')) or statements.previous_year(date_to)
+
+    statement_html = statements.statement_cache.get_or_render(
+        ('income_statement', date_from, date_to, compare_from, compare_to),
+        [(date_from, date_to), (compare_from, compare_to)],
+        lambda: render_template('accounting/reports/_statement.html',
+                                statement=statements.income_statement(date_from, date_to, compare_from, compare_to))
+    )
+    return render_template('accounting/reports/income_statement.html',
+                         statement_html=statement_html,
+                         date_from=date_from,
+                         date_to=date_to,
+                         compare_from=compare_from,
+                         compare_to=compare_to)
+
+
+# ================================
+# Tipos de Cambio y Revaluación
+# ================================
+
+@bp.route('/accounting/rates')
+@login_required
+@permission_required('accounting', 1)
+def exchange_rate_list():
+    currency_filter = request.args.get('currency', '')
+
+    query = ExchangeRate.query
+    if currency_filter:
+        query = query.filter(ExchangeRate.currency == currency_filter)
+
+    rates = query.order_by(ExchangeRate.date.desc(), ExchangeRate.currency).limit(500).all()
+    currencies = reference_cache.get().currencies
+
+    return render_template('accounting/rates/list.html',
+                         rates=rates,
+                         currencies=currencies,
+                         functional_currency=current_app.config['FUNCTIONAL_CURRENCY'],
+                         filters=request.args)
+
+@bp.route('/accounting/rates/<int:rate_id>/delete', methods=['POST'])
+@login_required
+@permission_required('accounting', 2)
+def exchange_rate_delete(rate_id):
+    rate = ExchangeRate.query.get_or_404(rate_id)
+
+    try:
+        db.session.delete(rate)
+        db.session.commit()
+        flash('Tipo de cambio eliminado exitosamente', 'success')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Error al eliminar tipo de cambio: {str(e)}', 'error')
+
+    return redirect(url_for('accounting.exchange_rate_list'))
+
+@bp.route('/accounting/rates/bulk_upload')
+@login_required
+@permission_required('accounting', 2)
+def exchange_rate_bulk_upload():
+    return render_template('accounting/rates/bulk_upload.html',
+                         functional_currency=current_app.config['FUNCTIONAL_CURRENCY'])
+
+@bp.route('/accounting/rates/download_template')
+@login_required
+@permission_required('accounting', 2)
+def exchange_rate_download_template():
+    output = io.StringIO()
+    writer = csv.writer(output,
+                       delimiter=',',
+                       quotechar='"',
+                       quoting=csv.QUOTE_ALL,
+                       lineterminator='\n')
+
+    writer.writerow(['Moneda', 'Fecha', 'Tipo_Cambio'])
+    writer.writerow(['USD', '2024-01-15', '17.123456'])
+    writer.writerow(['EUR', '2024-01-15', '18.654321'])
+
+    output.seek(0)
+
+    return send_file(
+        io.BytesIO(output.getvalue().encode('utf-8-sig')),
+        mimetype='text/csv; charset=utf-8-sig',
+        as_attachment=True,
+        download_name='plantilla_tipos_cambio.csv'
+    )
+
+@bp.route('/accounting/rates/process_bulk_upload', methods=['POST'])
+@login_required
+@permission_required('accounting', 2)
+def exchange_rate_process_bulk_upload():
+    if 'csv_file' not in request.files or request.files['csv_file'].filename == '':
+        flash('No se seleccionó ningún archivo', 'error')
+        return redirect(url_for('accounting.exchange_rate_bulk_upload'))
+
+    file = request.files['csv_file']
+    if not file.filename.endswith('.csv'):
+        flash('El archivo debe ser un CSV', 'error')
+        return redirect(url_for('accounting.exchange_rate_bulk_upload'))
+
+    try:
+        stream = io.StringIO(file.stream.read().decode("utf-8-sig"), newline=None)
+        csv_reader = csv.reader(stream)
+        next(csv_reader, None)
+
+        valid_currencies = {symbol for (symbol,) in db.session.query(Currency.symbol).all()}
+        functional = current_app.config['FUNCTIONAL_CURRENCY']
+
+        # Se conserva la última fila de cada (moneda, fecha)
+        parsed = {}
+        errors = []
+        for row_num, row in enumerate(csv_reader, start=2):
+            if len(row) < 3:
+                errors.append(f"Fila {row_num}: No tiene suficientes columnas")
+                continue
+
+            currency, date_str, rate_str = (value.strip() for value in row[:3])
+            if currency not in valid_currencies:
+                errors.append(f"Fila {row_num}: Moneda '{currency}' no existe")
+                continue
+            if currency == functional:
+                errors.append(f"Fila {row_num}: {currency} es la moneda funcional")
+                continue
+            try:
+                rate_date = datetime.strptime(date_str, '%Y-%m-%d').date()
+                rate = Decimal(rate_str)
+            except Exception:
+                errors.append(f"Fila {row_num}: Fecha o tipo de cambio inválido")
+                continue
+            if rate <= 0:
+                errors.append(f"Fila {row_num}: El tipo de cambio debe ser positivo")
+                continue
+            parsed[(currency, rate_date)] = rate
+
+        # Tipos existentes de las monedas del archivo en una sola consulta
+        existing = {}
+        if parsed:
+            file_currencies = {currency for currency, _ in parsed}
+            existing = {
+                (currency, rate_date): rate_id
+                for rate_id, currency, rate_date in db.session.query(
+                    ExchangeRate.id, ExchangeRate.currency, ExchangeRate.date
+                ).filter(ExchangeRate.currency.in_(file_currencies)).all()
+            }
+
+        inserts = []
+        updates = []
+        for (currency, rate_date), rate in parsed.items():
+            rate_id = existing.get((currency, rate_date))
+            if rate_id:
+                updates.append({'id': rate_id, 'rate': rate})
+            else:
+                inserts.append({
+                    'currency': currency,
+                    'date': rate_date,
+                    'rate': rate,
+                    'created_at': datetime.utcnow(),
+                    'created_by': current_user.username
+                })
+
+        db.session.bulk_insert_mappings(ExchangeRate, inserts)
+        db.session.bulk_update_mappings(ExchangeRate, updates)
+        bump_version(RATES_VERSION)
+        db.session.commit()
+
+        if inserts or updates:
+            flash(f'Carga masiva completada: {len(inserts)} tipos de cambio creados, {len(updates)} actualizados', 'success')
+            # Con los tipos nuevos se completan las líneas anteriores que no tenían importe en moneda extranjera
+            filled = backfill_amount_currency()
+            db.session.commit()
+            if filled:
+                flash(f'{filled} líneas de asiento completadas con su importe en moneda extranjera', 'info')
+
+        if errors:
+            error_msg = f'Se encontraron {len(errors)} errores durante la carga:'
+            for error in errors[:10]:
+                error_msg += f'<br>- {error}'
+            if len(errors) > 10:
+                error_msg += f'<br>... y {len(errors) - 10} errores más'
+            flash(error_msg, 'warning')
+
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Error procesando el archivo: {str(e)}', 'error')
+
+    return redirect(url_for('accounting.exchange_rate_list'))
+
+@bp.route('/accounting/revaluation', methods=['GET', 'POST'])
+@login_required
+@permission_required('accounting', 2)
+def revaluation():
+    on_date = _parse_date(request.values.get('date')) or datetime.now().date()
+
+    if request.method == 'POST':
+        gain_account = request.form.get('gain_account')
+        loss_account = request.form.get('loss_account')
+        if not gain_account or not loss_account:
+            flash('Debe seleccionar las cuentas de utilidad y pérdida cambiaria', 'error')
+            return redirect(url_for('accounting.revaluation', date=on_date.strftime('%Y-%m-%d')))
+
+        try:
+            entry, adjustments, missing = post_revaluation(on_date, gain_account, loss_account, current_user.username)
+            db.session.commit()
+            if entry:
+                flash(f'Revaluación registrada: {len(adjustments)} cuentas ajustadas', 'success')
+            else:
+                flash('No hay diferencias de cambio por registrar', 'info')
+            if missing:
+                flash(f'Sin tipo de cambio al {on_date}: {", ".join(missing)}', 'warning')
+        except Exception as e:
+            db.session.rollback()
+            flash(f'Error al registrar revaluación: {str(e)}', 'error')
+
+        return redirect(url_for('accounting.revaluation', date=on_date.strftime('%Y-%m-%d')))
+
+    adjustments, missing, incomplete = compute_revaluation(on_date)
+    return render_template('accounting/rates/revaluation.html',
+                         on_date=on_date,
+                         adjustments=adjustments,
+                         missing=missing,
+                         incomplete=incomplete,
+                         accounts=account_cache.get().accounts,
+                         functional_currency=current_app.config['FUNCTIONAL_CURRENCY'])
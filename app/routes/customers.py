@@ -1,45 +1,60 @@
 from flask import Blueprint, render_template, request, flash, redirect, url_for, jsonify, send_file
 from flask_login import login_required, current_user
 from app import db
-from app.models import Customer, Country, Currency
+from app.models import Customer, CustomerPayment
 from app.utils.auth import permission_required
+from app.utils.reference import reference_cache
+from app.utils.search import apply_search
+from app.utils.bulk_import import import_customers
+from app.utils.autocomplete import autocomplete
+from app.utils.projections import project, stream
+from app.utils.grid import grid_json, grid_page
+from app.utils.archive import ARCHIVE_AFTER_DAYS, active, archive_inactive
+from app.utils.dedup import MIN_SCORE, find_duplicates, merge
+from app.utils.cache import account_cache
+from app.utils.idempotency import idempotent
+from app.utils.receivables import post_payment
 import csv
 import io
 from datetime import datetime
+from decimal import Decimal, InvalidOperation
 
 bp = Blueprint('customers', __name__)
 
+def _parse_credit_limit(value):
+    """Límite de crédito del formulario; vacío = sin límite"""
+    value = (value or '').strip()
+    if not value:
+        return None
+    try:
+        limit = Decimal(value)
+    except InvalidOperation:
+        raise ValueError(f"Límite de crédito inválido: {value}")
+    if limit < 0:
+        raise ValueError("El límite de crédito no puede ser negativo")
+    return limit
+
 @bp.route('/customers')
 @login_required
 @permission_required('customers', 1)
 def customer_list():
-    # Obtener parámetros de filtro
-    id_customer_filter = request.args.get('id_customer', '')
-    name_filter = request.args.get('name', '')
-    country_filter = request.args.get('country', '')
-    status_filter = request.args.get('status', '')
-    
-    # Construir consulta base
-    query = Customer.query
-    
-    # Aplicar filtros
-    if id_customer_filter:
-        query = query.filter(Customer.id_customer.contains(id_customer_filter))
-    if name_filter:
-        query = query.filter(Customer.name.contains(name_filter))
-    if country_filter:
-        query = query.filter(Customer.country == country_filter)
-    if status_filter:
-        status_bool = status_filter == 'true'
-        query = query.filter(Customer.status == status_bool)
-    
-    customers = query.order_by(Customer.created_at.desc()).all()
-    countries = Country.query.all()
+    # Una página por keyset con el orden y los filtros de la grilla (app/utils/grid.py)
+    try:
+        page = grid_page('customer', {**request.args.to_dict(), 'facets': '0'})
+    except ValueError as e:
+        flash(str(e), 'error')
+        return redirect(url_for('customers.customer_list'))
+    countries = reference_cache.get().countries
     
+    # Argumentos de filtro y orden para los enlaces de paginación (sin el cursor)
+    page_args = {k: v for k, v in request.args.items() if k not in ('after', 'before') and v}
     return render_template('customers/list.html', 
-                         customers=customers, 
+                         customers=page.rows, 
                          countries=countries,
-                         filters=request.args)
+                         filters=request.args,
+                         page_args=page_args,
+                         prev_cursor=page.prev_cursor,
+                         next_cursor=page.next_cursor)
 
 @bp.route('/customers/create', methods=['GET', 'POST'])
 @login_required
@@ -66,6 +81,7 @@ def customer_create():
                 payments_terms=request.form.get('payments_terms', ''),
                 payment_method=request.form.get('payment_method', ''),
                 bank_account=request.form.get('bank_account', ''),
+                credit_limit=_parse_credit_limit(request.form.get('credit_limit')),
                 status=request.form.get('status') == 'on',
                 created_by=current_user.username
             )
@@ -79,8 +95,8 @@ def customer_create():
             db.session.rollback()
             flash(f'Error al crear cliente: {str(e)}', 'error')
     
-    countries = Country.query.all()
-    currencies = Currency.query.all()
+    countries = reference_cache.get().countries
+    currencies = reference_cache.get().currencies
     return render_template('customers/create.html', 
                          countries=countries, 
                          currencies=currencies)
@@ -111,7 +127,10 @@ def customer_edit(customer_id):
             customer.payments_terms = request.form.get('payments_terms', '')
             customer.payment_method = request.form.get('payment_method', '')
             customer.bank_account = request.form.get('bank_account', '')
+            customer.credit_limit = _parse_credit_limit(request.form.get('credit_limit'))
             customer.status = request.form.get('status') == 'on'
+            if customer.status:
+                customer.archived_at = None  # Al activarlo deja de estar archivado
             customer.updated_at = datetime.utcnow()
             
             db.session.commit()
@@ -122,8 +141,8 @@ def customer_edit(customer_id):
             db.session.rollback()
             flash(f'Error al actualizar cliente: {str(e)}', 'error')
     
-    countries = Country.query.all()
-    currencies = Currency.query.all()
+    countries = reference_cache.get().countries
+    currencies = reference_cache.get().currencies
     return render_template('customers/edit.html', 
                          customer=customer, 
                          countries=countries, 
@@ -145,6 +164,73 @@ def customer_delete(customer_id):
     
     return redirect(url_for('customers.customer_list'))
 
+@bp.route('/customers/<int:customer_id>/payment', methods=['GET', 'POST'])
+@login_required
+@permission_required('customers', 2)
+@idempotent
+def customer_payment(customer_id):
+    customer = Customer.query.get_or_404(customer_id)
+
+    if request.method == 'POST':
+        try:
+            amount = Decimal(request.form.get('amount') or '0')
+            payment_date = request.form.get('date')
+            post_payment(
+                customer.id_customer,
+                amount,
+                request.form.get('acc_debit'),
+                request.form.get('acc_credit'),
+                current_user.username,
+                reference=request.form.get('reference') or None,
+                payment_date=datetime.strptime(payment_date, '%Y-%m-%d') if payment_date else None
+            )
+            db.session.commit()
+            flash(f'Cobro de ${amount} registrado para {customer.name}', 'success')
+            return redirect(url_for('customers.customer_payment', customer_id=customer.id))
+        except (ValueError, InvalidOperation) as e:
+            db.session.rollback()
+            flash(f'Error al registrar cobro: {str(e)}', 'error')
+        except Exception as e:
+            db.session.rollback()
+            flash(f'Error inesperado: {str(e)}', 'error')
+
+    payments = CustomerPayment.query.filter_by(id_customer=customer.id_customer).order_by(
+        CustomerPayment.date.desc(), CustomerPayment.id.desc()).limit(20).all()
+    return render_template('customers/payment.html',
+                         customer=customer,
+                         payments=payments,
+                         accounts=account_cache.get().accounts)
+
+# Posibles duplicados (mismo RFC o nombre parecido) y unión en un solo registro
+@bp.route('/customers/duplicates')
+@login_required
+@permission_required('customers', 1)
+def customer_duplicates():
+    min_score = request.args.get('min_score', MIN_SCORE, type=float)
+    candidates = find_duplicates('customer', min_score=min_score, limit=500)
+    return render_template('customers/duplicates.html', candidates=candidates, min_score=min_score)
+
+@bp.route('/customers/duplicates/merge', methods=['POST'])
+@login_required
+@permission_required('customers', 2)
+@idempotent
+def customer_merge():
+    keep = request.form.get('keep', '')
+    duplicates = request.form.getlist('merge')
+    try:
+        counts = merge('customer', keep, duplicates)
+        db.session.commit()
+        detail = ', '.join(f'{count} {table}' for table, count in counts.items())
+        flash(f'Se unieron {len(duplicates)} clientes en {keep}. Registros reasignados: {detail}', 'success')
+    except ValueError as e:
+        db.session.rollback()
+        flash(f'Error al unir clientes: {str(e)}', 'error')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Error inesperado: {str(e)}', 'error')
+    
+    return redirect(url_for('customers.customer_duplicates', min_score=request.form.get('min_score') or None))
+
 @bp.route('/customers/export_csv')
 @login_required
 @permission_required('customers', 1)
@@ -156,19 +242,18 @@ def export_csv():
     status_filter = request.args.get('status', '')
     
     # Construir consulta base
-    query = Customer.query
+    query = active(Customer.query, Customer, request.args.get('archived') == '1')
     
-    if id_customer_filter:
-        query = query.filter(Customer.id_customer.contains(id_customer_filter))
-    if name_filter:
-        query = query.filter(Customer.name.contains(name_filter))
+    query = apply_search(query, 'customer', request.args.get('q'))
+    query = apply_search(query, 'customer', id_customer_filter, ['id_customer'])
+    query = apply_search(query, 'customer', name_filter, ['name'])
     if country_filter:
         query = query.filter(Customer.country == country_filter)
     if status_filter:
         status_bool = status_filter == 'true'
         query = query.filter(Customer.status == status_bool)
     
-    customers = query.order_by(Customer.created_at.desc()).all()
+    customers = stream(project(query, 'customer', 'export').order_by(Customer.created_at.desc()))
     
     # Crear CSV en memoria con encoding para Excel
     output = io.StringIO()
@@ -328,124 +413,61 @@ def process_bulk_upload():
         return redirect(url_for('customers.bulk_upload'))
     
     try:
-        # Leer el archivo CSV
-        stream = io.StringIO(file.stream.read().decode("UTF8"), newline=None)
-        csv_reader = csv.reader(stream)
-        
-        # Saltar el encabezado
-        header = next(csv_reader, None)
-        
-        customers_created = 0
-        customers_updated = 0
-        errors = []
-        
-        for row_num, row in enumerate(csv_reader, start=2):
-            if len(row) < 19:
-                errors.append(f"Fila {row_num}: No tiene suficientes columnas")
-                continue
-            
-            try:
-                # Mapear campos del CSV
-                (id_customer, legal_name, name, country, currency, 
-                 text_id, state_province, city, address, zip_code, 
-                 phone, email, contact_name, contact_role, category, 
-                 payments_terms, payment_method, bank_account, status_str) = row[:19]
-                
-                # Validar campos obligatorios
-                if not id_customer or not legal_name or not name or not country or not currency:
-                    errors.append(f"Fila {row_num}: Campos obligatorios faltantes")
-                    continue
-                
-                # Validar que el país exista (por nombre)
-                if not Country.query.filter_by(name=country).first():
-                    errors.append(f"Fila {row_num}: País '{country}' no existe")
-                    continue
-                
-                # Buscar moneda por símbolo
-                currency_obj = Currency.query.filter_by(symbol=currency).first()
-                if not currency_obj:
-                    errors.append(f"Fila {row_num}: Moneda '{currency}' no existe. Use símbolos como MXN, USD, EUR")
-                    continue
-                
-                # Validar estado
-                status = status_str.strip() == '1' if status_str else True
-                
-                # Verificar si el cliente ya existe
-                existing_customer = Customer.query.filter_by(id_customer=id_customer).first()
-                
-                if existing_customer:
-                    # Actualizar cliente existente
-                    existing_customer.legal_name = legal_name
-                    existing_customer.name = name
-                    existing_customer.country = country
-                    existing_customer.currency = currency_obj.name  # Guardar nombre de la moneda
-                    existing_customer.text_id = text_id
-                    existing_customer.state_province = state_province
-                    existing_customer.city = city
-                    existing_customer.address = address
-                    existing_customer.zip_code = zip_code
-                    existing_customer.phone = phone
-                    existing_customer.email = email
-                    existing_customer.contact_name = contact_name
-                    existing_customer.contact_role = contact_role
-                    existing_customer.category = category
-                    existing_customer.payments_terms = payments_terms
-                    existing_customer.payment_method = payment_method
-                    existing_customer.bank_account = bank_account
-                    existing_customer.status = status
-                    existing_customer.updated_at = datetime.utcnow()
-                    customers_updated += 1
-                else:
-                    # Crear nuevo cliente
-                    customer = Customer(
-                        id_customer=id_customer,
-                        legal_name=legal_name,
-                        name=name,
-                        country=country,
-                        currency=currency_obj.name,  # Guardar nombre de la moneda
-                        text_id=text_id,
-                        state_province=state_province,
-                        city=city,
-                        address=address,
-                        zip_code=zip_code,
-                        phone=phone,
-                        email=email,
-                        contact_name=contact_name,
-                        contact_role=contact_role,
-                        category=category,
-                        payments_terms=payments_terms,
-                        payment_method=payment_method,
-                        bank_account=bank_account,
-                        status=status,
-                        created_by=current_user.username
-                    )
-                    db.session.add(customer)
-                    customers_created += 1
-                    
-            except Exception as e:
-                errors.append(f"Fila {row_num}: Error procesando - {str(e)}")
-                continue
-        
-        # Confirmar cambios en la base de datos
+        # Leer el archivo CSV por líneas (sin cargarlo completo en memoria)
+        stream = io.TextIOWrapper(file.stream, encoding='utf-8-sig', newline='')
+        result = import_customers(stream, current_user.username)
         db.session.commit()
         
         # Mostrar resultados
-        if customers_created > 0 or customers_updated > 0:
-            flash(f'Carga masiva completada: {customers_created} clientes creados, {customers_updated} actualizados', 'success')
+        if result.created > 0 or result.updated > 0:
+            flash(f'Carga masiva completada: {result.created} clientes creados, {result.updated} actualizados '
+                  f'en {result.seconds:.1f} s ({result.rate:,.0f} filas/s)', 'success')
         
-        if errors:
-            error_msg = f'Se encontraron {len(errors)} errores durante la carga:'
-            for error in errors[:10]:
+        if result.error_count:
+            error_msg = f'Se encontraron {result.error_count} errores durante la carga:'
+            for error in result.errors:
                 error_msg += f'<br>- {error}'
-            if len(errors) > 10:
-                error_msg += f'<br>... y {len(errors) - 10} errores más'
+            if result.error_count > len(result.errors):
+                error_msg += f'<br>... y {result.error_count - len(result.errors)} errores más'
             flash(error_msg, 'warning')
         
-        if not customers_created and not customers_updated and not errors:
+        if not result.created and not result.updated and not result.error_count:
             flash('No se procesó ningún cliente. Verifique el formato del archivo.', 'info')
             
     except Exception as e:
         db.session.rollback()
         flash(f'Error procesando el archivo: {str(e)}', 'error')
     
-    return redirect(url_for('customers.customer_list'))
\ No newline at end of file
+    return redirect(url_for('customers.customer_list'))
+
+# Opciones para el autocompletado de formularios
+# Parámetros opcionales: q (prefijo de código o nombre) y limit
+@bp.route('/api/customers/autocomplete')
+@login_required
+def customer_autocomplete():
+    return jsonify(autocomplete('customer', request.args.get('q', ''), request.args.get('limit', type=int)))
+
+# Grilla del listado en JSON. Parámetros: sort, dir, per_page, after/before,
+# filtros y búsquedas de GRIDS['customer'], archived=1 y facets=0 para no contar facetas
+@bp.route('/api/customers/grid')
+@login_required
+@permission_required('customers', 1)
+def customer_grid():
+    try:
+        return jsonify(grid_json('customer', request.args))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+# Archiva los clientes inactivos sin cambios en ARCHIVE_AFTER_DAYS días (también archive_inactive.py)
+@bp.route('/customers/archive', methods=['POST'])
+@login_required
+@permission_required('customers', 2)
+def customer_archive():
+    try:
+        count = archive_inactive('customer')
+        db.session.commit()
+        flash(f'Se archivaron {count} clientes inactivos por más de {ARCHIVE_AFTER_DAYS} días', 'success')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Error al archivar clientes: {str(e)}', 'error')
+    return redirect(url_for('customers.customer_list'))
@@ -2,8 +2,10 @@
 from flask import Blueprint, render_template, request, flash, redirect, url_for, jsonify,send_file
 from flask_login import login_required, current_user
 from app import db
-from app.models import Location, InventoryMovement, InventoryStock, Material, Unit
+from app.models import Location, InventoryMovement, InventoryStock, Material
 from app.utils.auth import permission_required
+from app.utils.reference import reference_cache
+from app.utils.autocomplete import autocomplete
 from datetime import datetime
 import csv
 import io
@@ -30,13 +32,14 @@ def inventory_list():
     
     stocks = query.order_by(InventoryStock.updated_at.desc()).all()
     
-    locations = Location.query.filter_by(status=True).all()
-    materials = Material.query.filter_by(status=True).order_by(Material.name).all()  # Ordenar por nombre
+    # Ubicaciones y materiales se buscan con el autocompletado; solo se leen los filtrados
+    selected_location = db.session.get(Location, int(location_filter)) if location_filter.isdigit() else None
+    selected_material = Material.query.filter_by(id_material=material_filter).first() if material_filter else None
     
     return render_template('inventory/list.html', 
                          stocks=stocks,
-                         locations=locations,
-                         materials=materials,
+                         selected_location=selected_location,
+                         selected_material=selected_material,
                          filters=request.args)
 
 @bp.route('/inventory/movements')
@@ -61,7 +64,7 @@ def movement_list():
     
     movements = query.order_by(InventoryMovement.created_at.desc()).all()
     
-    locations = Location.query.filter_by(status=True).all()
+    locations = reference_cache.get().active_locations
     materials = Material.query.filter_by(status=True).all()
     
     return render_template('inventory/movements.html', 
@@ -123,12 +126,8 @@ def movement_create():
             db.session.rollback()
             flash(f'Error al registrar movimiento: {str(e)}', 'error')
     
-    locations = Location.query.filter_by(status=True).all()
-    materials = Material.query.filter_by(status=True).all()
-    
-    return render_template('inventory/movement_create.html', 
-                         locations=locations,
-                         materials=materials)
+    # Ubicaciones y materiales se buscan con el autocompletado
+    return render_template('inventory/movement_create.html')
 
 @bp.route('/inventory/locations')
 @login_required
@@ -147,6 +146,7 @@ def location_create():
                 name=request.form['name'],
                 code=request.form['code'],
                 main_location=bool(request.form.get('main_location')),
+                priority=int(request.form.get('priority') or 0),
                 location=request.form.get('location', ''),
                 created_by=current_user.username
             )
@@ -173,6 +173,7 @@ def location_edit(location_id):
             location.name = request.form['name']
             location.code = request.form['code']
             location.main_location = bool(request.form.get('main_location'))
+            location.priority = int(request.form.get('priority') or 0)
             location.location = request.form.get('location', '')
             location.status = bool(request.form.get('status'))
             
@@ -544,4 +545,11 @@ def movement_delete(movement_id):
         db.session.rollback()
         flash(f'Error al eliminar movimiento: {str(e)}', 'error')
     
-    return redirect(url_for('inventory.movement_list'))     
\ No newline at end of file
+    return redirect(url_for('inventory.movement_list'))     
+
+# Opciones para el autocompletado de formularios
+# Parámetros opcionales: q (prefijo de código o nombre) y limit
+@bp.route('/api/inventory/locations/autocomplete')
+@login_required
+def location_autocomplete():
+    return jsonify(autocomplete('location', request.args.get('q', ''), request.args.get('limit', type=int)))
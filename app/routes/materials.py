@@ -1,8 +1,15 @@
 from flask import Blueprint, render_template, request, flash, redirect, url_for, jsonify, send_file
 from flask_login import login_required, current_user
 from app import db
-from app.models import Material, Unit, MaterialType
+from app.models import Material
 from app.utils.auth import permission_required
+from app.utils.reference import reference_cache
+from app.utils.search import apply_search
+from app.utils.bulk_import import import_materials
+from app.utils.autocomplete import autocomplete
+from app.utils.projections import project, stream
+from app.utils.grid import grid_json, grid_page
+from app.utils.archive import ARCHIVE_AFTER_DAYS, active, archive_inactive
 import csv
 import io
 from datetime import datetime
@@ -13,33 +20,23 @@ bp = Blueprint('materials', __name__)
 @login_required
 @permission_required('materials', 1)
 def material_list():
-    # Obtener parámetros de filtro
-    id_material_filter = request.args.get('id_material', '')
-    name_filter = request.args.get('name', '')
-    type_filter = request.args.get('type', '')
-    status_filter = request.args.get('status', '')
-    
-    # Construir consulta base
-    query = Material.query
-    
-    # Aplicar filtros
-    if id_material_filter:
-        query = query.filter(Material.id_material.contains(id_material_filter))
-    if name_filter:
-        query = query.filter(Material.name.contains(name_filter))
-    if type_filter:
-        query = query.filter(Material.type == type_filter)
-    if status_filter:
-        status_bool = status_filter == 'true'
-        query = query.filter(Material.status == status_bool)
-    
-    materials = query.order_by(Material.created_at.desc()).all()
-    material_types = MaterialType.query.all()
+    # Una página por keyset con el orden y los filtros de la grilla (app/utils/grid.py)
+    try:
+        page = grid_page('material', {**request.args.to_dict(), 'facets': '0'})
+    except ValueError as e:
+        flash(str(e), 'error')
+        return redirect(url_for('materials.material_list'))
+    material_types = reference_cache.get().material_types
     
+    # Argumentos de filtro y orden para los enlaces de paginación (sin el cursor)
+    page_args = {k: v for k, v in request.args.items() if k not in ('after', 'before') and v}
     return render_template('materials/list.html', 
-                         materials=materials, 
+                         materials=page.rows, 
                          material_types=material_types,
-                         filters=request.args)
+                         filters=request.args,
+                         page_args=page_args,
+                         prev_cursor=page.prev_cursor,
+                         next_cursor=page.next_cursor)
 
 @bp.route('/materials/create', methods=['GET', 'POST'])
 @login_required
@@ -66,8 +63,8 @@ def material_create():
             db.session.rollback()
             flash(f'Error al crear material: {str(e)}', 'error')
     
-    units = Unit.query.all()
-    material_types = MaterialType.query.all()
+    units = reference_cache.get().units
+    material_types = reference_cache.get().material_types
     return render_template('materials/create.html', units=units, material_types=material_types)
 
 @bp.route('/materials/<int:material_id>/edit', methods=['GET', 'POST'])
@@ -84,6 +81,8 @@ def material_edit(material_id):
             material.unit = request.form['unit']
             material.type = request.form['type']
             material.status = request.form.get('status') == 'on'
+            if material.status:
+                material.archived_at = None  # Al activarlo deja de estar archivado
             material.updated_at = datetime.utcnow()
             
             db.session.commit()
@@ -94,8 +93,8 @@ def material_edit(material_id):
             db.session.rollback()
             flash(f'Error al actualizar material: {str(e)}', 'error')
     
-    units = Unit.query.all()
-    material_types = MaterialType.query.all()
+    units = reference_cache.get().units
+    material_types = reference_cache.get().material_types
     return render_template('materials/edit.html', 
                          material=material, 
                          units=units, 
@@ -128,20 +127,18 @@ def export_csv():
     status_filter = request.args.get('status', '')
     
     # Construir consulta base (igual que en material_list)
-    query = Material.query
+    query = active(Material.query, Material, request.args.get('archived') == '1')
     
-    if id_material_filter:
-        query = query.filter(Material.id_material.contains(id_material_filter))
-    if name_filter:
-        query = query.filter(Material.name.contains(name_filter))
+    query = apply_search(query, 'material', request.args.get('q'))
+    query = apply_search(query, 'material', id_material_filter, ['id_material'])
+    query = apply_search(query, 'material', name_filter, ['name'])
     if type_filter:
         query = query.filter(Material.type == type_filter)
     if status_filter:
         status_bool = status_filter == 'true'
         query = query.filter(Material.status == status_bool)
     
-    
-    materials = query.order_by(Material.created_at.desc()).all()
+    materials = stream(project(query, 'material', 'export').order_by(Material.created_at.desc()))
     
     # Crear CSV en memoria con encoding para Excel
     output = io.StringIO()
@@ -256,88 +253,61 @@ def process_bulk_upload():
         return redirect(url_for('materials.bulk_upload'))
     
     try:
-        # Leer el archivo CSV
-        stream = io.StringIO(file.stream.read().decode("UTF8"), newline=None)
-        csv_reader = csv.reader(stream)
-        
-        # Saltar el encabezado
-        header = next(csv_reader, None)
-        
-        materials_created = 0
-        materials_updated = 0
-        errors = []
-        
-        for row_num, row in enumerate(csv_reader, start=2):  # start=2 porque la primera fila es encabezado
-            if len(row) < 6:
-                errors.append(f"Fila {row_num}: No tiene suficientes columnas")
-                continue
-            
-            try:
-                id_material, name, description, unit, material_type, status_str = row[:6]
-                
-                # Validar campos obligatorios
-                if not id_material or not name or not unit or not material_type:
-                    errors.append(f"Fila {row_num}: Campos obligatorios faltantes")
-                    continue
-                
-                # Validar que el tipo de material exista
-                if not MaterialType.query.filter_by(name=material_type).first():
-                    errors.append(f"Fila {row_num}: Tipo de material '{material_type}' no existe")
-                    continue
-                
-                # Validar estado
-                status = status_str.strip() == '1' if status_str else True
-                
-                # Verificar si el material ya existe
-                existing_material = Material.query.filter_by(id_material=id_material).first()
-                
-                if existing_material:
-                    # Actualizar material existente
-                    existing_material.name = name
-                    existing_material.description = description
-                    existing_material.unit = unit
-                    existing_material.type = material_type
-                    existing_material.status = status
-                    existing_material.updated_at = datetime.utcnow()
-                    materials_updated += 1
-                else:
-                    # Crear nuevo material
-                    material = Material(
-                        id_material=id_material,
-                        name=name,
-                        description=description,
-                        unit=unit,
-                        type=material_type,
-                        status=status,
-                        created_by=current_user.username
-                    )
-                    db.session.add(material)
-                    materials_created += 1
-                    
-            except Exception as e:
-                errors.append(f"Fila {row_num}: Error procesando - {str(e)}")
-                continue
-        
-        # Confirmar cambios en la base de datos
+        # Leer el archivo CSV por líneas (sin cargarlo completo en memoria)
+        stream = io.TextIOWrapper(file.stream, encoding='utf-8-sig', newline='')
+        result = import_materials(stream, current_user.username)
         db.session.commit()
         
         # Mostrar resultados
-        if materials_created > 0 or materials_updated > 0:
-            flash(f'Carga masiva completada: {materials_created} materiales creados, {materials_updated} actualizados', 'success')
+        if result.created > 0 or result.updated > 0:
+            flash(f'Carga masiva completada: {result.created} materiales creados, {result.updated} actualizados '
+                  f'en {result.seconds:.1f} s ({result.rate:,.0f} filas/s)', 'success')
         
-        if errors:
-            error_msg = f'Se encontraron {len(errors)} errores durante la carga:'
-            for error in errors[:10]:  # Mostrar solo los primeros 10 errores
+        if result.error_count:
+            error_msg = f'Se encontraron {result.error_count} errores durante la carga:'
+            for error in result.errors:  # Solo se conservan los primeros errores
                 error_msg += f'<br>- {error}'
-            if len(errors) > 10:
-                error_msg += f'<br>... y {len(errors) - 10} errores más'
+            if result.error_count > len(result.errors):
+                error_msg += f'<br>... y {result.error_count - len(result.errors)} errores más'
             flash(error_msg, 'warning')
         
-        if not materials_created and not materials_updated and not errors:
+        if not result.created and not result.updated and not result.error_count:
             flash('No se procesó ningún material. Verifique el formato del archivo.', 'info')
             
     except Exception as e:
         db.session.rollback()
         flash(f'Error procesando el archivo: {str(e)}', 'error')
     
-    return redirect(url_for('materials.material_list'))
\ No newline at end of file
+    return redirect(url_for('materials.material_list'))
+
+# Opciones para el autocompletado de formularios
+# Parámetros opcionales: q (prefijo de código o nombre) y limit
+@bp.route('/api/materials/autocomplete')
+@login_required
+def material_autocomplete():
+    return jsonify(autocomplete('material', request.args.get('q', ''), request.args.get('limit', type=int)))
+
+# Grilla del listado en JSON. Parámetros: sort, dir, per_page, after/before,
+# filtros y búsquedas de GRIDS['material'], archived=1 y facets=0 para no contar facetas
+@bp.route('/api/materials/grid')
+@login_required
+@permission_required('materials', 1)
+def material_grid():
+    try:
+        return jsonify(grid_json('material', request.args))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+# Archiva los materiales inactivos sin cambios en ARCHIVE_AFTER_DAYS días (también archive_inactive.py)
+@bp.route('/materials/archive', methods=['POST'])
+@login_required
+@permission_required('materials', 2)
+def material_archive():
+    try:
+        count = archive_inactive('material')
+        db.session.commit()
+        flash(f'Se archivaron {count} materiales inactivos por más de {ARCHIVE_AFTER_DAYS} días', 'success')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Error al archivar materiales: {str(e)}', 'error')
+    return redirect(url_for('materials.material_list'))
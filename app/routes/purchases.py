@@ -1,12 +1,17 @@
 from flask import Blueprint, render_template, request, flash, redirect, url_for, jsonify, send_file
 from flask_login import login_required, current_user
 from app import db
-from app.models import PurchaseOrder, PurchaseOrderLine, Supplier, Material, Currency
+from app.models import PurchaseOrder, PurchaseOrderLine, Supplier, Material
 from app.models import Location, InventoryStock, InventoryMovement
 from app.utils.auth import permission_required
+from app.utils.reference import reference_cache
+from app.utils.idempotency import idempotent
+from app.utils.sequences import next_number
+from app.utils.projections import project, stream
 import csv
 import io
 from datetime import datetime
+from decimal import Decimal
 
 bp = Blueprint('purchases', __name__)
 
@@ -30,27 +35,29 @@ def purchase_list():
     if status_filter:
         query = query.filter(PurchaseOrder.status == status_filter)
     
-    orders = query.order_by(PurchaseOrder.created_at.desc()).all()
+    # Nombre del proveedor por su clave entera; solo las columnas de la tabla
+    orders = project(query, 'purchase_order', 'list', Supplier.name.label('supplier_name')).outerjoin(
+        Supplier, Supplier.id == PurchaseOrder.supplier_id
+    ).order_by(PurchaseOrder.created_at.desc()).all()
     
-    # Obtener información de proveedores para mostrar y para el filtro
-    suppliers = Supplier.query.filter_by(status=True).all()
-    supplier_dict = {s.id_suplier: s.name for s in suppliers}
+    # Código y nombre de los proveedores para el filtro
+    suppliers = project(Supplier.query.filter_by(status=True), 'supplier', 'option').all()
     
     return render_template('purchases/list.html', 
                          orders=orders, 
-                         supplier_dict=supplier_dict,
-                         suppliers=suppliers,  # Agregar esta línea
+                         suppliers=suppliers,
                          filters=request.args)
 
 @bp.route('/purchases/create', methods=['GET', 'POST'])
 @login_required
 @permission_required('purchases', 2)
+@idempotent
 def purchase_create():
     if request.method == 'POST':
         try:
-            # Crear la orden de compra
+            # Crear la orden de compra; sin ID se asigna el siguiente folio
             order = PurchaseOrder(
-                id_purchase_order=request.form['id_purchase_order'],
+                id_purchase_order=request.form.get('id_purchase_order', '').strip() or next_number('purchase'),
                 id_supplier=request.form['id_supplier'],
                 issue_date=datetime.strptime(request.form['issue_date'], '%Y-%m-%d'),
                 estimated_delivery_date=datetime.strptime(request.form['estimated_delivery_date'], '%Y-%m-%d'),
@@ -75,7 +82,7 @@ def purchase_create():
                         position=i,
                         quantity=int(request.form[f'quantity_{i}']),
                         unit_material=request.form[f'unit_material_{i}'],
-                        price=float(request.form[f'price_{i}']),
+                        price=Decimal(request.form[f'price_{i}']),
                         currency_suppliers=request.form[f'currency_suppliers_{i}'],
                         created_by=current_user.username
                     )
@@ -93,13 +100,10 @@ def purchase_create():
             db.session.rollback()
             flash(f'Error al crear orden de compra: {str(e)}', 'error')
     
-    suppliers = Supplier.query.filter_by(status=True).all()
-    materials = Material.query.filter_by(status=True).all()
-    currencies = Currency.query.all()
+    # Proveedores y materiales se buscan con el autocompletado
+    currencies = reference_cache.get().currencies
     
     return render_template('purchases/create.html', 
-                         suppliers=suppliers, 
-                         materials=materials,
                          currencies=currencies)
 
 @bp.route('/purchases/<string:order_id>')
@@ -107,15 +111,15 @@ def purchase_create():
 @permission_required('purchases', 1)
 def purchase_detail(order_id):
     order = PurchaseOrder.query.filter_by(id_purchase_order=order_id).first_or_404()
-    lines = PurchaseOrderLine.query.filter_by(id_purchase_order=order_id).order_by(PurchaseOrderLine.position).all()
-    supplier = Supplier.query.filter_by(id_suplier=order.id_supplier).first()
+    lines = PurchaseOrderLine.query.filter_by(purchase_order_id=order.id).order_by(PurchaseOrderLine.position).all()
+    supplier = Supplier.query.get(order.supplier_id) if order.supplier_id else None
     
-    # Obtener información de materiales
-    materials = Material.query.all()
+    # Solo los materiales de la orden, por su clave entera
+    materials = Material.query.filter(Material.id.in_([line.material_id for line in lines])).all()
     material_dict = {m.id_material: m for m in materials}
     
     # Obtener ubicaciones para recepción
-    locations = Location.query.filter_by(status=True).all()
+    locations = reference_cache.get().active_locations
     
     return render_template('purchases/detail.html', 
                          order=order, 
@@ -129,7 +133,7 @@ def purchase_detail(order_id):
 @permission_required('purchases', 2)
 def purchase_edit(order_id):
     order = PurchaseOrder.query.filter_by(id_purchase_order=order_id).first_or_404()
-    lines = PurchaseOrderLine.query.filter_by(id_purchase_order=order_id).order_by(PurchaseOrderLine.position).all()
+    lines = PurchaseOrderLine.query.filter_by(purchase_order_id=order.id).order_by(PurchaseOrderLine.position).all()
     
     if request.method == 'POST':
         try:
@@ -142,7 +146,7 @@ def purchase_edit(order_id):
             order.updated_at = datetime.utcnow()
             
             # Eliminar líneas existentes
-            PurchaseOrderLine.query.filter_by(id_purchase_order=order_id).delete()
+            PurchaseOrderLine.query.filter_by(purchase_order_id=order.id).delete()
             
             # Procesar nuevas líneas
             line_count = int(request.form.get('line_count', 0))
@@ -157,7 +161,7 @@ def purchase_edit(order_id):
                         position=i,
                         quantity=int(request.form[f'quantity_{i}']),
                         unit_material=request.form[f'unit_material_{i}'],
-                        price=float(request.form[f'price_{i}']),
+                        price=Decimal(request.form[f'price_{i}']),
                         currency_suppliers=request.form[f'currency_suppliers_{i}'],
                         created_by=current_user.username
                     )
@@ -175,15 +179,18 @@ def purchase_edit(order_id):
             db.session.rollback()
             flash(f'Error al actualizar orden de compra: {str(e)}', 'error')
     
-    suppliers = Supplier.query.filter_by(status=True).all()
-    materials = Material.query.filter_by(status=True).all()
-    currencies = Currency.query.all()
+    # Solo los nombres de lo que ya tiene la orden; el resto se busca con el autocompletado
+    supplier = Supplier.query.get(order.supplier_id) if order.supplier_id else None
+    material_names = dict(Material.query.with_entities(Material.id_material, Material.name).filter(
+        Material.id.in_([line.material_id for line in lines])
+    ).all())
+    currencies = reference_cache.get().currencies
     
     return render_template('purchases/edit.html', 
                          order=order, 
                          lines=lines,
-                         suppliers=suppliers, 
-                         materials=materials,
+                         supplier=supplier, 
+                         material_names=material_names,
                          currencies=currencies)
 
 @bp.route('/purchases/<string:order_id>/delete', methods=['POST'])
@@ -194,7 +201,7 @@ def purchase_delete(order_id):
     
     try:
         # Eliminar líneas primero
-        PurchaseOrderLine.query.filter_by(id_purchase_order=order_id).delete()
+        PurchaseOrderLine.query.filter_by(purchase_order_id=order.id).delete()
         # Eliminar orden
         db.session.delete(order)
         db.session.commit()
@@ -224,7 +231,7 @@ def export_csv():
     if status_filter:
         query = query.filter(PurchaseOrder.status == status_filter)
     
-    orders = query.order_by(PurchaseOrder.created_at.desc()).all()
+    orders = stream(project(query, 'purchase_order', 'export').order_by(PurchaseOrder.created_at.desc()))
     
     # Crear CSV en memoria
     output = io.StringIO()
@@ -400,7 +407,7 @@ def process_bulk_upload():
                         status=row['Estado'],
                         currency=row['Moneda'],
                         notes=row.get('Notas', ''),
-                        total_amount=0.0,  # Se puede calcular si hay líneas en el CSV
+                        total_amount=0,  # Se puede calcular si hay líneas en el CSV
                         created_by=current_user.username
                     )
                     
@@ -448,7 +455,7 @@ def purchase_receive(order_id):
             flash('No hay ubicación principal configurada', 'error')
             return redirect(url_for('purchases.purchase_detail', order_id=order_id))
         
-        lines = PurchaseOrderLine.query.filter_by(id_purchase_order=order_id).all()
+        lines = PurchaseOrderLine.query.filter_by(purchase_order_id=order.id).all()
         movements_created = 0
         
         for line in lines:
@@ -526,7 +533,7 @@ def purchase_receive_partial(order_id):
         # Procesar cada línea con cantidades parciales
         movements_created = 0
         
-        for line in PurchaseOrderLine.query.filter_by(id_purchase_order=order_id).all():
+        for line in PurchaseOrderLine.query.filter_by(purchase_order_id=order.id).all():
             received_qty = request.form.get(f'received_qty_{line.id}')
             
             if received_qty and float(received_qty) > 0:
@@ -592,7 +599,7 @@ def purchase_receive_partial(order_id):
 def debug_order(order_id):
     """Depurar datos de una orden"""
     order = PurchaseOrder.query.filter_by(id_purchase_order=order_id).first_or_404()
-    lines = PurchaseOrderLine.query.filter_by(id_purchase_order=order_id).all()
+    lines = PurchaseOrderLine.query.filter_by(purchase_order_id=order.id).all()
     
     debug_info = {
         'order': {
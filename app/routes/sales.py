@@ -1,13 +1,28 @@
-from flask import Blueprint, render_template, request, flash, redirect, url_for
+from flask import Blueprint, render_template, request, flash, redirect, url_for, current_app, jsonify, abort
 from flask_login import login_required, current_user
 from app import db
 from app.models import (
-    SaleOrder, SaleOrderLine, Customer, Material, 
-    Location, InventoryStock, InventoryMovement, 
-    JournalEntry, JournalItem, AccountAccount
+    SaleOrder, SaleOrderLine, Customer, Material, StockReservation,
+    PriceList, PriceListItem, DiscountRule, SaleQuotation, SaleQuotationLine
 )
 from app.utils.auth import permission_required
+from app.utils.reference import bump_version, reference_cache
+from app.utils.idempotency import idempotent
+from app.utils.cache import account_cache
+from app.utils.allocation import POLICIES, release_expired
+from app.utils import sales_cube
+from app.utils.pricing import PRICING_VERSION, quote_lines
+from app.utils.quotations import (
+    create_quotation, change_status, convert_quotations, is_expired, QUOTATION_STATUSES
+)
+from app.utils.sales import (
+    parse_sale_lines, post_sale, confirm_sale, release_sale, return_sale,
+    sale_page, SALE_STATUSES, RETURNABLE_STATUSES
+)
 from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from sqlalchemy import func, insert
+from app.utils.sequences import next_number
 
 bp = Blueprint('sales', __name__)
 
@@ -15,145 +30,573 @@ bp = Blueprint('sales', __name__)
 @login_required
 @permission_required('sales', 1)
 def sale_list():
-    orders = SaleOrder.query.order_by(SaleOrder.issue_date.desc()).all()
-    return render_template('sales/list.html', orders=orders)
+    filters = {
+        'id_customer': request.args.get('id_customer', ''),
+        'status': request.args.get('status', ''),
+        'date_from': _parse_date(request.args.get('date_from')),
+        'date_to': _parse_date(request.args.get('date_to')),
+    }
+    per_page = min(max(request.args.get('per_page', 50, type=int), 1), 200)
+
+    orders, prev_cursor, next_cursor = sale_page(
+        filters,
+        after=request.args.get('after'),
+        before=request.args.get('before'),
+        per_page=per_page
+    )
+
+    # Argumentos de filtro para los enlaces de paginación (sin el cursor)
+    page_args = {k: v for k, v in request.args.items() if k not in ('after', 'before') and v}
+    return render_template('sales/list.html',
+                           orders=orders,
+                           customer_label=_customer_label(request.args.get('id_customer')),
+                           statuses=SALE_STATUSES,
+                           filters=request.args,
+                           page_args=page_args,
+                           prev_cursor=prev_cursor,
+                           next_cursor=next_cursor)
+
+def _labels(code, name, ids):
+    """Texto "código - nombre" (el de los campos de autocompletado) de los registros ya elegidos"""
+    ids = [value for value in ids if value]
+    if not ids:
+        return {}
+    return {value: f"{value} - {label}" for value, label in db.session.query(code, name).filter(code.in_(ids))}
+
+def _customer_label(id_customer):
+    return _labels(Customer.id_customer, Customer.name, [id_customer]).get(id_customer, id_customer or '')
+
+def _parse_date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date() if value else None
+    except ValueError:
+        return None
 
 @bp.route('/sales/create', methods=['GET', 'POST'])
 @login_required
 @permission_required('sales', 2)
+@idempotent
 def sale_create():
     if request.method == 'POST':
         try:
-            # 1. Recuperar ID de la bodega
+            # 1. Bodega opcional: vacía = asignación automática entre bodegas
             loc_id_raw = request.form.get('id_location')
-            
-            # Validación manual para depurar
-            if not loc_id_raw or loc_id_raw == "":
-                flash("❌ ERROR: La bodega seleccionada envió un valor vacío.", "error")
-                return redirect(url_for('sales.sale_create'))
-            
-            loc_id = int(loc_id_raw) # Convertir a entero
-            mat_code = request.form.get('id_material')
-            qty = int(request.form.get('quantity', 0))
-            price = float(request.form.get('price', 0))
-            
-            
-            
-            # Convertimos a entero para coincidir con el modelo de base de datos
-            loc_id = int(loc_id)
-            # --------------------------
-            
-            # 2. Buscar Material para obtener su unidad de medida
-            material_obj = Material.query.filter_by(id_material=mat_code).first()
-            if not material_obj:
-                flash(f"Error: El material {mat_code} no existe.", "error")
-                return redirect(url_for('sales.sale_create'))
-
-            # 3. Buscar Stock usando el ID numérico de la bodega
-            stock = InventoryStock.query.filter_by(
-                id_material=mat_code, 
-                id_location=loc_id
-            ).first()
-
-            if not stock:
-                flash(f"❌ ERROR: No hay registro de stock para '{mat_code}' en la bodega seleccionada.", "error")
-                return redirect(url_for('sales.sale_create'))
-
-            if stock.quantity < qty:
-                flash(f"❌ Stock insuficiente. Disponible: {stock.quantity}", "error")
-                return redirect(url_for('sales.sale_create'))
-
-            # 4. Registrar Venta e Inventario
-            sale_id = f"VTA-{datetime.now().strftime('%y%m%d%H%M')}"
-            
-            # Cabecera de la Orden de Venta
-            new_sale = SaleOrder(
-                id_sale_order=sale_id,
-                id_customer=request.form['id_customer'],
-                total_amount=qty * price,
-                currency='MXN',
-                status='aprobado',
-                created_by=current_user.username
-            )
-            db.session.add(new_sale)
-
-            # Detalle de la línea de venta
-            db.session.add(SaleOrderLine(
-                id_sale_order=sale_id, 
-                id_material=mat_code,
-                quantity=qty, 
-                unit_price=price, 
-                subtotal=qty*price
-            ))
+            loc_id = int(loc_id_raw) if loc_id_raw else None
+            dispatch = bool(request.form.get('dispatch'))
 
-            # Actualizar Stock (Descontar cantidad)
-            stock.quantity -= qty
-            
-            # Registrar Movimiento de Inventario con el ID de bodega correcto
-            db.session.add(InventoryMovement(
-                id_location=loc_id, 
-                id_material=mat_code,
-                quantity=qty, 
-                unit_type=str(material_obj.unit),
-                movement_type='SALIDA', 
-                notes=f"Venta {sale_id}",
-                created_by=current_user.username
-            ))
+            # 2. Líneas de la venta (material, cantidad, precio)
+            lines = parse_sale_lines(request.form)
 
-            # --- 5. REGISTRO CONTABLE (ASIENTO) ---
-            # Calculamos el monto total de la venta
-            total_sale = float(qty * price)
-
-            # Crear cabecera del asiento
-            # Asegúrate de que los nombres coincidan exactamente con tu models.py
-            entry = JournalEntry(
-                description=f"Venta {sale_id} - Cliente: {request.form.get('id_customer')}",
-                reference=sale_id,
-                created_by=current_user.username
-                # Si tu modelo pide 'date', agrégalo aquí: date=datetime.utcnow()
+            # 3. Registrar Venta, Reservas, Inventario y Asiento en una sola transacción
+            sale_id = next_number('sale')
+            post_sale(
+                sale_id,
+                request.form['id_customer'],
+                lines,
+                request.form.get('acc_debit'),
+                request.form.get('acc_credit'),
+                current_user.username,
+                location_id=loc_id,
+                policy=request.form.get('policy') or None,
+                dispatch=dispatch
             )
-            db.session.add(entry)
-            db.session.flush()  # <--- CRÍTICO: Genera el ID para que JournalItem pueda usarlo
-
-            # Recuperar IDs de cuentas del formulario
-            acc_debit_id = request.form.get('acc_debit')
-            acc_credit_id = request.form.get('acc_credit')
-
-            # Validación de seguridad: Si no hay cuentas, lanzamos error antes del commit
-            if not acc_debit_id or not acc_credit_id:
-                raise ValueError("Las cuentas contables (débito/crédito) no fueron seleccionadas correctamente.")
-
-            # Línea de Débito (Entrada de dinero / CxC)
-            item_debit = JournalItem(
-                entry_id=entry.id,
-                account_id=acc_debit_id,
-                debit=total_sale,
-                credit=0.0
-            )
-            db.session.add(item_debit)
-
-            # Línea de Crédito (Venta / Ingreso)
-            item_credit = JournalItem(
-                entry_id=entry.id,
-                account_id=acc_credit_id,
-                debit=0.0,
-                credit=total_sale
-            )
-            db.session.add(item_credit)
 
-            # 6. Finalizar transacción
+            # 4. Finalizar transacción
             db.session.commit()
-            flash(f"✅ Venta {sale_id} exitosa", "success")
+            if dispatch:
+                flash(f"✅ Venta {sale_id} exitosa", "success")
+            else:
+                flash(f"✅ Venta {sale_id} registrada con stock reservado", "success")
             return redirect(url_for('sales.sale_list'))
 
+        except ValueError as e:
+            db.session.rollback()
+            flash(f"❌ ERROR: {str(e)}", "error")
+            return redirect(url_for('sales.sale_create'))
         except Exception as e:
             db.session.rollback()
             flash(f"Error inesperado: {str(e)}", "error")
             return redirect(url_for('sales.sale_create'))
 
     # Carga de datos para los menús desplegables (GET)
+    # Clientes, bodegas, materiales y cuentas se buscan con el autocompletado
     return render_template('sales/create.html', 
-                           customers=Customer.query.filter_by(status=True).all(), 
-                           materials=Material.query.all(),
-                           locations=Location.query.all(), 
-                           accounts=AccountAccount.query.all())
\ No newline at end of file
+                           policies=POLICIES,
+                           default_policy=current_app.config['ALLOCATION_POLICY'])
+
+@bp.route('/sales/<sale_id>/confirm', methods=['GET', 'POST'])
+@login_required
+@permission_required('sales', 2)
+def sale_confirm(sale_id):
+    sale = SaleOrder.query.filter_by(id_sale_order=sale_id).first_or_404()
+    if request.method == 'POST':
+        try:
+            confirm_sale(sale, request.form.get('acc_debit'), request.form.get('acc_credit'),
+                         current_user.username)
+            db.session.commit()
+            flash(f"✅ Venta {sale_id} despachada", "success")
+            return redirect(url_for('sales.sale_list'))
+        except ValueError as e:
+            db.session.rollback()
+            flash(f"❌ ERROR: {str(e)}", "error")
+        except Exception as e:
+            db.session.rollback()
+            flash(f"Error inesperado: {str(e)}", "error")
+
+    reservations = StockReservation.query.filter_by(id_sale_order=sale_id).order_by(StockReservation.id).all()
+    return render_template('sales/confirm.html', sale=sale, reservations=reservations,
+                           accounts=account_cache.get().accounts)
+
+@bp.route('/sales/<sale_id>/release', methods=['POST'])
+@login_required
+@permission_required('sales', 2)
+def sale_release(sale_id):
+    sale = SaleOrder.query.filter_by(id_sale_order=sale_id).first_or_404()
+    try:
+        release_sale(sale)
+        db.session.commit()
+        flash(f"Reserva de la venta {sale_id} liberada", "success")
+    except ValueError as e:
+        db.session.rollback()
+        flash(f"❌ ERROR: {str(e)}", "error")
+    return redirect(url_for('sales.sale_list'))
+
+@bp.route('/sales/<sale_id>/return', methods=['GET', 'POST'])
+@login_required
+@permission_required('sales', 2)
+@idempotent
+def sale_return(sale_id):
+    sale = SaleOrder.query.filter_by(id_sale_order=sale_id).first_or_404()
+    if request.method == 'POST':
+        try:
+            quantities = {
+                int(line_id): int(qty or 0)
+                for line_id, qty in zip(request.form.getlist('line_id[]'), request.form.getlist('return_quantity[]'))
+            }
+            return_sale(sale, quantities, current_user.username)
+            db.session.commit()
+            flash(f"✅ Devolución de la venta {sale_id} registrada", "success")
+            return redirect(url_for('sales.sale_list'))
+        except ValueError as e:
+            db.session.rollback()
+            flash(f"❌ ERROR: {str(e)}", "error")
+        except Exception as e:
+            db.session.rollback()
+            flash(f"Error inesperado: {str(e)}", "error")
+        return redirect(url_for('sales.sale_return', sale_id=sale_id))
+
+    lines = SaleOrderLine.query.filter_by(id_sale_order=sale_id).order_by(SaleOrderLine.id).all()
+    return render_template('sales/return.html', sale=sale, lines=lines,
+                           returnable=sale.status in RETURNABLE_STATUSES)
+
+@bp.route('/sales/<sale_id>/cancel', methods=['POST'])
+@login_required
+@permission_required('sales', 2)
+@idempotent
+def sale_cancel(sale_id):
+    """Anula la venta: libera la reserva o devuelve todo lo despachado"""
+    sale = SaleOrder.query.filter_by(id_sale_order=sale_id).first_or_404()
+    try:
+        if sale.status == 'reservado':
+            release_sale(sale)
+        else:
+            return_sale(sale, {}, current_user.username, cancel=True)
+        db.session.commit()
+        flash(f"Venta {sale_id} anulada", "success")
+    except ValueError as e:
+        db.session.rollback()
+        flash(f"❌ ERROR: {str(e)}", "error")
+    except Exception as e:
+        db.session.rollback()
+        flash(f"Error inesperado: {str(e)}", "error")
+    return redirect(url_for('sales.sale_list'))
+
+@bp.route('/sales/reservations/release_expired', methods=['POST'])
+@login_required
+@permission_required('sales', 2)
+def release_expired_reservations():
+    released = release_expired()
+    db.session.commit()
+    flash(f"Reservas vencidas liberadas: {released}", "success")
+    return redirect(url_for('sales.sale_list'))
+
+# ================================
+# Cubo de ventas (resumen diario)
+# ================================
+
+@bp.route('/api/sales/cube')
+@login_required
+@permission_required('reporting', 1)
+def sales_cube_api():
+    """Ej: /api/sales/cube?dimensions=day,customer&measures=revenue&granularity=month&date_from=2024-01-01"""
+    dimensions = [d for d in request.args.get('dimensions', 'day').split(',') if d]
+    measures = [m for m in request.args.get('measures', 'revenue,quantity').split(',') if m]
+    filters = {name: request.args[name] for name in sales_cube.DIMENSIONS if name != 'day' and request.args.get(name)}
+
+    try:
+        rows = sales_cube.query_cube(
+            dimensions,
+            measures,
+            date_from=_parse_date(request.args.get('date_from')),
+            date_to=_parse_date(request.args.get('date_to')),
+            granularity=request.args.get('granularity', 'day'),
+            filters=filters
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return jsonify({'dimensions': dimensions, 'measures': measures, 'rows': rows})
+
+@bp.route('/sales/cube/rebuild', methods=['POST'])
+@login_required
+@permission_required('sales', 2)
+def sales_cube_rebuild():
+    try:
+        rows = sales_cube.rebuild()
+        db.session.commit()
+        flash(f"Resumen de ventas recalculado: {rows} filas", "success")
+    except Exception as e:
+        db.session.rollback()
+        flash(f"Error al recalcular el resumen de ventas: {str(e)}", "error")
+    return redirect(url_for('sales.sale_list'))
+
+# ================================
+# Listas de precios y descuentos
+# ================================
+
+@bp.route('/sales/price_lists')
+@login_required
+@permission_required('sales', 1)
+def price_list_list():
+    item_counts = dict(db.session.query(PriceListItem.price_list_id, func.count(PriceListItem.id))
+                       .group_by(PriceListItem.price_list_id).all())
+    price_lists = PriceList.query.order_by(PriceList.currency, PriceList.priority, PriceList.code).all()
+    return render_template('sales/price_lists/list.html', price_lists=price_lists, item_counts=item_counts)
+
+def _save_price_list(price_list):
+    """Copia el formulario en la lista y reemplaza sus escalones en bloque"""
+    price_list.code = request.form['code'].strip()
+    price_list.name = request.form['name'].strip()
+    price_list.category = request.form.get('category', '').strip() or None
+    price_list.currency = request.form['currency']
+    price_list.valid_from = _parse_date(request.form.get('valid_from'))
+    price_list.valid_to = _parse_date(request.form.get('valid_to'))
+    price_list.priority = int(request.form.get('priority') or 0)
+    price_list.status = bool(request.form.get('status'))
+    db.session.add(price_list)
+    db.session.flush()
+
+    items = {}
+    for mat_code, min_qty, price in zip(request.form.getlist('id_material[]'),
+                                        request.form.getlist('min_quantity[]'),
+                                        request.form.getlist('price[]')):
+        if not mat_code or not price:
+            continue
+        items[(mat_code, int(min_qty or 1))] = Decimal(price)
+
+    PriceListItem.query.filter_by(price_list_id=price_list.id).delete()
+    if items:
+        db.session.execute(insert(PriceListItem), [
+            {'price_list_id': price_list.id, 'id_material': mat_code, 'min_quantity': min_qty, 'price': price}
+            for (mat_code, min_qty), price in items.items()
+        ])
+    # Los escalones se reemplazan sin pasar por la sesión
+    bump_version(PRICING_VERSION)
+
+@bp.route('/sales/price_lists/create', methods=['GET', 'POST'])
+@login_required
+@permission_required('sales', 2)
+def price_list_create():
+    price_list = PriceList(status=True, priority=0)
+    if request.method == 'POST':
+        try:
+            price_list.created_by = current_user.username
+            _save_price_list(price_list)
+            db.session.commit()
+            flash('Lista de precios creada exitosamente', 'success')
+            return redirect(url_for('sales.price_list_list'))
+        except Exception as e:
+            db.session.rollback()
+            flash(f'Error al crear lista de precios: {str(e)}', 'error')
+
+    return render_template('sales/price_lists/form.html', price_list=price_list, items=[], material_labels={},
+                           currencies=reference_cache.get().currencies, categories=_customer_categories())
+
+@bp.route('/sales/price_lists/<int:price_list_id>/edit', methods=['GET', 'POST'])
+@login_required
+@permission_required('sales', 2)
+def price_list_edit(price_list_id):
+    price_list = PriceList.query.get_or_404(price_list_id)
+    if request.method == 'POST':
+        try:
+            _save_price_list(price_list)
+            db.session.commit()
+            flash('Lista de precios actualizada exitosamente', 'success')
+            return redirect(url_for('sales.price_list_list'))
+        except Exception as e:
+            db.session.rollback()
+            flash(f'Error al actualizar lista de precios: {str(e)}', 'error')
+
+    items = PriceListItem.query.filter_by(price_list_id=price_list.id).order_by(
+        PriceListItem.id_material, PriceListItem.min_quantity).all()
+    return render_template('sales/price_lists/form.html', price_list=price_list, items=items,
+                           material_labels=_labels(Material.id_material, Material.name,
+                                                   {item.id_material for item in items}),
+                           currencies=reference_cache.get().currencies, categories=_customer_categories())
+
+@bp.route('/sales/price_lists/<int:price_list_id>/delete', methods=['POST'])
+@login_required
+@permission_required('sales', 2)
+def price_list_delete(price_list_id):
+    price_list = PriceList.query.get_or_404(price_list_id)
+    try:
+        db.session.delete(price_list)
+        db.session.commit()
+        flash('Lista de precios eliminada exitosamente', 'success')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Error al eliminar lista de precios: {str(e)}', 'error')
+    return redirect(url_for('sales.price_list_list'))
+
+@bp.route('/sales/discounts', methods=['GET', 'POST'])
+@login_required
+@permission_required('sales', 1)
+def discount_list():
+    if request.method == 'POST':
+        if not current_user.has_permission('sales', 2):
+            abort(403)
+        try:
+            try:
+                percent = Decimal(request.form['percent'])
+                valid = percent.is_finite() and 0 <= percent <= 100
+            except InvalidOperation:
+                valid = False
+            if not valid:
+                raise ValueError('El porcentaje debe ser un número entre 0 y 100')
+            db.session.add(DiscountRule(
+                name=request.form['name'].strip(),
+                category=request.form.get('category', '').strip() or None,
+                id_material=request.form.get('id_material') or None,
+                min_quantity=int(request.form.get('min_quantity') or 1),
+                percent=percent,
+                valid_from=_parse_date(request.form.get('valid_from')),
+                valid_to=_parse_date(request.form.get('valid_to')),
+                status=True,
+                created_by=current_user.username
+            ))
+            db.session.commit()
+            flash('Descuento creado exitosamente', 'success')
+        except Exception as e:
+            db.session.rollback()
+            flash(f'Error al crear descuento: {str(e)}', 'error')
+        return redirect(url_for('sales.discount_list'))
+
+    rules = DiscountRule.query.order_by(DiscountRule.category, DiscountRule.id_material, DiscountRule.min_quantity).all()
+    return render_template('sales/price_lists/discounts.html', rules=rules,
+                           categories=_customer_categories())
+
+@bp.route('/sales/discounts/<int:rule_id>/delete', methods=['POST'])
+@login_required
+@permission_required('sales', 2)
+def discount_delete(rule_id):
+    rule = DiscountRule.query.get_or_404(rule_id)
+    try:
+        db.session.delete(rule)
+        db.session.commit()
+        flash('Descuento eliminado exitosamente', 'success')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Error al eliminar descuento: {str(e)}', 'error')
+    return redirect(url_for('sales.discount_list'))
+
+def _customer_categories():
+    return [category for (category,) in db.session.query(Customer.category)
+            .filter(Customer.category.isnot(None), Customer.category != '').distinct().order_by(Customer.category)]
+
+@bp.route('/api/sales/price')
+@login_required
+@permission_required('sales', 1)
+def get_price():
+    """Precio de lista y descuento para un material: ?id_customer=&id_material=&quantity=&currency="""
+    quote = quote_lines(
+        request.args.get('id_customer'),
+        [(request.args.get('id_material'), request.args.get('quantity', 1, type=int))],
+        request.args.get('currency') or 'MXN'
+    )[0]
+    if quote is None:
+        return jsonify({'price': None})
+    return jsonify({
+        'price': str(quote.price),
+        'list_price': str(quote.list_price),
+        'discount': str(quote.discount),
+        'price_list': quote.price_list
+    })
+
+@bp.route('/api/sales/quote', methods=['POST'])
+@login_required
+@permission_required('sales', 1)
+def quote_order():
+    """Cotiza un pedido completo: {"id_customer", "currency", "lines": [{"id_material", "quantity"}]}"""
+    data = request.get_json(silent=True) or {}
+    try:
+        lines = [(line.get('id_material'), int(line.get('quantity') or 1)) for line in data.get('lines', [])]
+    except (AttributeError, TypeError, ValueError):
+        return jsonify({'error': 'Cada línea debe tener id_material y una cantidad entera'}), 400
+    quotes = quote_lines(data.get('id_customer'), lines, data.get('currency') or 'MXN')
+    return jsonify({'lines': [
+        {
+            'id_material': mat_code,
+            'quantity': qty,
+            'price': str(quote.price) if quote else None,
+            'list_price': str(quote.list_price) if quote else None,
+            'discount': str(quote.discount) if quote else None,
+        }
+        for (mat_code, qty), quote in zip(lines, quotes)
+    ]})
+
+# ================================
+# Cotizaciones
+# ================================
+
+@bp.route('/sales/quotations')
+@login_required
+@permission_required('sales', 1)
+def quotation_list():
+    query = SaleQuotation.query
+    if request.args.get('id_customer'):
+        query = query.filter(SaleQuotation.id_customer == request.args['id_customer'])
+    if request.args.get('status'):
+        query = query.filter(SaleQuotation.status == request.args['status'])
+
+    return render_template('sales/quotations/list.html',
+                           quotations=query.order_by(SaleQuotation.id.desc()).limit(1000).all(),
+                           customer_label=_customer_label(request.args.get('id_customer')),
+                           statuses=QUOTATION_STATUSES,
+                           filters=request.args,
+                           today=datetime.utcnow().date(),
+                           locations=reference_cache.get().locations,
+                           accounts=account_cache.get().accounts,
+                           policies=POLICIES,
+                           default_policy=current_app.config['ALLOCATION_POLICY'])
+
+@bp.route('/sales/quotations/create', methods=['GET', 'POST'])
+@login_required
+@permission_required('sales', 2)
+@idempotent
+def quotation_create():
+    if request.method == 'POST':
+        try:
+            lines = parse_sale_lines(request.form)
+            quotation_id = next_number('quotation')
+            create_quotation(
+                quotation_id,
+                request.form['id_customer'],
+                lines,
+                current_user.username,
+                valid_until=_parse_date(request.form.get('valid_until')),
+                notes=request.form.get('notes') or None
+            )
+            db.session.commit()
+            flash(f"✅ Cotización {quotation_id} registrada", "success")
+            return redirect(url_for('sales.quotation_view', quotation_id=quotation_id))
+        except ValueError as e:
+            db.session.rollback()
+            flash(f"❌ ERROR: {str(e)}", "error")
+            return redirect(url_for('sales.quotation_create'))
+        except Exception as e:
+            db.session.rollback()
+            flash(f"Error inesperado: {str(e)}", "error")
+            return redirect(url_for('sales.quotation_create'))
+
+    # Clientes y materiales se buscan con el autocompletado
+    return render_template('sales/quotations/create.html',
+                           valid_days=current_app.config['QUOTATION_VALID_DAYS'])
+
+@bp.route('/sales/quotations/<quotation_id>')
+@login_required
+@permission_required('sales', 1)
+def quotation_view(quotation_id):
+    quotation = SaleQuotation.query.filter_by(id_quotation=quotation_id).first_or_404()
+    lines = SaleQuotationLine.query.filter_by(id_quotation=quotation_id).order_by(SaleQuotationLine.id).all()
+    return render_template('sales/quotations/view.html',
+                           quotation=quotation,
+                           lines=lines,
+                           expired=is_expired(quotation),
+                           locations=reference_cache.get().locations,
+                           accounts=account_cache.get().accounts,
+                           policies=POLICIES,
+                           default_policy=current_app.config['ALLOCATION_POLICY'])
+
+@bp.route('/sales/quotations/<quotation_id>/status', methods=['POST'])
+@login_required
+@permission_required('sales', 2)
+def quotation_status(quotation_id):
+    quotation = SaleQuotation.query.filter_by(id_quotation=quotation_id).first_or_404()
+    try:
+        change_status(quotation, request.form.get('action'))
+        db.session.commit()
+        flash(f"Cotización {quotation_id}: {quotation.status}", "success")
+    except ValueError as e:
+        db.session.rollback()
+        flash(f"❌ ERROR: {str(e)}", "error")
+    return redirect(url_for('sales.quotation_view', quotation_id=quotation_id))
+
+def _convert(quotations):
+    """Convierte las cotizaciones con las opciones del formulario y confirma la transacción"""
+    loc_id_raw = request.form.get('id_location')
+    dispatch = bool(request.form.get('dispatch'))
+    sales = convert_quotations(
+        quotations,
+        request.form.get('acc_debit'),
+        request.form.get('acc_credit'),
+        current_user.username,
+        location_id=int(loc_id_raw) if loc_id_raw else None,
+        policy=request.form.get('policy') or None,
+        dispatch=dispatch
+    )
+    db.session.commit()
+    return sales
+
+@bp.route('/sales/quotations/<quotation_id>/convert', methods=['POST'])
+@login_required
+@permission_required('sales', 2)
+@idempotent
+def quotation_convert(quotation_id):
+    quotation = SaleQuotation.query.filter_by(id_quotation=quotation_id).first_or_404()
+    try:
+        sale = _convert([quotation])[0]
+        flash(f"✅ Cotización {quotation_id} convertida en la venta {sale.id_sale_order}", "success")
+        return redirect(url_for('sales.sale_list'))
+    except ValueError as e:
+        db.session.rollback()
+        flash(f"❌ ERROR: {str(e)}", "error")
+    except Exception as e:
+        db.session.rollback()
+        flash(f"Error inesperado: {str(e)}", "error")
+    return redirect(url_for('sales.quotation_view', quotation_id=quotation_id))
+
+@bp.route('/sales/quotations/convert', methods=['POST'])
+@login_required
+@permission_required('sales', 2)
+@idempotent
+def quotation_convert_batch():
+    """Convierte en una sola transacción las cotizaciones marcadas o todas las aceptadas vigentes"""
+    query = SaleQuotation.query
+    if request.form.get('all_accepted'):
+        query = query.filter(SaleQuotation.status == 'aceptada',
+                             SaleQuotation.valid_until >= datetime.utcnow().date())
+    else:
+        query = query.filter(SaleQuotation.id_quotation.in_(request.form.getlist('quotation_ids[]')))
+    quotations = query.order_by(SaleQuotation.id).all()
+
+    try:
+        sales = _convert(quotations)
+        flash(f"✅ {len(sales)} cotizaciones convertidas en ventas", "success")
+        return redirect(url_for('sales.sale_list'))
+    except ValueError as e:
+        db.session.rollback()
+        flash(f"❌ ERROR: {str(e)}", "error")
+    except Exception as e:
+        db.session.rollback()
+        flash(f"Error inesperado: {str(e)}", "error")
+    return redirect(url_for('sales.quotation_list', status='aceptada'))
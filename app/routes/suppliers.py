@@ -1,8 +1,17 @@
 from flask import Blueprint, render_template, request, flash, redirect, url_for, jsonify, send_file
 from flask_login import login_required, current_user
 from app import db
-from app.models import Supplier, Country, Currency
+from app.models import Supplier
 from app.utils.auth import permission_required
+from app.utils.idempotency import idempotent
+from app.utils.reference import reference_cache
+from app.utils.search import apply_search
+from app.utils.bulk_import import import_suppliers
+from app.utils.autocomplete import autocomplete
+from app.utils.projections import project, stream
+from app.utils.grid import grid_json, grid_page
+from app.utils.archive import ARCHIVE_AFTER_DAYS, active, archive_inactive
+from app.utils.dedup import MIN_SCORE, find_duplicates, merge
 import csv
 import io
 from datetime import datetime
@@ -13,33 +22,23 @@ bp = Blueprint('suppliers', __name__)
 @login_required
 @permission_required('suppliers', 1)
 def supplier_list():
-    # Obtener parámetros de filtro
-    id_suplier_filter = request.args.get('id_suplier', '')
-    name_filter = request.args.get('name', '')
-    country_filter = request.args.get('country', '')
-    status_filter = request.args.get('status', '')
-    
-    # Construir consulta base
-    query = Supplier.query
-    
-    # Aplicar filtros
-    if id_suplier_filter:
-        query = query.filter(Supplier.id_suplier.contains(id_suplier_filter))
-    if name_filter:
-        query = query.filter(Supplier.name.contains(name_filter))
-    if country_filter:
-        query = query.filter(Supplier.country == country_filter)
-    if status_filter:
-        status_bool = status_filter == 'true'
-        query = query.filter(Supplier.status == status_bool)
-    
-    suppliers = query.order_by(Supplier.created_at.desc()).all()
-    countries = Country.query.all()
+    # Una página por keyset con el orden y los filtros de la grilla (app/utils/grid.py)
+    try:
+        page = grid_page('supplier', {**request.args.to_dict(), 'facets': '0'})
+    except ValueError as e:
+        flash(str(e), 'error')
+        return redirect(url_for('suppliers.supplier_list'))
+    countries = reference_cache.get().countries
     
+    # Argumentos de filtro y orden para los enlaces de paginación (sin el cursor)
+    page_args = {k: v for k, v in request.args.items() if k not in ('after', 'before') and v}
     return render_template('suppliers/list.html', 
-                         suppliers=suppliers, 
+                         suppliers=page.rows, 
                          countries=countries,
-                         filters=request.args)
+                         filters=request.args,
+                         page_args=page_args,
+                         prev_cursor=page.prev_cursor,
+                         next_cursor=page.next_cursor)
 
 @bp.route('/suppliers/create', methods=['GET', 'POST'])
 @login_required
@@ -79,8 +78,8 @@ def supplier_create():
             db.session.rollback()
             flash(f'Error al crear proveedor: {str(e)}', 'error')
     
-    countries = Country.query.all()
-    currencies = Currency.query.all()
+    countries = reference_cache.get().countries
+    currencies = reference_cache.get().currencies
     return render_template('suppliers/create.html', 
                          countries=countries, 
                          currencies=currencies)
@@ -112,6 +111,8 @@ def supplier_edit(supplier_id):
             supplier.payment_method = request.form.get('payment_method', '')
             supplier.bank_account = request.form.get('bank_account', '')
             supplier.status = request.form.get('status') == 'on'
+            if supplier.status:
+                supplier.archived_at = None  # Al activarlo deja de estar archivado
             supplier.updated_at = datetime.utcnow()
             
             db.session.commit()
@@ -122,8 +123,8 @@ def supplier_edit(supplier_id):
             db.session.rollback()
             flash(f'Error al actualizar proveedor: {str(e)}', 'error')
     
-    countries = Country.query.all()
-    currencies = Currency.query.all()
+    countries = reference_cache.get().countries
+    currencies = reference_cache.get().currencies
     return render_template('suppliers/edit.html', 
                          supplier=supplier, 
                          countries=countries, 
@@ -145,6 +146,36 @@ def supplier_delete(supplier_id):
     
     return redirect(url_for('suppliers.supplier_list'))
 
+# Posibles duplicados (mismo RFC o nombre parecido) y unión en un solo registro
+@bp.route('/suppliers/duplicates')
+@login_required
+@permission_required('suppliers', 1)
+def supplier_duplicates():
+    min_score = request.args.get('min_score', MIN_SCORE, type=float)
+    candidates = find_duplicates('supplier', min_score=min_score, limit=500)
+    return render_template('suppliers/duplicates.html', candidates=candidates, min_score=min_score)
+
+@bp.route('/suppliers/duplicates/merge', methods=['POST'])
+@login_required
+@permission_required('suppliers', 2)
+@idempotent
+def supplier_merge():
+    keep = request.form.get('keep', '')
+    duplicates = request.form.getlist('merge')
+    try:
+        counts = merge('supplier', keep, duplicates)
+        db.session.commit()
+        detail = ', '.join(f'{count} {table}' for table, count in counts.items())
+        flash(f'Se unieron {len(duplicates)} proveedores en {keep}. Registros reasignados: {detail}', 'success')
+    except ValueError as e:
+        db.session.rollback()
+        flash(f'Error al unir proveedores: {str(e)}', 'error')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Error inesperado: {str(e)}', 'error')
+    
+    return redirect(url_for('suppliers.supplier_duplicates', min_score=request.form.get('min_score') or None))
+
 @bp.route('/suppliers/export_csv')
 @login_required
 @permission_required('suppliers', 1)
@@ -156,19 +187,18 @@ def export_csv():
     status_filter = request.args.get('status', '')
     
     # Construir consulta base
-    query = Supplier.query
+    query = active(Supplier.query, Supplier, request.args.get('archived') == '1')
     
-    if id_suplier_filter:
-        query = query.filter(Supplier.id_suplier.contains(id_suplier_filter))
-    if name_filter:
-        query = query.filter(Supplier.name.contains(name_filter))
+    query = apply_search(query, 'supplier', request.args.get('q'))
+    query = apply_search(query, 'supplier', id_suplier_filter, ['id_suplier'])
+    query = apply_search(query, 'supplier', name_filter, ['name'])
     if country_filter:
         query = query.filter(Supplier.country == country_filter)
     if status_filter:
         status_bool = status_filter == 'true'
         query = query.filter(Supplier.status == status_bool)
     
-    suppliers = query.order_by(Supplier.created_at.desc()).all()
+    suppliers = stream(project(query, 'supplier', 'export').order_by(Supplier.created_at.desc()))
     
     # Crear CSV en memoria con encoding para Excel
     output = io.StringIO()
@@ -328,124 +358,61 @@ def process_bulk_upload():
         return redirect(url_for('suppliers.bulk_upload'))
     
     try:
-        # Leer el archivo CSV
-        stream = io.StringIO(file.stream.read().decode("UTF8"), newline=None)
-        csv_reader = csv.reader(stream)
-        
-        # Saltar el encabezado
-        header = next(csv_reader, None)
-        
-        suppliers_created = 0
-        suppliers_updated = 0
-        errors = []
-        
-        for row_num, row in enumerate(csv_reader, start=2):
-            if len(row) < 19:
-                errors.append(f"Fila {row_num}: No tiene suficientes columnas")
-                continue
-            
-            try:
-                # Mapear campos del CSV
-                (id_suplier, legal_name, name, country, currency, 
-                 text_id, state_province, city, address, zip_code, 
-                 phone, email, contact_name, contact_role, category, 
-                 payments_terms, payment_method, bank_account, status_str) = row[:19]
-                
-                # Validar campos obligatorios
-                if not id_suplier or not legal_name or not name or not country or not currency:
-                    errors.append(f"Fila {row_num}: Campos obligatorios faltantes")
-                    continue
-                
-                # Validar que el país exista (por nombre)
-                if not Country.query.filter_by(name=country).first():
-                    errors.append(f"Fila {row_num}: País '{country}' no existe")
-                    continue
-                
-                # **CORRECCIÓN: Buscar moneda por símbolo en lugar de nombre**
-                currency_obj = Currency.query.filter_by(symbol=currency).first()
-                if not currency_obj:
-                    errors.append(f"Fila {row_num}: Moneda '{currency}' no existe. Use símbolos como MXN, USD, EUR")
-                    continue
-                
-                # Validar estado
-                status = status_str.strip() == '1' if status_str else True
-                
-                # Verificar si el proveedor ya existe
-                existing_supplier = Supplier.query.filter_by(id_suplier=id_suplier).first()
-                
-                if existing_supplier:
-                    # Actualizar proveedor existente
-                    existing_supplier.legal_name = legal_name
-                    existing_supplier.name = name
-                    existing_supplier.country = country
-                    existing_supplier.currency = currency_obj.name  # Guardar nombre de la moneda
-                    existing_supplier.text_id = text_id
-                    existing_supplier.state_province = state_province
-                    existing_supplier.city = city
-                    existing_supplier.address = address
-                    existing_supplier.zip_code = zip_code
-                    existing_supplier.phone = phone
-                    existing_supplier.email = email
-                    existing_supplier.contact_name = contact_name
-                    existing_supplier.contact_role = contact_role
-                    existing_supplier.category = category
-                    existing_supplier.payments_terms = payments_terms
-                    existing_supplier.payment_method = payment_method
-                    existing_supplier.bank_account = bank_account
-                    existing_supplier.status = status
-                    existing_supplier.updated_at = datetime.utcnow()
-                    suppliers_updated += 1
-                else:
-                    # Crear nuevo proveedor
-                    supplier = Supplier(
-                        id_suplier=id_suplier,
-                        legal_name=legal_name,
-                        name=name,
-                        country=country,
-                        currency=currency_obj.name,  # Guardar nombre de la moneda
-                        text_id=text_id,
-                        state_province=state_province,
-                        city=city,
-                        address=address,
-                        zip_code=zip_code,
-                        phone=phone,
-                        email=email,
-                        contact_name=contact_name,
-                        contact_role=contact_role,
-                        category=category,
-                        payments_terms=payments_terms,
-                        payment_method=payment_method,
-                        bank_account=bank_account,
-                        status=status,
-                        created_by=current_user.username
-                    )
-                    db.session.add(supplier)
-                    suppliers_created += 1
-                    
-            except Exception as e:
-                errors.append(f"Fila {row_num}: Error procesando - {str(e)}")
-                continue
-        
-        # Confirmar cambios en la base de datos
+        # Leer el archivo CSV por líneas (sin cargarlo completo en memoria)
+        stream = io.TextIOWrapper(file.stream, encoding='utf-8-sig', newline='')
+        result = import_suppliers(stream, current_user.username)
         db.session.commit()
         
         # Mostrar resultados
-        if suppliers_created > 0 or suppliers_updated > 0:
-            flash(f'Carga masiva completada: {suppliers_created} proveedores creados, {suppliers_updated} actualizados', 'success')
+        if result.created > 0 or result.updated > 0:
+            flash(f'Carga masiva completada: {result.created} proveedores creados, {result.updated} actualizados '
+                  f'en {result.seconds:.1f} s ({result.rate:,.0f} filas/s)', 'success')
         
-        if errors:
-            error_msg = f'Se encontraron {len(errors)} errores durante la carga:'
-            for error in errors[:10]:
+        if result.error_count:
+            error_msg = f'Se encontraron {result.error_count} errores durante la carga:'
+            for error in result.errors:
                 error_msg += f'<br>- {error}'
-            if len(errors) > 10:
-                error_msg += f'<br>... y {len(errors) - 10} errores más'
+            if result.error_count > len(result.errors):
+                error_msg += f'<br>... y {result.error_count - len(result.errors)} errores más'
             flash(error_msg, 'warning')
         
-        if not suppliers_created and not suppliers_updated and not errors:
+        if not result.created and not result.updated and not result.error_count:
             flash('No se procesó ningún proveedor. Verifique el formato del archivo.', 'info')
             
     except Exception as e:
         db.session.rollback()
         flash(f'Error procesando el archivo: {str(e)}', 'error')
     
-    return redirect(url_for('suppliers.supplier_list'))
\ No newline at end of file
+    return redirect(url_for('suppliers.supplier_list'))
+
+# Opciones para el autocompletado de formularios
+# Parámetros opcionales: q (prefijo de código o nombre) y limit
+@bp.route('/api/suppliers/autocomplete')
+@login_required
+def supplier_autocomplete():
+    return jsonify(autocomplete('supplier', request.args.get('q', ''), request.args.get('limit', type=int)))
+
+# Grilla del listado en JSON. Parámetros: sort, dir, per_page, after/before,
+# filtros y búsquedas de GRIDS['supplier'], archived=1 y facets=0 para no contar facetas
+@bp.route('/api/suppliers/grid')
+@login_required
+@permission_required('suppliers', 1)
+def supplier_grid():
+    try:
+        return jsonify(grid_json('supplier', request.args))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+# Archiva los proveedores inactivos sin cambios en ARCHIVE_AFTER_DAYS días (también archive_inactive.py)
+@bp.route('/suppliers/archive', methods=['POST'])
+@login_required
+@permission_required('suppliers', 2)
+def supplier_archive():
+    try:
+        count = archive_inactive('supplier')
+        db.session.commit()
+        flash(f'Se archivaron {count} proveedores inactivos por más de {ARCHIVE_AFTER_DAYS} días', 'success')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Error al archivar proveedores: {str(e)}', 'error')
+    return redirect(url_for('suppliers.supplier_list'))
@@ -3,6 +3,7 @@ from flask_login import login_user, logout_user, login_required, current_user
 from app import db
 from app.models import User, Role
 from app.utils.auth import permission_required, superuser_required
+from app.utils.reference import reference_cache
 
 bp = Blueprint('users', __name__)
 
@@ -85,7 +86,7 @@ def user_create():
         flash('Usuario creado exitosamente', 'success')
         return redirect(url_for('users.user_list'))
     
-    roles = Role.query.all()
+    roles = reference_cache.get().roles
     return render_template('users/create.html', roles=roles)
 
 # Editar Usuario
@@ -110,7 +111,7 @@ def user_edit(user_id):
         flash('Usuario actualizado exitosamente', 'success')
         return redirect(url_for('users.user_list'))
     
-    roles = Role.query.all()
+    roles = reference_cache.get().roles
     return render_template('users/edit.html', user=user, roles=roles)
 
 # Eliminar Usuario
@@ -0,0 +1,94 @@
+// Autocompletado con <datalist> para los formularios con listas grandes
+// (materiales, clientes, proveedores, bodegas, cuentas).
+//
+// Uso: <input type="text" data-autocomplete="URL"> seguido inmediatamente de un
+// <input type="hidden" name="..."> que recibe el id de la opción elegida. El
+// endpoint recibe q (prefijo) y limit y devuelve [{id, text, ...}]. Al elegir
+// una opción se emite el evento "autocomplete:select" con la opción en detail.
+(function () {
+    const DELAY_MS = 200;
+    const LIMIT = 20;
+    const responses = new Map();  // Respuestas ya pedidas en esta página, por URL
+    let counter = 0;
+
+    function fetchOptions(url) {
+        if (!responses.has(url)) {
+            responses.set(url, fetch(url, { credentials: 'same-origin' })
+                .then(response => response.ok ? response.json() : [])
+                .catch(() => {
+                    responses.delete(url);
+                    return [];
+                }));
+        }
+        return responses.get(url);
+    }
+
+    function attach(input) {
+        if (input.dataset.autocompleteReady) return;
+        input.dataset.autocompleteReady = '1';
+        input.setAttribute('autocomplete', 'off');
+
+        const hidden = input.nextElementSibling;
+        const list = document.createElement('datalist');
+        list.id = `autocomplete-list-${++counter}`;
+        input.setAttribute('list', list.id);
+        input.parentNode.appendChild(list);
+
+        let options = {};  // texto mostrado -> opción
+        let timer = null;
+
+        function validate() {
+            const missing = input.value && !hidden.value;
+            input.setCustomValidity(missing ? 'Seleccione una opción de la lista' : '');
+        }
+
+        function select(option) {
+            hidden.value = option ? option.id : '';
+            validate();
+            if (option) {
+                input.dispatchEvent(new CustomEvent('autocomplete:select', { detail: option, bubbles: true }));
+            }
+        }
+
+        function load() {
+            const params = new URLSearchParams({ q: input.value, limit: input.dataset.limit || LIMIT });
+            fetchOptions(`${input.dataset.autocomplete}?${params}`).then(items => {
+                options = {};
+                list.innerHTML = '';
+                items.forEach(item => {
+                    options[item.text] = item;
+                    const option = document.createElement('option');
+                    option.value = item.text;
+                    list.appendChild(option);
+                });
+                // El texto escrito puede coincidir exactamente con una opción
+                if (!hidden.value && options[input.value]) select(options[input.value]);
+            });
+        }
+
+        input.addEventListener('input', () => {
+            const option = options[input.value];
+            if (option) {
+                select(option);
+                return;
+            }
+            if (hidden.value) {
+                select(null);
+            } else {
+                validate();
+            }
+            clearTimeout(timer);
+            timer = setTimeout(load, DELAY_MS);
+        });
+        input.addEventListener('focus', () => {
+            if (!list.children.length) load();
+        });
+    }
+
+    function attachAll(root) {
+        (root || document).querySelectorAll('input[data-autocomplete]').forEach(attach);
+    }
+
+    window.Autocomplete = { attach, attachAll };
+    document.addEventListener('DOMContentLoaded', () => attachAll());
+})();
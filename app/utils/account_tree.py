@@ -0,0 +1,172 @@
+from decimal import Decimal
+
+from sqlalchemy import and_, event, func, inspect, literal, or_, select, update
+
+from app import db
+from app.models import AccountAccount, JournalItem
+
+# Jerarquía de cuentas con ruta materializada (AccountAccount.path).
+# Un subárbol es el rango [path, path_upper) del índice de path, así que
+# descendientes y saldos del subárbol se resuelven en una sola consulta.
+
+SEPARATOR = '/'
+
+
+def _upper_bound(path):
+    # Todas las rutas del subárbol empiezan por "path"; el separador final se
+    # sustituye por el carácter siguiente para cerrar el rango
+    return path[:-1] + chr(ord(SEPARATOR) + 1)
+
+
+def _path_column():
+    # El rango necesita el orden por bytes: con la intercalación del idioma,
+    # PostgreSQL ignora la puntuación al comparar y el separador deja de acotarlo
+    if db.engine.dialect.name == 'postgresql':
+        return AccountAccount.path.collate('C')
+    return AccountAccount.path
+
+
+def subtree_filter(path, include_self=True):
+    column = _path_column()
+    condition = and_(column >= path, column < _upper_bound(path))
+    if not include_self:
+        condition = and_(condition, AccountAccount.path != path)
+    return condition
+
+
+def _pending_account(id_account):
+    # En un mismo flush se ejecutan todos los before_insert antes de insertar:
+    # el padre puede estar todavía solo en la sesión
+    for obj in db.session.new:
+        if isinstance(obj, AccountAccount) and obj.id_account == id_account:
+            return obj
+    return None
+
+
+def build_path(id_account, parent_account, connection=None, visiting=None):
+    """Ruta de una cuenta a partir de su cuenta padre.
+
+    Si el padre aún no tiene ruta (cuentas insertadas fuera de la aplicación)
+    se calcula subiendo por sus ancestros; un ciclo se trata como cuenta raíz.
+    """
+    if not parent_account:
+        return f"{SEPARATOR}{id_account}{SEPARATOR}"
+
+    connection = connection or db.session.connection()
+    table = AccountAccount.__table__
+    parent = connection.execute(
+        select(table.c.path, table.c.parent_account).where(table.c.id_account == parent_account)
+    ).first() or _pending_account(parent_account)
+    if parent is None:
+        raise ValueError(f"La cuenta padre {parent_account} no existe")
+
+    parent_path = parent.path
+    if parent_path is None:
+        visiting = (visiting or set()) | {id_account}
+        grandparent = None if parent.parent_account in visiting else parent.parent_account
+        parent_path = build_path(parent_account, grandparent, connection, visiting)
+    return f"{parent_path}{id_account}{SEPARATOR}"
+
+
+def _apply_path(connection, account):
+    old_path = account.path
+    new_path = build_path(account.id_account, account.parent_account, connection)
+    if new_path == old_path:
+        return
+
+    if old_path and new_path.startswith(old_path):
+        raise ValueError('La cuenta padre no puede ser la misma cuenta ni una de sus subcuentas')
+
+    account.path = new_path
+    if old_path:
+        table = AccountAccount.__table__
+        connection.execute(
+            update(table).where(subtree_filter(old_path, include_self=False)).values(
+                path=literal(new_path) + func.substr(table.c.path, len(old_path) + 1)
+            )
+        )
+
+
+def update_account_path(account):
+    """Recalcula la ruta de la cuenta y, si cambió de padre, la de todo su subárbol.
+
+    Los descendientes se actualizan con un único UPDATE que reemplaza el
+    prefijo de la ruta. Lanza ValueError si el nuevo padre está dentro del
+    subárbol de la propia cuenta. Al guardar cualquier cuenta se aplica lo
+    mismo, así que llamarla antes solo adelanta la validación.
+    """
+    _apply_path(db.session.connection(), account)
+
+
+@event.listens_for(AccountAccount, 'before_insert')
+def _path_on_insert(mapper, connection, target):
+    _apply_path(connection, target)
+
+
+@event.listens_for(AccountAccount, 'before_update')
+def _path_on_update(mapper, connection, target):
+    attrs = inspect(target).attrs
+    if (target.path is None or attrs.parent_account.history.has_changes()
+            or attrs.id_account.history.has_changes()):
+        _apply_path(connection, target)
+
+
+def account_path(account):
+    """Ruta de la cuenta, calculada si todavía no se guardó"""
+    return account.path or build_path(account.id_account, account.parent_account)
+
+
+def descendants(account):
+    """Todas las subcuentas de la cuenta, a cualquier profundidad"""
+    # Las hijas directas se incluyen aunque su ruta aún no esté calculada
+    return AccountAccount.query.filter(or_(
+        subtree_filter(account_path(account), include_self=False),
+        AccountAccount.parent_account == account.id_account
+    )).order_by(AccountAccount.path)
+
+
+def has_descendants(account):
+    return db.session.query(
+        descendants(account).with_entities(AccountAccount.id).exists()
+    ).scalar()
+
+
+def subtree_balance(account):
+    """Debe, haber y saldo de la cuenta más todas sus subcuentas"""
+    total_debit, total_credit = db.session.query(
+        func.sum(JournalItem.debit), func.sum(JournalItem.credit)
+    ).join(AccountAccount, AccountAccount.id_account == JournalItem.account_id
+    ).filter(subtree_filter(account_path(account))).one()
+
+    total_debit = Decimal(str(total_debit or 0))
+    total_credit = Decimal(str(total_credit or 0))
+    if account.nature == 'DEUDORA':
+        balance = total_debit - total_credit
+    else:
+        balance = total_credit - total_debit
+    return total_debit, total_credit, balance
+
+
+def compute_paths(parents):
+    """Rutas de todas las cuentas a partir de {id_account: parent_account}.
+
+    Usado para poblar la columna en bases existentes; padres inexistentes o
+    ciclos se tratan como cuentas raíz.
+    """
+    paths = {}
+
+    def resolve(id_account, visiting):
+        if id_account in paths:
+            return paths[id_account]
+        parent = parents.get(id_account)
+        if not parent or parent not in parents or parent in visiting:
+            path = f"{SEPARATOR}{id_account}{SEPARATOR}"
+        else:
+            visiting.add(id_account)
+            path = f"{resolve(parent, visiting)}{id_account}{SEPARATOR}"
+        paths[id_account] = path
+        return path
+
+    for id_account in parents:
+        resolve(id_account, set())
+    return paths
@@ -0,0 +1,332 @@
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import func, insert, update
+
+from app import db
+from app.models import InventoryStock, InventoryMovement, Location, Material, SaleOrder, StockReservation
+
+# Orden en que se recorren las bodegas al asignar cada material
+POLICIES = {
+    'main': 'Bodega principal primero',
+    'nearest': 'Bodega más cercana (prioridad)',
+    'largest': 'Bodega con mayor stock',
+}
+
+
+def release_expired(now=None):
+    """Marca como vencidas las reservas cuyo plazo terminó y sus ventas pendientes.
+
+    Devuelve cuántas reservas se liberaron.
+    """
+    now = now or datetime.utcnow()
+    expired = (
+        StockReservation.status == 'reservado',
+        StockReservation.expires_at < now
+    )
+    sale_ids = [sale_id for (sale_id,) in
+                db.session.query(StockReservation.id_sale_order).filter(*expired).distinct()]
+    if not sale_ids:
+        return 0
+
+    released = StockReservation.query.filter(*expired).update({'status': 'vencido'}, synchronize_session=False)
+    SaleOrder.query.filter(
+        SaleOrder.id_sale_order.in_(sale_ids),
+        SaleOrder.status == 'reservado'
+    ).update({'status': 'vencido'}, synchronize_session=False)
+    return released
+
+
+def _reserved_quantities(materials, now):
+    """Cantidad reservada vigente por (material, bodega) en una consulta agrupada"""
+    rows = db.session.query(
+        StockReservation.id_material,
+        StockReservation.id_location,
+        func.sum(StockReservation.quantity)
+    ).filter(
+        StockReservation.status == 'reservado',
+        StockReservation.expires_at >= now,
+        StockReservation.id_material.in_(materials)
+    ).group_by(StockReservation.id_material, StockReservation.id_location).all()
+    return {(mat, loc): int(qty or 0) for mat, loc, qty in rows}
+
+
+def _sort_key(policy):
+    if policy == 'nearest':
+        return lambda c: (c['priority'], not c['main'], c['location_id'])
+    if policy == 'largest':
+        return lambda c: (-c['available'], c['location_id'])
+    return lambda c: (not c['main'], c['priority'], c['location_id'])
+
+
+def _lock_stock():
+    """Bloquea las filas de stock hasta el fin de la transacción; en SQLite, toda la base.
+
+    SQLite ignora FOR UPDATE y pysqlite solo abre la transacción en la primera
+    escritura, así que dos ventas simultáneas leerían el mismo disponible. Si la
+    transacción aún no escribió se abre con BEGIN IMMEDIATE (las demás
+    escrituras esperan); si ya escribió, tiene el bloqueo de escritura.
+    """
+    connection = db.session.connection()
+    if connection.dialect.name != 'sqlite':
+        return
+    if not connection.connection.dbapi_connection.in_transaction:
+        connection.exec_driver_sql('BEGIN IMMEDIATE')
+
+
+def allocate(required, location_id=None, policy=None):
+    """Reparte la cantidad requerida de cada material entre las bodegas.
+
+    ``required`` es un dict material -> cantidad. El stock de todas las bodegas
+    activas se lee en una sola consulta (bloqueando las filas, ver _lock_stock)
+    y se descuentan las reservas vigentes de otras ventas. Con ``location_id``
+    solo se usa esa bodega. Devuelve una lista de tuplas (material, bodega, cantidad) o lanza
+    ValueError con el detalle de los faltantes.
+    """
+    policy = policy or current_app.config['ALLOCATION_POLICY']
+    if policy not in POLICIES:
+        raise ValueError(f"Política de asignación desconocida: {policy}")
+
+    now = datetime.utcnow()
+    _lock_stock()
+    query = db.session.query(
+        InventoryStock.id_material,
+        InventoryStock.id_location,
+        InventoryStock.quantity,
+        Location.main_location,
+        Location.priority
+    ).join(Location, Location.id == InventoryStock.id_location
+    ).filter(
+        InventoryStock.id_material.in_(required),
+        Location.status.is_(True)
+    )
+    if location_id:
+        query = query.filter(InventoryStock.id_location == location_id)
+    rows = query.with_for_update(of=InventoryStock).all()
+
+    reserved = _reserved_quantities(required, now)
+    candidates = {}
+    for mat_code, loc_id, quantity, main, priority in rows:
+        available = (quantity or 0) - reserved.get((mat_code, loc_id), 0)
+        if available > 0:
+            candidates.setdefault(mat_code, []).append({
+                'location_id': loc_id,
+                'available': available,
+                'main': bool(main),
+                'priority': priority or 0,
+            })
+
+    allocations = []
+    shortages = []
+    key = _sort_key(policy)
+    for mat_code, qty in required.items():
+        pending = qty
+        for candidate in sorted(candidates.get(mat_code, []), key=key):
+            take = min(pending, candidate['available'])
+            allocations.append((mat_code, candidate['location_id'], take))
+            pending -= take
+            if not pending:
+                break
+        if pending:
+            shortages.append(f"{mat_code} (disponible: {qty - pending}, requerido: {qty})")
+
+    if shortages:
+        where = "en la bodega seleccionada" if location_id else "en las bodegas"
+        raise ValueError(f"Stock insuficiente {where}: {'; '.join(shortages)}")
+    return allocations
+
+
+def split(allocations, required_by_sale):
+    """Reparte entre varias ventas lo asignado para la suma de sus cantidades.
+
+    ``required_by_sale`` es una lista de (venta, {material: cantidad}) en el
+    orden de atención; cada venta toma de las bodegas en el orden que dejó la
+    política. Devuelve un dict venta -> [(material, bodega, cantidad)].
+    """
+    pools = {}
+    for mat_code, loc_id, qty in allocations:
+        pools.setdefault(mat_code, []).append([loc_id, qty])
+
+    result = {}
+    for sale_id, required in required_by_sale:
+        rows = result.setdefault(sale_id, [])
+        for mat_code, qty in required.items():
+            pool = pools[mat_code]
+            while qty:
+                loc_id, available = pool[0]
+                take = min(qty, available)
+                rows.append((mat_code, loc_id, take))
+                qty -= take
+                if take == available:
+                    pool.pop(0)
+                else:
+                    pool[0][1] -= take
+    return result
+
+
+def reserve(sale_id, allocations, username, ttl_minutes=None):
+    """Registra en bloque las reservas de una venta"""
+    reserve_many({sale_id: allocations}, username, ttl_minutes)
+
+
+def reserve_many(allocations_by_sale, username, ttl_minutes=None):
+    """Registra en un solo INSERT las reservas de varias ventas.
+
+    ``allocations_by_sale`` es un dict venta -> [(material, bodega, cantidad)].
+    """
+    ttl = ttl_minutes or current_app.config['RESERVATION_TTL_MINUTES']
+    now = datetime.utcnow()
+    db.session.execute(insert(StockReservation), [
+        {
+            'id_sale_order': sale_id,
+            'id_location': loc_id,
+            'id_material': mat_code,
+            'quantity': qty,
+            'status': 'reservado',
+            'expires_at': now + timedelta(minutes=ttl),
+            'created_at': now,
+            'created_by': username
+        }
+        for sale_id, allocations in allocations_by_sale.items()
+        for mat_code, loc_id, qty in allocations
+    ])
+
+
+def consume(sale_id, username):
+    """Convierte las reservas vigentes de la venta en salidas de inventario"""
+    return consume_many([sale_id], username)
+
+
+def consume_many(sale_ids, username):
+    """Convierte las reservas vigentes de varias ventas en salidas de inventario.
+
+    Descuenta el stock de cada bodega (filas leídas en una consulta), escribe
+    los movimientos en bloque y marca las reservas como consumidas. Lanza
+    ValueError si alguna venta no tiene reservas vigentes.
+    """
+    now = datetime.utcnow()
+    reservations = StockReservation.query.filter(
+        StockReservation.id_sale_order.in_(sale_ids),
+        StockReservation.status == 'reservado'
+    ).order_by(StockReservation.id).all()
+    found = {r.id_sale_order for r in reservations}
+    for sale_id in sale_ids:
+        if sale_id not in found:
+            raise ValueError(f"La venta {sale_id} no tiene reservas vigentes")
+    for r in reservations:
+        if r.expires_at < now:
+            raise ValueError(f"La reserva de la venta {r.id_sale_order} venció")
+
+    materials = {r.id_material for r in reservations}
+    locations = {r.id_location for r in reservations}
+    stocks = {
+        (stock.id_material, stock.id_location): stock
+        for stock in InventoryStock.query.filter(
+            InventoryStock.id_material.in_(materials),
+            InventoryStock.id_location.in_(locations)
+        ).with_for_update()
+    }
+    units = dict(db.session.query(Material.id_material, Material.unit)
+                 .filter(Material.id_material.in_(materials)).all())
+
+    for r in reservations:
+        stock = stocks.get((r.id_material, r.id_location))
+        if stock is None or stock.quantity < r.quantity:
+            raise ValueError(f"Stock insuficiente de {r.id_material} en la bodega {r.id_location}")
+        stock.quantity -= r.quantity
+        stock.last_movement = now
+        stock.updated_at = now
+        r.status = 'consumido'
+
+    db.session.execute(insert(InventoryMovement), [
+        {
+            'id_location': r.id_location,
+            'id_material': r.id_material,
+            'quantity': r.quantity,
+            'unit_type': str(units[r.id_material]),
+            'movement_type': 'SALIDA',
+            'notes': f"Venta {r.id_sale_order}",
+            'created_at': now,
+            'updated_at': now,
+            'created_by': username
+        }
+        for r in reservations
+    ])
+    return reservations
+
+
+def release(sale_id):
+    """Libera las reservas vigentes de la venta. Devuelve cuántas"""
+    return StockReservation.query.filter(
+        StockReservation.id_sale_order == sale_id,
+        StockReservation.status == 'reservado'
+    ).update({'status': 'liberado'}, synchronize_session=False)
+
+
+def restock(sale_id, quantities, username):
+    """Devuelve a las bodegas de origen las cantidades de una venta despachada.
+
+    ``quantities`` es un dict material -> cantidad. Se reparte sobre las
+    reservas consumidas de la venta (lo no devuelto de cada una), se suma al
+    stock con una consulta IN y se escriben los movimientos de ENTRADA en
+    bloque. Lanza ValueError si la venta no tiene salidas suficientes.
+    """
+    now = datetime.utcnow()
+    reservations = StockReservation.query.filter(
+        StockReservation.id_sale_order == sale_id,
+        StockReservation.status == 'consumido',
+        StockReservation.id_material.in_(quantities)
+    ).order_by(StockReservation.id).all()
+
+    # Cantidad a devolver por (material, bodega)
+    placed = {}
+    reservation_updates = []
+    for mat_code, qty in quantities.items():
+        pending = qty
+        for r in reservations:
+            if r.id_material != mat_code or not pending:
+                continue
+            take = min(pending, r.quantity - (r.returned_quantity or 0))
+            if take <= 0:
+                continue
+            reservation_updates.append({'id': r.id, 'returned_quantity': (r.returned_quantity or 0) + take})
+            placed[(mat_code, r.id_location)] = placed.get((mat_code, r.id_location), 0) + take
+            pending -= take
+        if pending:
+            raise ValueError(f"No se encontraron salidas de inventario de {mat_code} para la venta {sale_id}")
+
+    db.session.execute(update(StockReservation), reservation_updates)
+
+    units = dict(db.session.query(Material.id_material, Material.unit)
+                 .filter(Material.id_material.in_(quantities)).all())
+    stocks = {
+        (stock.id_material, stock.id_location): stock
+        for stock in InventoryStock.query.filter(
+            InventoryStock.id_material.in_(quantities),
+            InventoryStock.id_location.in_({loc_id for _, loc_id in placed})
+        ).with_for_update()
+    }
+    for (mat_code, loc_id), qty in placed.items():
+        stock = stocks.get((mat_code, loc_id))
+        if stock is None:
+            stock = InventoryStock(id_location=loc_id, id_material=mat_code, quantity=0,
+                                   unit_type=str(units[mat_code]), created_by=username)
+            db.session.add(stock)
+        stock.quantity = (stock.quantity or 0) + qty
+        stock.last_movement = now
+        stock.updated_at = now
+
+    db.session.execute(insert(InventoryMovement), [
+        {
+            'id_location': loc_id,
+            'id_material': mat_code,
+            'quantity': qty,
+            'unit_type': str(units[mat_code]),
+            'movement_type': 'ENTRADA',
+            'notes': f"Devolución venta {sale_id}",
+            'created_at': now,
+            'updated_at': now,
+            'created_by': username
+        }
+        for (mat_code, loc_id), qty in placed.items()
+    ])
@@ -0,0 +1,48 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import update
+
+from app import db
+from app.models import Customer, Material, Supplier
+
+ARCHIVE_SOURCES = {
+    'material': Material,
+    'customer': Customer,
+    'supplier': Supplier,
+}
+
+# Días sin cambios que debe llevar un registro inactivo para archivarse
+ARCHIVE_AFTER_DAYS = 365
+
+
+def active(query, model, include_archived=False):
+    """La consulta sin las filas archivadas, salvo que se pidan explícitamente.
+
+    Las filas quedan en la misma tabla; los índices parciales de la grilla
+    (WHERE archived_at IS NULL) solo contienen las vigentes.
+    """
+    if include_archived:
+        return query
+    return query.filter(model.archived_at.is_(None))
+
+
+def archive_inactive(entity, days=ARCHIVE_AFTER_DAYS, now=None):
+    """Archiva los registros inactivos sin cambios en los últimos ``days`` días.
+
+    Es un UPDATE por tabla que no toca updated_at. Los clientes con saldo por
+    cobrar no se archivan. Un registro archivado vuelve a quedar vigente al
+    activarlo o al cargarlo de nuevo por CSV. Devuelve cuántos se archivaron.
+    No hace commit.
+    """
+    model = ARCHIVE_SOURCES[entity]
+    now = now or datetime.utcnow()
+    conditions = [
+        model.status == False,  # noqa: E712
+        model.archived_at.is_(None),
+        model.updated_at < now - timedelta(days=days),
+    ]
+    if model is Customer:
+        conditions.append(Customer.receivable_balance == 0)
+    return db.session.execute(
+        update(model).where(*conditions).values(archived_at=now, updated_at=model.updated_at)
+    ).rowcount
@@ -0,0 +1,74 @@
+from collections import namedtuple
+
+from sqlalchemy import func, select
+
+from app import db
+from app.models import Customer, Location, Material, Supplier
+from app.utils.cache import LRUCache
+from app.utils.reference import watch
+
+# value: lo que envía el formulario; code y name: columnas buscadas por prefijo
+# (índices sobre lower(...)); extra: columnas adicionales devueltas al navegador
+Source = namedtuple('Source', ['model', 'value', 'code', 'name', 'extra'])
+
+AUTOCOMPLETE_SOURCES = {
+    'material': Source(Material, 'id_material', 'id_material', 'name', ('unit',)),
+    'customer': Source(Customer, 'id_customer', 'id_customer', 'name', ('currency',)),
+    'supplier': Source(Supplier, 'id_suplier', 'id_suplier', 'name', ('currency',)),
+    'location': Source(Location, 'id', 'code', 'name', ()),
+}
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 50
+
+# Las mismas teclas se repiten entre usuarios y formularios
+CACHE_SIZE = 2048
+CACHE_TTL = 60
+
+_cache = LRUCache(maxsize=CACHE_SIZE, ttl=CACHE_TTL)
+
+# Contador 'autocomplete' en reference_version: un alta, cambio o baja
+# confirmada vacía la caché de todos los procesos en su siguiente petición.
+# Las cargas masivas, que escriben fuera de la sesión, llaman a
+# bump_version(AUTOCOMPLETE_VERSION)
+AUTOCOMPLETE_VERSION = 'autocomplete'
+watch(AUTOCOMPLETE_VERSION, _cache, {source.model for source in AUTOCOMPLETE_SOURCES.values()})
+
+
+def _prefix(column, prefix):
+    """Rango equivalente a lower(column) LIKE 'prefix%' que usa el índice sobre lower(column)"""
+    lowered = func.lower(column)
+    return lowered >= prefix, lowered < prefix + '\uffff'
+
+
+def _lookup(entity, prefix, limit):
+    source = AUTOCOMPLETE_SOURCES[entity]
+    model = source.model
+    code, name = getattr(model, source.code), getattr(model, source.name)
+    columns = [getattr(model, source.value), code, name] + [getattr(model, col) for col in source.extra]
+    base = select(*columns).where(model.status == True)  # noqa: E712
+
+    if not prefix:
+        rows = db.session.execute(base.order_by(func.lower(code)).limit(limit)).all()
+    else:
+        # Primero coincidencias por código, luego por nombre
+        rows = db.session.execute(base.where(*_prefix(code, prefix)).order_by(func.lower(code)).limit(limit)).all()
+        if len(rows) < limit:
+            seen = {row[0] for row in rows}
+            by_name = db.session.execute(
+                base.where(*_prefix(name, prefix)).order_by(func.lower(name)).limit(limit)
+            ).all()
+            rows += [row for row in by_name if row[0] not in seen][:limit - len(rows)]
+
+    return tuple(
+        dict({'id': row[0], 'text': f"{row[1]} - {row[2]}"}, **dict(zip(source.extra, row[3:])))
+        for row in rows
+    )
+
+
+def autocomplete(entity, prefix='', limit=None):
+    """Opciones activas de la entidad cuyo código o nombre empieza por ``prefix``
+    (sin distinguir mayúsculas), como lista de {'id', 'text', ...extra}"""
+    prefix = (prefix or '').strip().lower()
+    limit = min(max(limit or DEFAULT_LIMIT, 1), MAX_LIMIT)
+    return list(_cache.get((entity, prefix, limit), lambda: _lookup(entity, prefix, limit)))
@@ -0,0 +1,235 @@
+import csv
+import time
+from datetime import datetime
+
+from sqlalchemy import bindparam, select
+
+from app import db
+from app.models import Customer, Material, Supplier
+from app.utils.autocomplete import AUTOCOMPLETE_VERSION
+from app.utils.reference import bump_version, reference_cache
+
+# Filas por bloque de INSERT/UPDATE; la memoria usada no depende del tamaño del archivo
+CHUNK_SIZE = 2000
+
+# Errores que se conservan con detalle (el resto solo se cuenta)
+MAX_ERRORS = 10
+
+
+class ImportResult:
+    """Conteos y duración de una carga masiva"""
+
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.error_count = 0
+        self.errors = []
+        self.started = time.perf_counter()
+        self.seconds = 0.0
+
+    def error(self, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append(message)
+
+    @property
+    def rows(self):
+        return self.created + self.updated
+
+    @property
+    def rate(self):
+        """Filas por segundo"""
+        return self.rows / self.seconds if self.seconds else 0.0
+
+
+class BulkUpserter:
+    """Inserta o actualiza filas de un modelo por su código en bloques de tamaño fijo.
+
+    Las filas se acumulan hasta ``chunk_size`` y cada bloque se escribe con un
+    INSERT de varias filas para las nuevas y un UPDATE por id ejecutado en
+    bloque (executemany) para las existentes, directamente sobre la tabla sin
+    pasar por el ORM. Con ``preload`` el mapa código -> id de las filas
+    existentes se carga una vez (solo esas dos columnas); sin él, los ids de
+    cada bloque se resuelven con una consulta IN y la memoria no depende del
+    tamaño de la tabla. Un código repetido en el archivo actualiza la fila
+    anterior (gana la última aparición). Las columnas de ``insert_only``
+    (p. ej. created_by) no se tocan al actualizar. No hace commit.
+    """
+
+    def __init__(self, model, key, result, chunk_size=CHUNK_SIZE, insert_only=('created_by',), preload=True):
+        self.model = model
+        self.key = key
+        self.key_column = getattr(model, key)
+        self.table = model.__table__
+        self.result = result
+        self.chunk_size = chunk_size
+        self.insert_only = insert_only
+        self.ids = dict(db.session.execute(select(self.key_column, model.id)).all()) if preload else None
+        self._pending = {}
+
+    def add(self, values):
+        # Repetido dentro del bloque: reemplaza la fila pendiente y se cuenta una
+        # sola vez, como alta o como actualización según exista en la tabla
+        self._pending[values[self.key]] = values
+        if len(self._pending) >= self.chunk_size:
+            self.flush()
+
+    def _existing_ids(self, codes):
+        if self.ids is not None:
+            return {code: self.ids[code] for code in codes if code in self.ids}
+        return dict(db.session.execute(
+            select(self.key_column, self.model.id).where(self.key_column.in_(codes))
+        ).all())
+
+    def flush(self):
+        if not self._pending:
+            return
+        existing = self._existing_ids(list(self._pending))
+        inserts = []
+        updates = []
+        for code, values in self._pending.items():
+            if code in existing:
+                values = {column: value for column, value in values.items() if column not in self.insert_only}
+                values['_id'] = existing[code]
+                updates.append(values)
+            else:
+                inserts.append(values)
+        self._pending.clear()
+
+        if inserts:
+            db.session.execute(self.table.insert(), inserts)
+            if self.ids is not None:
+                # Ids de las filas nuevas para resolver códigos repetidos más adelante
+                self.ids.update(db.session.execute(
+                    select(self.key_column, self.model.id).where(
+                        self.key_column.in_([values[self.key] for values in inserts]))
+                ).all())
+        if updates:
+            columns = [column for column in updates[0] if column != '_id']
+            db.session.execute(
+                self.table.update().where(self.table.c.id == bindparam('_id')).values(
+                    {column: bindparam(column) for column in columns}
+                ),
+                updates
+            )
+        self.result.created += len(inserts)
+        self.result.updated += len(updates)
+
+    def finish(self):
+        self.flush()
+        self.result.seconds = time.perf_counter() - self.result.started
+        return self.result
+
+
+def import_materials(stream, username, chunk_size=CHUNK_SIZE):
+    """Carga el CSV de materiales (plantilla de materials.download_template).
+
+    Columnas: ID_Material, Nombre, Descripcion, Unidad, Tipo, Estado. Lee el
+    archivo fila por fila; los tipos de material válidos y las claves enteras
+    de unidad y tipo salen de los datos de referencia en memoria.
+    Devuelve un ImportResult. No hace commit.
+    """
+    result = ImportResult()
+    reader = csv.reader(stream)
+    next(reader, None)  # encabezado
+
+    reference = reference_cache.get()
+    types = {material_type.name: material_type.id for material_type in reference.material_types}
+    units = {}
+    for unit in sorted(reference.units, key=lambda unit: unit.id):
+        units.setdefault(unit.symbol, unit.id)
+    upserter = BulkUpserter(Material, 'id_material', result, chunk_size)
+    now = datetime.utcnow()
+
+    for row_num, row in enumerate(reader, start=2):
+        if len(row) < 6:
+            result.error(f"Fila {row_num}: No tiene suficientes columnas")
+            continue
+        id_material, name, description, unit, material_type, status_str = row[:6]
+        if not id_material or not name or not unit or not material_type:
+            result.error(f"Fila {row_num}: Campos obligatorios faltantes")
+            continue
+        if material_type not in types:
+            result.error(f"Fila {row_num}: Tipo de material '{material_type}' no existe")
+            continue
+
+        upserter.add({
+            'id_material': id_material,
+            'name': name,
+            'description': description,
+            'unit': unit,
+            'type': material_type,
+            'unit_id': units.get(unit),
+            'type_id': types[material_type],
+            'status': status_str.strip() == '1' if status_str else True,
+            'archived_at': None,  # Cargarlo de nuevo lo devuelve a los vigentes
+            'updated_at': now,
+            'created_by': username,
+        })
+
+    bump_version(AUTOCOMPLETE_VERSION)
+    return upserter.finish()
+
+
+# Columnas de la plantilla de clientes y proveedores después del código
+PARTY_COLUMNS = [
+    'legal_name', 'name', 'country', 'currency', 'text_id', 'state_province', 'city', 'address',
+    'zip_code', 'phone', 'email', 'contact_name', 'contact_role', 'category', 'payments_terms',
+    'payment_method', 'bank_account',
+]
+
+
+def _import_parties(stream, model, key, username, chunk_size):
+    """Carga clientes o proveedores: código, PARTY_COLUMNS y Estado (19 columnas).
+
+    Países y monedas salen de los datos de referencia en memoria (la moneda
+    se indica por símbolo y se guarda su nombre). Los registros existentes se resuelven por
+    bloque con una consulta IN.
+    """
+    result = ImportResult()
+    reader = csv.reader(stream)
+    next(reader, None)  # encabezado
+
+    reference = reference_cache.get()
+    countries = {country.name for country in reference.countries}
+    currencies = reference.currency_names
+    upserter = BulkUpserter(model, key, result, chunk_size, preload=False)
+    now = datetime.utcnow()
+
+    for row_num, row in enumerate(reader, start=2):
+        if len(row) < 19:
+            result.error(f"Fila {row_num}: No tiene suficientes columnas")
+            continue
+        code, status_str = row[0], row[18]
+        values = dict(zip(PARTY_COLUMNS, row[1:18]))
+        if not code or not values['legal_name'] or not values['name'] or not values['country'] \
+                or not values['currency']:
+            result.error(f"Fila {row_num}: Campos obligatorios faltantes")
+            continue
+        if values['country'] not in countries:
+            result.error(f"Fila {row_num}: País '{values['country']}' no existe")
+            continue
+        if values['currency'] not in currencies:
+            result.error(f"Fila {row_num}: Moneda '{values['currency']}' no existe. Use símbolos como MXN, USD, EUR")
+            continue
+
+        values[key] = code
+        values['currency'] = currencies[values['currency']]  # Guardar nombre de la moneda
+        values['status'] = status_str.strip() == '1' if status_str else True
+        values['archived_at'] = None
+        values['updated_at'] = now
+        values['created_by'] = username
+        upserter.add(values)
+
+    bump_version(AUTOCOMPLETE_VERSION)
+    return upserter.finish()
+
+
+def import_customers(stream, username, chunk_size=CHUNK_SIZE):
+    """Carga el CSV de clientes (plantilla de customers.download_template). No hace commit"""
+    return _import_parties(stream, Customer, 'id_customer', username, chunk_size)
+
+
+def import_suppliers(stream, username, chunk_size=CHUNK_SIZE):
+    """Carga el CSV de proveedores (plantilla de suppliers.download_template). No hace commit"""
+    return _import_parties(stream, Supplier, 'id_suplier', username, chunk_size)
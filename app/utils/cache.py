@@ -0,0 +1,123 @@
+import hashlib
+import threading
+import time
+from bisect import bisect_left
+from collections import OrderedDict, namedtuple
+
+
+class VersionedCache:
+    """Caché en memoria con número de versión, se recarga al invalidarse"""
+
+    def __init__(self, loader):
+        self._loader = loader
+        self._lock = threading.Lock()
+        self._data = None
+        self.version = 0
+
+    def get(self):
+        data = self._data
+        if data is None:
+            with self._lock:
+                if self._data is None:
+                    self._data = self._loader()
+                data = self._data
+        return data
+
+    def invalidate(self):
+        with self._lock:
+            self.version += 1
+            self._data = None
+
+
+class LRUCache:
+    """Caché en memoria de tamaño fijo: descarta la entrada usada hace más tiempo
+    y las que superan ``ttl`` segundos"""
+
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._data = OrderedDict()
+
+    def get(self, key, loader):
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[0] > now:
+                self._data.move_to_end(key)
+                return item[1]
+
+        value = loader()
+        with self._lock:
+            self._data[key] = (now + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+        return value
+
+    def invalidate(self, match=None):
+        """Vacía la caché, o solo las entradas para las que ``match(key, value)`` es verdadero"""
+        with self._lock:
+            if match is None:
+                self._data.clear()
+                return
+            for key in [key for key, (_, value) in self._data.items() if match(key, value)]:
+                del self._data[key]
+
+
+# ================================
+# Plan de cuentas activo
+# ================================
+
+AccountOption = namedtuple('AccountOption', ['id_account', 'code', 'name', 'text'])
+
+
+class AccountSnapshot:
+    """Listado inmutable de cuentas activas ordenado por código, con índices de prefijo"""
+
+    def __init__(self, accounts):
+        self.accounts = accounts
+        # El ETag depende del contenido, así coincide entre procesos distintos
+        digest = hashlib.sha1('\n'.join(f"{acc.id_account}|{acc.text}" for acc in accounts).encode('utf-8'))
+        self.etag = digest.hexdigest()
+        self._codes, self._code_order = self._build_index(accounts, 'code')
+        self._names, self._name_order = self._build_index(accounts, 'name')
+
+    @staticmethod
+    def _build_index(accounts, attr):
+        order = sorted(range(len(accounts)), key=lambda i: getattr(accounts[i], attr).lower())
+        return [getattr(accounts[i], attr).lower() for i in order], order
+
+    def search(self, prefix, limit=None):
+        """Cuentas cuyo código o nombre empieza por el prefijo (búsqueda binaria)"""
+        prefix = prefix.lower()
+        upper = prefix + '\uffff'
+        found = []
+        seen = set()
+
+        for keys, order in ((self._codes, self._code_order), (self._names, self._name_order)):
+            for pos in range(bisect_left(keys, prefix), bisect_left(keys, upper)):
+                i = order[pos]
+                if i not in seen:
+                    seen.add(i)
+                    found.append(self.accounts[i])
+                    if limit and len(found) >= limit:
+                        return found
+        return found
+
+
+def _load_active_accounts():
+    from app.models import AccountAccount
+
+    rows = AccountAccount.query.with_entities(
+        AccountAccount.id_account, AccountAccount.code, AccountAccount.name
+    ).filter_by(status=True).order_by(AccountAccount.code).all()
+
+    accounts = tuple(
+        AccountOption(id_account, code, name, f"{code} - {name}")
+        for id_account, code, name in rows
+    )
+    return AccountSnapshot(accounts)
+
+
+account_cache = VersionedCache(_load_active_accounts)
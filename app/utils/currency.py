@@ -0,0 +1,230 @@
+from bisect import bisect_right
+from datetime import datetime
+from decimal import Decimal, ROUND_HALF_UP
+
+from flask import current_app
+from sqlalchemy import func
+
+from app import db
+from app.models import AccountAccount, ExchangeRate, JournalEntry, JournalItem
+from app.utils.cache import VersionedCache
+from app.utils.reference import watch
+from app.utils.sequences import next_number
+
+CENT = Decimal('0.01')
+
+
+def functional_currency():
+    return current_app.config['FUNCTIONAL_CURRENCY']
+
+
+def _to_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    return value
+
+
+class RateIndex:
+    """Tipos de cambio ordenados por fecha para cada moneda, búsqueda con bisect"""
+
+    def __init__(self, rows):
+        self._dates = {}
+        self._rates = {}
+        for currency, rate_date, rate in rows:
+            self._dates.setdefault(currency, []).append(rate_date)
+            self._rates.setdefault(currency, []).append(Decimal(str(rate)))
+
+    def rate_at(self, currency, on_date):
+        """Último tipo de cambio vigente en la fecha, o None si no hay ninguno"""
+        if currency == functional_currency():
+            return Decimal('1')
+        dates = self._dates.get(currency)
+        if not dates:
+            return None
+        pos = bisect_right(dates, _to_date(on_date))
+        if pos == 0:
+            return None
+        return self._rates[currency][pos - 1]
+
+
+def _load_rate_index():
+    rows = db.session.query(
+        ExchangeRate.currency, ExchangeRate.date, ExchangeRate.rate
+    ).order_by(ExchangeRate.currency, ExchangeRate.date).all()
+    return RateIndex(rows)
+
+
+rate_cache = VersionedCache(_load_rate_index)
+
+# Contador 'exchange_rate' en reference_version: todos los procesos recargan los
+# tipos de cambio en su siguiente petición. La carga masiva, que escribe fuera
+# de la sesión, llama a bump_version(RATES_VERSION)
+RATES_VERSION = 'exchange_rate'
+watch(RATES_VERSION, rate_cache, (ExchangeRate,))
+
+
+def set_amount_currency(items, on_date):
+    """Completa amount_currency en las líneas de asiento de cuentas en moneda extranjera.
+
+    Los importes de debe/haber están en moneda funcional; se convierten con el
+    tipo de cambio vigente en la fecha del asiento. Lanza ValueError si falta.
+    """
+    account_ids = {item.account_id for item in items}
+    if not account_ids:
+        return
+
+    currencies = dict(db.session.query(AccountAccount.id_account, AccountAccount.currency_id)
+                      .filter(AccountAccount.id_account.in_(account_ids)).all())
+    index = rate_cache.get()
+    functional = functional_currency()
+
+    for item in items:
+        currency = currencies.get(item.account_id)
+        if not currency or currency == functional:
+            continue
+        rate = index.rate_at(currency, on_date)
+        if not rate:
+            raise ValueError(f"No hay tipo de cambio para {currency} al {_to_date(on_date)}")
+        item.amount_currency = _foreign_amount(item.debit, item.credit, rate)
+
+
+def _foreign_amount(debit, credit, rate):
+    amount = Decimal(str(debit or 0)) - Decimal(str(credit or 0))
+    return (amount / rate).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def backfill_amount_currency():
+    """Completa amount_currency en las líneas de cuentas en moneda extranjera que no lo tienen.
+
+    Son las líneas registradas antes de guardar el importe en moneda de la
+    cuenta; se convierten con el tipo de cambio vigente en la fecha de su
+    asiento. Las que aún no tienen tipo de cambio quedan sin completar (y la
+    revaluación omite su cuenta). Devuelve cuántas líneas se completaron. No
+    hace commit.
+    """
+    rows = db.session.query(
+        JournalItem.id, JournalItem.debit, JournalItem.credit, AccountAccount.currency_id, JournalEntry.date
+    ).join(AccountAccount, AccountAccount.id_account == JournalItem.account_id
+    ).join(JournalEntry, JournalEntry.id == JournalItem.entry_id
+    ).filter(JournalItem.amount_currency.is_(None)
+    ).filter(AccountAccount.currency_id != functional_currency()).all()
+
+    index = rate_cache.get()
+    updates = []
+    for id_, debit, credit, currency, on_date in rows:
+        rate = index.rate_at(currency, on_date)
+        if rate:
+            updates.append({'id': id_, 'amount_currency': _foreign_amount(debit, credit, rate)})
+    db.session.bulk_update_mappings(JournalItem, updates)
+    return len(updates)
+
+
+def compute_revaluation(on_date):
+    """Ajustes de revaluación de todas las cuentas en moneda extranjera a la fecha.
+
+    Una sola consulta agrupada trae el saldo en moneda extranjera y el saldo en
+    libros de cada cuenta; el ajuste es saldo extranjero * tipo de cambio - libros.
+    Las cuentas con líneas sin amount_currency (ver backfill_amount_currency) no
+    se revalúan: su saldo extranjero estaría incompleto y el ajuste borraría el
+    saldo en libros. Devuelve (ajustes, monedas_sin_tipo_de_cambio,
+    cuentas_incompletas).
+    """
+    on_date = _to_date(on_date)
+    functional = functional_currency()
+
+    rows = db.session.query(
+        AccountAccount.id_account,
+        AccountAccount.code,
+        AccountAccount.name,
+        AccountAccount.currency_id,
+        func.sum(JournalItem.amount_currency),
+        func.sum(JournalItem.debit),
+        func.sum(JournalItem.credit),
+        func.count(JournalItem.id) - func.count(JournalItem.amount_currency)
+    ).join(JournalItem, JournalItem.account_id == AccountAccount.id_account
+    ).join(JournalEntry, JournalEntry.id == JournalItem.entry_id
+    ).filter(AccountAccount.currency_id != functional
+    ).filter(JournalEntry.date <= on_date
+    ).group_by(AccountAccount.id_account, AccountAccount.code,
+               AccountAccount.name, AccountAccount.currency_id).all()
+
+    index = rate_cache.get()
+    adjustments = []
+    missing = set()
+    incomplete = []
+    for id_account, code, name, currency, foreign, debit, credit, pending in rows:
+        if pending:
+            incomplete.append(f"{code} - {name}")
+            continue
+        rate = index.rate_at(currency, on_date)
+        if rate is None:
+            missing.add(currency)
+            continue
+        foreign = Decimal(str(foreign or 0))
+        book = Decimal(str(debit or 0)) - Decimal(str(credit or 0))
+        revalued = (foreign * rate).quantize(CENT, rounding=ROUND_HALF_UP)
+        adjustment = revalued - book
+        if adjustment:
+            adjustments.append({
+                'id_account': id_account,
+                'code': code,
+                'name': name,
+                'currency': currency,
+                'rate': rate,
+                'foreign_balance': foreign,
+                'book_balance': book,
+                'revalued_balance': revalued,
+                'adjustment': adjustment,
+            })
+    return adjustments, sorted(missing), incomplete
+
+
+def post_revaluation(on_date, gain_account, loss_account, username):
+    """Registra un único asiento con los ajustes de revaluación.
+
+    La contrapartida se agrega en una línea de utilidad cambiaria (haber) y otra
+    de pérdida cambiaria (debe). Lanza ValueError si alguna cuenta tiene líneas
+    sin importe en moneda extranjera. Devuelve (asiento o None, ajustes,
+    monedas_sin_tipo).
+    """
+    adjustments, missing, incomplete = compute_revaluation(on_date)
+    if incomplete:
+        raise ValueError(f"Cuentas con líneas sin importe en moneda extranjera: {', '.join(incomplete)}")
+    if not adjustments:
+        return None, adjustments, missing
+
+    entry = JournalEntry(
+        number=next_number('journal'),
+        date=_to_date(on_date),
+        description=f"Revaluación de moneda extranjera al {_to_date(on_date)}",
+        reference='REVAL',
+        created_by=username
+    )
+    db.session.add(entry)
+    db.session.flush()
+
+    total_gain = Decimal('0')
+    total_loss = Decimal('0')
+    items = []
+    for adj in adjustments:
+        amount = adj['adjustment']
+        if amount > 0:
+            total_gain += amount
+        else:
+            total_loss += -amount
+        # El ajuste no cambia el saldo en moneda extranjera
+        items.append(JournalItem(
+            entry_id=entry.id,
+            account_id=adj['id_account'],
+            debit=amount if amount > 0 else 0,
+            credit=-amount if amount < 0 else 0,
+            amount_currency=0
+        ))
+
+    if total_gain:
+        items.append(JournalItem(entry_id=entry.id, account_id=gain_account, debit=0, credit=total_gain))
+    if total_loss:
+        items.append(JournalItem(entry_id=entry.id, account_id=loss_account, debit=total_loss, credit=0))
+
+    db.session.add_all(items)
+    return entry, adjustments, missing
@@ -0,0 +1,229 @@
+import re
+import unicodedata
+from collections import Counter, defaultdict, namedtuple
+from datetime import datetime
+from functools import lru_cache
+from itertools import combinations
+
+from sqlalchemy import delete, select, update
+
+from app import db
+from app.models import (
+    Customer, CustomerPayment, PurchaseOrder, SaleOrder, SaleQuotation, SalesDailySummary, Supplier
+)
+from app.utils import sales_cube
+
+# Entidad: (modelo, columna del código)
+DEDUP_SOURCES = {
+    'customer': (Customer, 'id_customer'),
+    'supplier': (Supplier, 'id_suplier'),
+}
+
+# Palabras que no distinguen una empresa de otra (formas societarias y artículos)
+STOP_WORDS = {
+    'sa', 'de', 'cv', 'sapi', 'sab', 'srl', 'rl', 'sc', 'sas', 'spa', 'ltda', 'ltd', 'inc', 'llc', 'corp',
+    'co', 'cia', 'gmbh', 'y', 'e', 'la', 'el', 'los', 'las', 'del', 'and', 'the', 'company',
+}
+
+# RFC genéricos (público en general, extranjeros): los comparten muchos registros distintos
+GENERIC_TAX_IDS = {'XAXX010101000', 'XEXX010101000'}
+
+# Un bloque con más registros que esto viene de una clave demasiado común y no
+# se compara; así el número de pares crece casi linealmente con la tabla
+MAX_BLOCK_SIZE = 50
+
+# Trigramas más raros de cada nombre que se usan como clave de bloque
+RARE_TRIGRAMS = 3
+
+# Similitud mínima de la razón social (Jaccard de trigramas) para reportar un par sin RFC en común
+MIN_SCORE = 0.6
+
+Record = namedtuple('Record', ['id', 'code', 'legal_name', 'name', 'text_id', 'status'])
+Candidate = namedtuple('Candidate', ['first', 'second', 'score', 'reasons'])
+
+
+def normalize_tax_id(value):
+    """RFC / identificación fiscal sin espacios, guiones ni puntos, en mayúsculas"""
+    value = re.sub(r'[^0-9A-Z]', '', (value or '').upper())
+    return value if len(value) >= 5 and value not in GENERIC_TAX_IDS else ''
+
+
+def normalize_name(value):
+    """Nombre en minúsculas, sin acentos, signos ni formas societarias"""
+    value = unicodedata.normalize('NFKD', value or '')
+    value = ''.join(ch for ch in value if not unicodedata.combining(ch)).lower()
+    value = value.replace('.', '')  # S.A. de C.V. -> sa de cv
+    return ' '.join(token for token in re.findall(r'[a-z0-9]+', value) if token not in STOP_WORDS)
+
+
+_PHONETIC_RULES = [
+    (re.compile(r'll'), 'y'),
+    (re.compile(r'ch'), 'x'),
+    (re.compile(r'qu'), 'k'),
+    (re.compile(r'c(?=[ei])'), 's'),
+    (re.compile(r'[cq]'), 'k'),
+    (re.compile(r'z'), 's'),
+    (re.compile(r'v'), 'b'),
+    (re.compile(r'w'), 'u'),
+    (re.compile(r'ph'), 'f'),
+    (re.compile(r'h'), ''),
+    (re.compile(r'(.)\1+'), r'\1'),
+]
+
+
+@lru_cache(maxsize=65536)
+def _phonetic_word(word):
+    for pattern, replacement in _PHONETIC_RULES:
+        word = pattern.sub(replacement, word)
+    return word[:1] + re.sub(r'[aeiouy]', '', word[1:])
+
+
+def phonetic(name):
+    """Clave fonética simple (español): letras que suenan igual unificadas y sin vocales
+    salvo la inicial de cada palabra, p. ej. 'lopez vazquez' y 'lopes basques'"""
+    return ' '.join(key for key in map(_phonetic_word, name.split()) if key)
+
+
+@lru_cache(maxsize=65536)
+def _word_trigrams(word):
+    padded = f'  {word} '
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def trigrams(name):
+    """Trigramas por palabra (con espacios de relleno, como pg_trgm)"""
+    # Las palabras se repiten mucho entre razones sociales: se calculan una vez
+    grams = set()
+    for word in name.split():
+        grams |= _word_trigrams(word)
+    return grams
+
+
+def similarity(a, b):
+    ga, gb = trigrams(a), trigrams(b)
+    if not ga or not gb:
+        return 0.0
+    return len(ga & gb) / len(ga | gb)
+
+
+def _load(entity, include_inactive):
+    model, code = DEDUP_SOURCES[entity]
+    query = select(model.id, getattr(model, code), model.legal_name, model.name, model.text_id, model.status)
+    if not include_inactive:
+        query = query.where(model.status == True)  # noqa: E712
+    return [Record(*row) for row in db.session.execute(query)]
+
+
+def _blocks(records, names):
+    """Claves de bloque -> índices de registros: RFC, clave fonética y trigramas raros"""
+    counts = Counter()
+    for name in names:
+        counts.update(trigrams(name))
+
+    blocks = defaultdict(list)
+    for i, (record, name) in enumerate(zip(records, names)):
+        tax_id = normalize_tax_id(record.text_id)
+        if tax_id:
+            blocks[('rfc', tax_id)].append(i)
+        if name:
+            blocks[('fonetica', phonetic(name))].append(i)
+            # Un trigrama que solo aparece en este registro no puede emparejarlo con otro
+            shared = sorted((counts[gram], gram) for gram in trigrams(name) if counts[gram] > 1)
+            for _, gram in shared[:RARE_TRIGRAMS]:
+                blocks[('trigrama', gram)].append(i)
+    return blocks
+
+
+def find_duplicates(entity, min_score=MIN_SCORE, include_inactive=True, limit=None):
+    """Pares de posibles duplicados de la entidad, de mayor a menor similitud.
+
+    Solo se comparan registros que comparten una clave de bloque (RFC
+    normalizado, clave fonética del nombre o uno de sus trigramas menos
+    frecuentes), por lo que el trabajo es casi lineal en el tamaño de la
+    tabla en lugar de comparar todos contra todos. Un par con el mismo RFC se
+    reporta siempre; los demás si su similitud de nombre llega a ``min_score``.
+    """
+    records = _load(entity, include_inactive)
+    names = [normalize_name(record.legal_name) for record in records]
+
+    reasons = defaultdict(set)
+    for (kind, _), members in _blocks(records, names).items():
+        if len(members) < 2 or len(members) > MAX_BLOCK_SIZE:
+            continue
+        for i, j in combinations(members, 2):
+            reasons[(i, j) if i < j else (j, i)].add(kind)
+
+    candidates = []
+    for (i, j), kinds in reasons.items():
+        score = similarity(names[i], names[j])
+        if 'rfc' in kinds or score >= min_score:
+            first, second = sorted((records[i], records[j]), key=lambda record: record.id)
+            candidates.append(Candidate(first, second, round(score, 3), sorted(kinds)))
+
+    candidates.sort(key=lambda c: ('rfc' not in c.reasons, -c.score, c.first.code))
+    return candidates[:limit] if limit else candidates
+
+
+# Datos de contacto que el registro conservado toma de un duplicado si no los tiene
+FILL_COLUMNS = ['text_id', 'state_province', 'city', 'address', 'zip_code', 'phone', 'email',
+                'contact_name', 'contact_role', 'category', 'payments_terms', 'payment_method', 'bank_account']
+
+
+def _repoint(column, duplicate_codes, keep_code, **values):
+    return db.session.execute(
+        update(column.class_).where(column.in_(duplicate_codes)).values({column.key: keep_code, **values})
+    ).rowcount
+
+
+def merge(entity, keep_code, duplicate_codes):
+    """Une los duplicados en ``keep_code`` dentro de la transacción actual (sin commit).
+
+    Las referencias (ventas, cotizaciones y cobros de clientes; órdenes de
+    compra de proveedores) se reasignan con un UPDATE por tabla, el saldo por
+    cobrar se suma y los datos de contacto vacíos se completan con los del
+    duplicado. Luego se eliminan los duplicados. Devuelve filas reasignadas
+    por tabla. Lanza ValueError si algún código no existe.
+    """
+    model, code = DEDUP_SOURCES[entity]
+    code_column = getattr(model, code)
+    duplicate_codes = [c for c in dict.fromkeys(duplicate_codes) if c and c != keep_code]
+    if not duplicate_codes:
+        raise ValueError("No se indicaron registros para unir")
+
+    keep = model.query.filter(code_column == keep_code).first()
+    if keep is None:
+        raise ValueError(f"El registro {keep_code} no existe")
+    duplicates = model.query.filter(code_column.in_(duplicate_codes)).order_by(model.id).all()
+    missing = sorted(set(duplicate_codes) - {getattr(d, code) for d in duplicates})
+    if missing:
+        raise ValueError(f"Los registros no existen: {', '.join(missing)}")
+
+    for column in FILL_COLUMNS:
+        if not getattr(keep, column):
+            value = next((getattr(d, column) for d in duplicates if getattr(d, column)), None)
+            if value:
+                setattr(keep, column, value)
+
+    counts = {}
+    if entity == 'customer':
+        keep.receivable_balance = (keep.receivable_balance or 0) + sum(
+            (d.receivable_balance or 0) for d in duplicates
+        )
+        # El resumen de ventas está por cliente: se descuenta con el código
+        # anterior y se vuelve a sumar con el nuevo
+        posted = [sale_id for (sale_id,) in db.session.query(SaleOrder.id_sale_order).filter(
+            SaleOrder.id_customer.in_(duplicate_codes), SaleOrder.status.in_(sales_cube.POSTED_STATUSES))]
+        sales_cube.record_sales(posted, -1)
+        counts['ventas'] = _repoint(SaleOrder.id_customer, duplicate_codes, keep_code)
+        counts['cotizaciones'] = _repoint(SaleQuotation.id_customer, duplicate_codes, keep_code)
+        counts['cobros'] = _repoint(CustomerPayment.id_customer, duplicate_codes, keep_code)
+        sales_cube.record_sales(posted, 1)
+        db.session.execute(delete(SalesDailySummary).where(SalesDailySummary.id_customer.in_(duplicate_codes)))
+    else:
+        counts['órdenes de compra'] = _repoint(PurchaseOrder.id_supplier, duplicate_codes, keep_code,
+                                                  supplier_id=keep.id)
+
+    db.session.flush()
+    db.session.execute(delete(model).where(code_column.in_(duplicate_codes)))
+    keep.updated_at = datetime.utcnow()
+    return counts
@@ -0,0 +1,186 @@
+import base64
+import json
+from collections import namedtuple
+from datetime import datetime
+from decimal import Decimal
+
+from sqlalchemy import and_, func, or_
+
+from app.models import Customer, Material, Supplier
+from app.utils.archive import active
+from app.utils.projections import project
+from app.utils.search import search_filter
+
+# Filas por página: por defecto y máximo
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# model/entity: modelo y entidad de búsqueda y proyección ('list')
+# sorts: columnas por las que se puede ordenar (todas con índice (columna, id))
+# filters: parámetro -> columna filtrada por igualdad
+# searches: parámetro -> columnas de búsqueda de texto (None = todas las indexadas)
+# facets: columnas con conteo por valor
+Grid = namedtuple('Grid', ['model', 'entity', 'sorts', 'filters', 'searches', 'facets', 'default_sort'])
+
+GRIDS = {
+    'material': Grid(
+        Material, 'material',
+        sorts=['id_material', 'name', 'type', 'created_at'],
+        filters={'type': 'type', 'unit': 'unit', 'status': 'status'},
+        searches={'q': None, 'id_material': ['id_material'], 'name': ['name']},
+        facets=['status', 'type'],
+        default_sort=('created_at', 'desc'),
+    ),
+    'customer': Grid(
+        Customer, 'customer',
+        sorts=['id_customer', 'name', 'country', 'created_at'],
+        filters={'country': 'country', 'currency': 'currency', 'status': 'status'},
+        searches={'q': None, 'id_customer': ['id_customer'], 'name': ['name']},
+        facets=['status', 'country'],
+        default_sort=('created_at', 'desc'),
+    ),
+    'supplier': Grid(
+        Supplier, 'supplier',
+        sorts=['id_suplier', 'name', 'country', 'created_at'],
+        filters={'country': 'country', 'currency': 'currency', 'status': 'status'},
+        searches={'q': None, 'id_suplier': ['id_suplier'], 'name': ['name']},
+        facets=['status', 'country'],
+        default_sort=('created_at', 'desc'),
+    ),
+}
+
+GridPage = namedtuple('GridPage', ['rows', 'prev_cursor', 'next_cursor', 'facets', 'sort', 'direction'])
+
+
+def _json_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def encode_cursor(value, id_):
+    raw = json.dumps([_json_value(value), id_], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, column):
+    """Cursor -> (valor de la columna de orden, id). Lanza ValueError si no es válido"""
+    try:
+        value, id_ = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if value is not None and column.type.python_type is datetime:
+            value = datetime.fromisoformat(value)
+        return value, int(id_)
+    except (TypeError, ValueError, NotImplementedError):
+        raise ValueError("Cursor inválido")
+
+
+def _parse_filter(column, value):
+    if column.type.python_type is bool:
+        if value not in ('true', 'false'):
+            raise ValueError(f"Valor inválido para {column.key}: {value}")
+        return value == 'true'
+    return value
+
+
+def _filtered(grid, args, skip=None):
+    """Consulta del modelo con los filtros y búsquedas de ``args`` (menos el filtro ``skip``)"""
+    model = grid.model
+    query = model.query
+    # Solo la condición de búsqueda, sin límite ni orden de relevancia: los
+    # conteos de facetas y el keyset ven todas las coincidencias
+    for param, columns in grid.searches.items():
+        condition = search_filter(grid.entity, args.get(param), columns)
+        if condition is not None:
+            query = query.filter(condition)
+    for param, column_name in grid.filters.items():
+        if param != skip and args.get(param):
+            column = getattr(model, column_name)
+            query = query.filter(column == _parse_filter(column, args[param]))
+    return active(query, model, include_archived=args.get('archived') == '1')
+
+
+def _keyset(column, id_column, value, id_, descending):
+    if descending:
+        return or_(column < value, and_(column == value, id_column < id_))
+    return or_(column > value, and_(column == value, id_column > id_))
+
+
+def facet_counts(entity, args):
+    """Conteo por valor de cada faceta con los demás filtros aplicados (GROUP BY sobre su índice)"""
+    grid = GRIDS[entity]
+    counts = {}
+    for facet in grid.facets:
+        column = getattr(grid.model, facet)
+        param = next((p for p, c in grid.filters.items() if c == facet), None)
+        rows = _filtered(grid, args, skip=param).with_entities(column, func.count()).group_by(column).all()
+        counts[facet] = [{'value': value, 'count': count}
+                         for value, count in sorted(rows, key=lambda row: (-row[1], str(row[0])))]
+    return counts
+
+
+def grid_page(entity, args):
+    """Una página del listado de la entidad según ``args`` (request.args o dict).
+
+    Parámetros: sort y dir (columna de GRIDS[entity].sorts, asc/desc),
+    filtros por igualdad y búsquedas de la grilla, archived=1 para incluir los
+    archivados, per_page (1..MAX_PAGE_SIZE) y after/before (cursor de la
+    página siguiente/anterior). La paginación es
+    por keyset (columna, id) sobre un índice, así que el costo no depende de
+    la página. Las facetas se cuentan solo en la primera página (sin cursor)
+    y si ``facets`` no es '0'. Lanza ValueError ante parámetros no permitidos.
+    """
+    grid = GRIDS[entity]
+    model = grid.model
+    sort = args.get('sort') or grid.default_sort[0]
+    direction = args.get('dir') or grid.default_sort[1]
+    if sort not in grid.sorts:
+        raise ValueError(f"No se puede ordenar por '{sort}'")
+    if direction not in ('asc', 'desc'):
+        raise ValueError(f"Dirección inválida: '{direction}'")
+    try:
+        per_page = min(max(int(args.get('per_page') or DEFAULT_PAGE_SIZE), 1), MAX_PAGE_SIZE)
+    except ValueError:
+        raise ValueError("per_page debe ser un número")
+
+    column = getattr(model, sort)
+    descending = direction == 'desc'
+    query = project(_filtered(grid, args), entity, 'list', column.label('sort_value'))
+
+    after, before = args.get('after'), args.get('before')
+    if before:
+        # Página anterior: se recorre en sentido contrario y se invierte
+        value, id_ = decode_cursor(before, column)
+        query = query.filter(_keyset(column, model.id, value, id_, not descending))
+        order = (column.asc(), model.id.asc()) if descending else (column.desc(), model.id.desc())
+        rows = query.order_by(*order).limit(per_page + 1).all()
+        has_prev, has_next = len(rows) > per_page, True
+        rows = list(reversed(rows[:per_page]))
+    else:
+        if after:
+            value, id_ = decode_cursor(after, column)
+            query = query.filter(_keyset(column, model.id, value, id_, descending))
+        order = (column.desc(), model.id.desc()) if descending else (column.asc(), model.id.asc())
+        rows = query.order_by(*order).limit(per_page + 1).all()
+        has_prev, has_next = after is not None, len(rows) > per_page
+        rows = rows[:per_page]
+
+    prev_cursor = encode_cursor(rows[0].sort_value, rows[0].id) if rows and has_prev else None
+    next_cursor = encode_cursor(rows[-1].sort_value, rows[-1].id) if rows and has_next else None
+    facets = facet_counts(entity, args) if not after and not before and args.get('facets') != '0' else None
+    return GridPage(rows, prev_cursor, next_cursor, facets, sort, direction)
+
+
+def grid_json(entity, args):
+    """grid_page como diccionario listo para jsonify"""
+    page = grid_page(entity, args)
+    return {
+        'rows': [{key: _json_value(value) for key, value in row._asdict().items() if key != 'sort_value'}
+                 for row in page.rows],
+        'sort': page.sort,
+        'dir': page.direction,
+        'prev_cursor': page.prev_cursor,
+        'next_cursor': page.next_cursor,
+        'facets': page.facets,
+    }
@@ -0,0 +1,172 @@
+import json
+import uuid
+from datetime import datetime, timedelta
+from functools import wraps
+
+from flask import current_app, flash, jsonify, redirect, request, session
+from flask_login import current_user
+from sqlalchemy import event, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models import IdempotencyKey
+
+
+def idempotency_token():
+    """Clave nueva para el campo oculto idempotency_key de un formulario"""
+    return uuid.uuid4().hex
+
+
+def _request_key():
+    return (request.headers.get('Idempotency-Key') or request.form.get('idempotency_key') or '').strip()[:100]
+
+
+def _claim(key, endpoint, now):
+    """Registra la clave como 'en proceso' con fecha ``now``. Devuelve None si se tomó o el registro existente.
+
+    Una clave sigue 'en proceso' solo si la vista no confirmó nada (ver
+    _mark_completed). Con más de IDEMPOTENCY_STALE_SECONDS quedó de un proceso
+    que murió antes de confirmar: se toma de nuevo en lugar de responder 409
+    hasta que venza. Si la solicitud original solo era lenta, su commit falla
+    porque la fecha de la clave ya no es la suya.
+    """
+    ttl = timedelta(hours=current_app.config['IDEMPOTENCY_TTL_HOURS'])
+
+    # Limpieza de claves vencidas (índice sobre expires_at)
+    IdempotencyKey.query.filter(IdempotencyKey.expires_at < now).delete(synchronize_session=False)
+    try:
+        db.session.add(IdempotencyKey(
+            key=key,
+            user_id=current_user.id,
+            endpoint=endpoint,
+            status='en proceso',
+            created_at=now,
+            expires_at=now + ttl
+        ))
+        db.session.commit()
+        return None
+    except IntegrityError:
+        db.session.rollback()
+
+    record = IdempotencyKey.query.filter_by(key=key, user_id=current_user.id, endpoint=endpoint).first()
+    stale = now - timedelta(seconds=current_app.config['IDEMPOTENCY_STALE_SECONDS'])
+    if record is not None and record.status == 'en proceso' and record.created_at < stale:
+        # Solo un reintento gana la clave: el UPDATE compara la fecha leída
+        taken = IdempotencyKey.query.filter_by(
+            id=record.id, status='en proceso', created_at=record.created_at
+        ).update({'created_at': now, 'expires_at': now + ttl}, synchronize_session=False)
+        db.session.commit()
+        if taken:
+            return None
+    return record
+
+
+@event.listens_for(Session, 'before_commit')
+def _mark_completed(session):
+    # El primer commit de la vista marca la clave como completada en la misma
+    # transacción que sus cambios: si el proceso muere después, la clave ya no
+    # se puede tomar de nuevo y el efecto no se repite
+    claim = session.info.get('idempotency_claim')
+    if claim is None or claim['committed']:
+        return
+    table = IdempotencyKey.__table__
+    completed = session.execute(update(table).where(
+        table.c.key == claim['key'], table.c.user_id == claim['user_id'], table.c.endpoint == claim['endpoint'],
+        table.c.status == 'en proceso', table.c.created_at == claim['claimed_at']
+    ).values(status='completado')).rowcount
+    if not completed:
+        raise RuntimeError('Otro reintento tomó la clave de idempotencia; la solicitud no se registró')
+    claim['committed'] = True
+
+
+def _replay(record):
+    """Repite la respuesta guardada sin volver a ejecutar la transacción"""
+    if record.response_status is None:
+        # La vista confirmó sus cambios pero el proceso murió antes de guardar la respuesta
+        message = 'La solicitud ya fue procesada.'
+        if request.headers.get('Idempotency-Key'):
+            return jsonify({'message': message})
+        flash(message, 'info')
+        return redirect(request.referrer or request.path)
+    for category, message in json.loads(record.flashes or '[]'):
+        flash(message, category)
+    if record.response_location:
+        return redirect(record.response_location, code=record.response_status or 302)
+    return current_app.response_class(record.response_body or '', status=record.response_status or 200,
+                                      mimetype=record.response_mimetype)
+
+
+def _release(key, endpoint, claimed_at):
+    """Borra la clave (si sigue siendo la tomada en ``claimed_at``) para que un nuevo envío con ella se ejecute"""
+    IdempotencyKey.query.filter_by(
+        key=key, user_id=current_user.id, endpoint=endpoint, created_at=claimed_at
+    ).delete(synchronize_session=False)
+    db.session.commit()
+
+
+def idempotent(view):
+    """Evita ejecutar dos veces un POST con la misma clave de idempotencia.
+
+    La clave llega en la cabecera Idempotency-Key (clientes API) o en el campo
+    oculto idempotency_key del formulario. El primer envío se ejecuta y su
+    respuesta (redirección o cuerpo, más los mensajes flash) se guarda durante
+    IDEMPOTENCY_TTL_HOURS; los reintentos reciben esa misma respuesta. Un
+    reintento mientras el primero sigue en curso recibe 409. Los rechazos de
+    validación (respuesta 4xx/5xx o mensaje flash 'error') que no confirmaron
+    nada no se guardan, así que el envío corregido con la misma clave se
+    ejecuta.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = _request_key() if request.method == 'POST' else ''
+        if not key:
+            return view(*args, **kwargs)
+
+        endpoint = request.endpoint
+        claimed_at = datetime.utcnow()
+        record = _claim(key, endpoint, claimed_at)
+        if record is not None:
+            if record.status == 'completado':
+                return _replay(record)
+            message = 'La solicitud ya se está procesando, espere unos segundos.'
+            if request.headers.get('Idempotency-Key'):
+                return jsonify({'error': message}), 409
+            flash(message, 'warning')
+            return redirect(request.referrer or request.path)
+
+        claim = {'key': key, 'user_id': current_user.id, 'endpoint': endpoint, 'claimed_at': claimed_at,
+                 'committed': False}
+        db.session.info['idempotency_claim'] = claim
+        flashed_before = len(session.get('_flashes', []))
+        try:
+            response = current_app.make_response(view(*args, **kwargs))
+        except Exception:
+            db.session.rollback()
+            # Sin cambios confirmados se libera la clave para permitir reintentar
+            if not claim['committed']:
+                _release(key, endpoint, claimed_at)
+            raise
+        finally:
+            db.session.info.pop('idempotency_claim', None)
+
+        flashes = session.get('_flashes', [])[flashed_before:]
+        is_redirect = 300 <= response.status_code < 400
+        db.session.rollback()  # por si la vista dejó una transacción abierta
+        rejected = response.status_code >= 400 or any(category == 'error' for category, _ in flashes)
+        if rejected and not claim['committed']:
+            # Rechazo de validación: nada se registró y el envío corregido debe ejecutarse
+            _release(key, endpoint, claimed_at)
+            return response
+        IdempotencyKey.query.filter_by(key=key, user_id=current_user.id, endpoint=endpoint).update({
+            'status': 'completado',
+            'response_status': response.status_code,
+            'response_location': response.headers.get('Location') if is_redirect else None,
+            'response_body': None if is_redirect else response.get_data(as_text=True),
+            'response_mimetype': None if is_redirect else response.mimetype,
+            'flashes': json.dumps([list(f) for f in flashes]),
+        }, synchronize_session=False)
+        db.session.commit()
+        return response
+
+    return wrapper
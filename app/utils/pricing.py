@@ -0,0 +1,146 @@
+from bisect import bisect_right
+from collections import namedtuple
+from datetime import date
+from decimal import Decimal, ROUND_HALF_UP
+
+from app import db
+from app.models import Customer, PriceList, PriceListItem, DiscountRule
+from app.utils.cache import VersionedCache
+from app.utils.reference import watch
+
+CENT = Decimal('0.01')
+
+Quote = namedtuple('Quote', ['list_price', 'discount', 'price', 'price_list'])
+
+
+def _valid(valid_from, valid_to, on_date):
+    return (valid_from is None or valid_from <= on_date) and (valid_to is None or on_date <= valid_to)
+
+
+class PricingSnapshot:
+    """Listas de precios y descuentos activos compilados para búsqueda en memoria.
+
+    Precios: (categoría, moneda) -> listas ordenadas por prioridad, cada una con
+    material -> (escalones de cantidad, precios) para buscar con bisect.
+    Descuentos: (categoría, material) -> reglas; None en la clave significa
+    'todas'. Cotizar una línea no consulta la base de datos.
+    """
+
+    def __init__(self, lists, items, rules):
+        entries = {}
+        for price_list in lists:
+            entries[price_list.id] = {
+                'code': price_list.code,
+                'priority': price_list.priority or 0,
+                'valid_from': price_list.valid_from,
+                'valid_to': price_list.valid_to,
+                'materials': {},
+            }
+        for price_list_id, id_material, min_quantity, price in sorted(items, key=lambda i: (i[0], i[1], i[2])):
+            entry = entries.get(price_list_id)
+            if entry is None:
+                continue
+            breaks, prices = entry['materials'].setdefault(id_material, ([], []))
+            breaks.append(min_quantity or 1)
+            prices.append(Decimal(str(price)))
+
+        self._lists = {}
+        for price_list in lists:
+            key = (price_list.category or None, price_list.currency)
+            self._lists.setdefault(key, []).append(entries[price_list.id])
+        for candidates in self._lists.values():
+            candidates.sort(key=lambda e: (e['priority'], e['code']))
+
+        self._rules = {}
+        for rule in rules:
+            key = (rule.category or None, rule.id_material or None)
+            self._rules.setdefault(key, []).append(
+                (rule.min_quantity or 1, Decimal(str(rule.percent)), rule.valid_from, rule.valid_to)
+            )
+
+    def list_price(self, id_material, quantity, category, currency, on_date):
+        """(precio, código de lista) del escalón vigente, o (None, None)"""
+        # Primero las listas de la categoría del cliente, luego las generales
+        keys = [(category, currency), (None, currency)] if category else [(None, currency)]
+        for key in keys:
+            for entry in self._lists.get(key, ()):
+                if not _valid(entry['valid_from'], entry['valid_to'], on_date):
+                    continue
+                material = entry['materials'].get(id_material)
+                if not material:
+                    continue
+                breaks, prices = material
+                pos = bisect_right(breaks, quantity)
+                if pos:
+                    return prices[pos - 1], entry['code']
+        return None, None
+
+    def discount(self, id_material, quantity, category, on_date):
+        """Mayor porcentaje de descuento aplicable a la línea"""
+        best = Decimal('0')
+        for key in ((category, id_material), (category, None), (None, id_material), (None, None)):
+            for min_quantity, percent, valid_from, valid_to in self._rules.get(key, ()):
+                if quantity >= min_quantity and percent > best and _valid(valid_from, valid_to, on_date):
+                    best = percent
+        return best
+
+    def quote(self, id_material, quantity, category, currency, on_date=None):
+        """Quote con precio de lista, % de descuento y precio neto; None si no hay precio"""
+        on_date = on_date or date.today()
+        category = category or None
+        list_price, code = self.list_price(id_material, quantity, category, currency, on_date)
+        if list_price is None:
+            return None
+        discount = self.discount(id_material, quantity, category, on_date)
+        price = (list_price * (1 - discount / 100)).quantize(CENT, rounding=ROUND_HALF_UP)
+        return Quote(list_price, discount, price, code)
+
+
+def _load_pricing():
+    lists = PriceList.query.filter_by(status=True).all()
+    items = db.session.query(
+        PriceListItem.price_list_id, PriceListItem.id_material, PriceListItem.min_quantity, PriceListItem.price
+    ).join(PriceList, PriceList.id == PriceListItem.price_list_id).filter(PriceList.status.is_(True)).all()
+    rules = DiscountRule.query.filter_by(status=True).all()
+    return PricingSnapshot(lists, items, rules)
+
+
+pricing_cache = VersionedCache(_load_pricing)
+
+# Contador 'pricing' en reference_version: un cambio confirmado en cualquier
+# proceso descarta la copia de todos al inicio de su siguiente petición
+PRICING_VERSION = 'pricing'
+watch(PRICING_VERSION, pricing_cache, (PriceList, PriceListItem, DiscountRule))
+
+
+def customer_category(id_customer):
+    return db.session.query(Customer.category).filter_by(id_customer=id_customer).scalar()
+
+
+def quote_lines(id_customer, lines, currency, on_date=None):
+    """Cotiza varias líneas (material, cantidad) con una sola consulta del cliente"""
+    snapshot = pricing_cache.get()
+    category = customer_category(id_customer)
+    return [snapshot.quote(id_material, quantity, category, currency, on_date) for id_material, quantity in lines]
+
+
+def fill_prices(id_customer, lines, currency, on_date=None):
+    """Completa las líneas (material, cantidad, precio) sin precio con el de la lista.
+
+    Lanza ValueError si algún material no tiene precio vigente.
+    """
+    if all(price is not None for _, _, price in lines):
+        return lines
+    quotes = quote_lines(id_customer, [(mat, qty) for mat, qty, _ in lines], currency, on_date)
+    filled = []
+    missing = []
+    for (mat_code, qty, price), quote in zip(lines, quotes):
+        if price is None:
+            if quote is None:
+                missing.append(mat_code)
+                continue
+            price = quote.price
+        filled.append((mat_code, qty, price))
+    if missing:
+        raise ValueError(f"No hay precio de lista vigente para: {', '.join(missing)}")
+    return filled
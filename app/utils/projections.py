@@ -0,0 +1,63 @@
+from app.models import Customer, Material, PurchaseOrder, Supplier
+
+# Filas por bloque al recorrer una exportación
+BATCH_SIZE = 1000
+
+# Columnas de clientes y proveedores en el CSV de exportación, después del código
+_PARTY_EXPORT = [
+    'legal_name', 'name', 'country', 'currency', 'text_id', 'state_province', 'city', 'address', 'zip_code',
+    'phone', 'email', 'contact_name', 'contact_role', 'category', 'payments_terms', 'payment_method',
+    'bank_account', 'status', 'created_by', 'created_at', 'updated_at',
+]
+
+_PARTY_LIST = [
+    'legal_name', 'name', 'country', 'currency', 'phone', 'email', 'contact_name', 'contact_role',
+    'status', 'archived_at', 'created_by', 'updated_at',
+]
+
+# Entidad: (modelo, {vista: columnas}). Cada vista lista solo las columnas que
+# usa su plantilla o su CSV
+PROJECTIONS = {
+    'material': (Material, {
+        'list': ['id', 'id_material', 'name', 'description', 'unit', 'type', 'status', 'archived_at', 'created_by',
+                 'updated_at'],
+        'export': ['id_material', 'name', 'description', 'unit', 'type', 'status', 'created_by',
+                   'created_at', 'updated_at'],
+    }),
+    'customer': (Customer, {
+        'list': ['id', 'id_customer', *_PARTY_LIST, 'credit_limit', 'receivable_balance'],
+        'export': ['id_customer', *_PARTY_EXPORT],
+    }),
+    'supplier': (Supplier, {
+        'list': ['id', 'id_suplier', *_PARTY_LIST],
+        'export': ['id_suplier', *_PARTY_EXPORT],
+        'option': ['id_suplier', 'name'],
+    }),
+    'purchase_order': (PurchaseOrder, {
+        'list': ['id_purchase_order', 'id_supplier', 'supplier_id', 'issue_date', 'estimated_delivery_date',
+                 'status', 'total_amount', 'currency', 'created_by', 'updated_at'],
+        'export': ['id_purchase_order', 'id_supplier', 'issue_date', 'estimated_delivery_date', 'status',
+                   'total_amount', 'currency', 'notes', 'created_by', 'created_at', 'updated_at'],
+    }),
+}
+
+
+def columns(entity, view):
+    model, views = PROJECTIONS[entity]
+    return [getattr(model, column) for column in views[view]]
+
+
+def project(query, entity, view, *extra):
+    """La consulta de la entidad (ya filtrada) limitada a las columnas de ``view``.
+
+    Devuelve filas Row de SQLAlchemy: tuplas con acceso por nombre
+    (``row.name``) y __slots__, que no pasan por el mapa de identidad de la
+    sesión ni se vigilan para el flush. ``extra`` agrega columnas (p. ej. de
+    una tabla unida).
+    """
+    return query.with_entities(*columns(entity, view), *extra)
+
+
+def stream(query, batch_size=BATCH_SIZE):
+    """Recorre una consulta proyectada por bloques sin materializar todo el resultado"""
+    return query.yield_per(batch_size)
@@ -0,0 +1,163 @@
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from flask import current_app
+from sqlalchemy import insert, update
+
+from app import db
+from app.models import Material, SaleQuotation, SaleQuotationLine
+from app.utils.pricing import fill_prices
+from app.utils.sales import post_sales
+from app.utils.sequences import next_numbers
+
+QUOTATION_STATUSES = ['borrador', 'aceptada', 'rechazada', 'convertida']
+
+# Cambios de estado permitidos desde la pantalla de la cotización
+TRANSITIONS = {
+    'accept': ('borrador', 'aceptada'),
+    'reject': ('borrador', 'rechazada'),
+    'reopen': ('rechazada', 'borrador'),
+}
+
+
+def is_expired(quotation, today=None):
+    return quotation.valid_until < (today or date.today())
+
+
+def create_quotation(id_quotation, id_customer, lines, username, currency='MXN', valid_until=None, notes=None):
+    """Registra una cotización en la transacción actual (sin commit).
+
+    Las líneas sin precio toman el de la lista de precios del cliente. Lanza
+    ValueError si un material no existe o no tiene precio.
+    """
+    lines = fill_prices(id_customer, lines, currency)
+    materials = {mat_code for mat_code, _, _ in lines}
+    existing = {mat_code for (mat_code,) in db.session.query(Material.id_material)
+                .filter(Material.id_material.in_(materials))}
+    missing = sorted(materials - existing)
+    if missing:
+        raise ValueError(f"Los materiales no existen: {', '.join(missing)}")
+
+    quotation = SaleQuotation(
+        id_quotation=id_quotation,
+        id_customer=id_customer,
+        valid_until=valid_until or date.today() + timedelta(days=current_app.config['QUOTATION_VALID_DAYS']),
+        status='borrador',
+        total_amount=sum((qty * price for _, qty, price in lines), Decimal('0')),
+        currency=currency,
+        notes=notes,
+        created_by=username
+    )
+    db.session.add(quotation)
+    db.session.flush()
+
+    db.session.execute(insert(SaleQuotationLine), [
+        {
+            'id_quotation': id_quotation,
+            'id_material': mat_code,
+            'quantity': qty,
+            'unit_price': price,
+            'subtotal': qty * price
+        }
+        for mat_code, qty, price in lines
+    ])
+    return quotation
+
+
+def _claim(quotation, current, target, now):
+    """Cambia el estado en la base solo si sigue en ``current``.
+
+    Devuelve False si otra solicitud lo cambió desde que se leyó la cotización.
+    """
+    result = db.session.execute(
+        update(SaleQuotation)
+        .where(SaleQuotation.id == quotation.id, SaleQuotation.status == current)
+        .values(status=target, updated_at=now)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+
+def change_status(quotation, action):
+    """Aplica una transición de TRANSITIONS. Lanza ValueError si no corresponde"""
+    if action not in TRANSITIONS:
+        raise ValueError(f"Acción desconocida: {action}")
+    current, target = TRANSITIONS[action]
+    if quotation.status != current:
+        raise ValueError(f"La cotización {quotation.id_quotation} está {quotation.status}")
+    if target == 'aceptada' and is_expired(quotation):
+        raise ValueError(f"La cotización {quotation.id_quotation} venció el {quotation.valid_until}")
+    now = datetime.utcnow()
+    if not _claim(quotation, current, target, now):
+        raise ValueError(f"La cotización {quotation.id_quotation} cambió de estado en otra solicitud")
+    quotation.status = target
+    quotation.updated_at = now
+
+
+def convert_quotations(quotations, acc_debit, acc_credit, username, location_id=None, policy=None,
+                       dispatch=True):
+    """Convierte cotizaciones aceptadas en ventas dentro de la transacción actual.
+
+    Los folios de venta y de asiento se reservan en bloque antes de escribir;
+    las líneas de todas las cotizaciones se leen en una consulta y las ventas
+    se registran juntas con post_sales (una asignación de stock, escrituras en
+    bloque). Si una cotización no puede convertirse no se convierte ninguna;
+    las que otra solicitud convirtió mientras tanto se omiten. Devuelve las
+    ventas creadas.
+    """
+    if not quotations:
+        raise ValueError("No se seleccionaron cotizaciones")
+
+    today = date.today()
+    invalid = []
+    for quotation in quotations:
+        if quotation.status != 'aceptada':
+            invalid.append(f"{quotation.id_quotation} ({quotation.status})")
+        elif is_expired(quotation, today):
+            invalid.append(f"{quotation.id_quotation} (vencida el {quotation.valid_until})")
+    if invalid:
+        raise ValueError(f"Solo se convierten cotizaciones aceptadas y vigentes: {', '.join(invalid)}")
+
+    sale_ids = next_numbers('sale', len(quotations))
+    entry_numbers = next_numbers('journal', len(quotations)) if dispatch and acc_debit and acc_credit else None
+
+    # Cada cotización se reclama con un UPDATE condicionado a su estado antes
+    # de registrar la venta: dos conversiones simultáneas no la duplican. Va
+    # después de reservar los folios (en SQLite, antes de escribir en la
+    # sesión); los de las cotizaciones omitidas quedan como huecos
+    now = datetime.utcnow()
+    claimed = [_claim(q, 'aceptada', 'convertida', now) for q in quotations]
+    quotations = [q for q, ok in zip(quotations, claimed) if ok]
+    if not quotations:
+        raise ValueError("Las cotizaciones ya fueron convertidas por otra solicitud")
+    sale_ids = [n for n, ok in zip(sale_ids, claimed) if ok]
+    if entry_numbers:
+        entry_numbers = [n for n, ok in zip(entry_numbers, claimed) if ok]
+
+    lines = {}
+    for line in SaleQuotationLine.query.filter(
+        SaleQuotationLine.id_quotation.in_([q.id_quotation for q in quotations])
+    ).order_by(SaleQuotationLine.id):
+        lines.setdefault(line.id_quotation, []).append((line.id_material, line.quantity, line.unit_price))
+
+    orders = [
+        {
+            'sale_id': sale_id,
+            'id_customer': quotation.id_customer,
+            'currency': quotation.currency,
+            'lines': lines.get(quotation.id_quotation, []),
+        }
+        for quotation, sale_id in zip(quotations, sale_ids)
+    ]
+    empty = [q.id_quotation for q, order in zip(quotations, orders) if not order['lines']]
+    if empty:
+        raise ValueError(f"Cotizaciones sin líneas: {', '.join(empty)}")
+
+    sales = post_sales(orders, acc_debit, acc_credit, username, location_id=location_id, policy=policy,
+                       dispatch=dispatch, entry_numbers=entry_numbers)
+
+    for quotation, sale_id in zip(quotations, sale_ids):
+        quotation.status = 'convertida'
+        quotation.id_sale_order = sale_id
+        quotation.updated_at = now
+    return sales
@@ -0,0 +1,110 @@
+from datetime import datetime
+
+from sqlalchemy import or_, update
+
+from app import db
+from app.models import Customer, CustomerPayment, JournalEntry, JournalItem
+from app.utils.currency import set_amount_currency
+from app.utils.sequences import next_number
+
+
+def _credit_error(id_customer, amount):
+    row = db.session.query(Customer.credit_limit, Customer.receivable_balance).filter_by(
+        id_customer=id_customer).first()
+    if row is None:
+        return ValueError(f"El cliente {id_customer} no existe")
+    limit, balance = row
+    return ValueError(
+        f"Límite de crédito excedido para {id_customer}: saldo ${balance}, "
+        f"operación ${amount}, límite ${limit}"
+    )
+
+
+def check_credit(id_customer, amount):
+    """Verifica sin cargar que ``amount`` cabe en el crédito disponible del cliente"""
+    row = db.session.query(Customer.credit_limit, Customer.receivable_balance).filter_by(
+        id_customer=id_customer).first()
+    if row is None:
+        raise ValueError(f"El cliente {id_customer} no existe")
+    limit, balance = row
+    if limit is not None and (balance or 0) + amount > limit:
+        raise _credit_error(id_customer, amount)
+
+
+def charge(id_customer, amount):
+    """Suma ``amount`` al saldo por cobrar si no excede el límite de crédito.
+
+    La verificación y el incremento son un solo UPDATE condicional sobre la
+    fila del cliente: no recorre el historial de ventas y dos ventas
+    simultáneas no pueden pasar juntas el límite. Lanza ValueError si se excede.
+    """
+    result = db.session.execute(
+        update(Customer)
+        .where(
+            Customer.id_customer == id_customer,
+            or_(Customer.credit_limit.is_(None),
+                Customer.receivable_balance + amount <= Customer.credit_limit)
+        )
+        .values(receivable_balance=Customer.receivable_balance + amount)
+        .execution_options(synchronize_session=False)
+    )
+    if not result.rowcount:
+        raise _credit_error(id_customer, amount)
+
+
+def discharge(id_customer, amount):
+    """Resta ``amount`` del saldo por cobrar (cobros, devoluciones y anulaciones)"""
+    db.session.execute(
+        update(Customer)
+        .where(Customer.id_customer == id_customer)
+        .values(receivable_balance=Customer.receivable_balance - amount)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def post_payment(id_customer, amount, acc_debit, acc_credit, username, reference=None,
+                 payment_date=None, entry_number=None):
+    """Registra un cobro del cliente en la transacción actual (sin commit).
+
+    Genera el asiento (caja al debe, clientes al haber), el registro del cobro
+    y descuenta el saldo por cobrar. Lanza ValueError si el importe o las
+    cuentas no son válidos.
+    """
+    if amount <= 0:
+        raise ValueError("El importe del cobro debe ser mayor a cero")
+    if not acc_debit or not acc_credit:
+        raise ValueError("Las cuentas contables (débito/crédito) no fueron seleccionadas correctamente.")
+    if entry_number is None:
+        entry_number = next_number('journal')
+    if not db.session.query(Customer.id).filter_by(id_customer=id_customer).first():
+        raise ValueError(f"El cliente {id_customer} no existe")
+
+    payment_date = payment_date or datetime.utcnow()
+    entry = JournalEntry(
+        number=entry_number,
+        date=payment_date,
+        description=f"Cobro cliente {id_customer}",
+        reference=reference,
+        created_by=username
+    )
+    db.session.add(entry)
+    db.session.flush()
+
+    items = [
+        JournalItem(entry_id=entry.id, account_id=acc_debit, debit=amount, credit=0),
+        JournalItem(entry_id=entry.id, account_id=acc_credit, debit=0, credit=amount),
+    ]
+    set_amount_currency(items, entry.date)
+    db.session.add_all(items)
+
+    payment = CustomerPayment(
+        id_customer=id_customer,
+        date=payment_date,
+        amount=amount,
+        reference=reference,
+        entry_id=entry.id,
+        created_by=username
+    )
+    db.session.add(payment)
+    discharge(id_customer, amount)
+    return payment
@@ -0,0 +1,136 @@
+from collections import namedtuple
+
+from sqlalchemy import event, select, update
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models import AccountAccount, Country, Currency, Location, MaterialType, ReferenceVersion, Role, Unit
+from app.utils.cache import VersionedCache, account_cache
+
+# Tablas que cambian rara vez y se leen en casi todos los formularios
+REFERENCE_MODELS = (Unit, MaterialType, Country, Currency, Location, Role)
+
+VERSION_NAME = 'reference'
+
+
+def _row_type(model):
+    return namedtuple(f'{model.__name__}Row', [column.key for column in model.__table__.columns])
+
+
+_ROW_TYPES = {model: _row_type(model) for model in REFERENCE_MODELS}
+
+
+def _rows(model, *order_by):
+    row_type = _ROW_TYPES[model]
+    columns = [getattr(model, field) for field in row_type._fields]
+    return tuple(row_type(*row) for row in db.session.execute(select(*columns).order_by(*order_by)))
+
+
+class ReferenceSnapshot:
+    """Copia de solo lectura de las tablas de referencia (tuplas con nombre, no objetos del ORM)"""
+
+    def __init__(self):
+        self.units = _rows(Unit, Unit.name)
+        self.material_types = _rows(MaterialType, MaterialType.name)
+        self.countries = _rows(Country, Country.name)
+        self.currencies = _rows(Currency, Currency.id)
+        self.locations = _rows(Location, Location.name)
+        self.roles = _rows(Role, Role.id)
+        self.roles_by_id = {role.id: role for role in self.roles}
+
+    @property
+    def active_locations(self):
+        return tuple(location for location in self.locations if location.status)
+
+    @property
+    def currency_names(self):
+        """Símbolo -> nombre de la moneda (el primero registrado si el símbolo se repite)"""
+        names = {}
+        for currency in self.currencies:
+            names.setdefault(currency.symbol, currency.name)
+        return names
+
+
+reference_cache = VersionedCache(ReferenceSnapshot)
+
+# Copias en memoria que se descartan en todos los procesos al cambiar sus
+# tablas: nombre del contador en reference_version -> (caché, modelos)
+_watched = {}
+_seen_versions = {}
+
+
+def watch(name, cache, models):
+    """Descarta ``cache`` en todos los procesos cuando se confirma un cambio en ``models``.
+
+    Los cambios hechos con sentencias en bloque (insert/delete de Core), que
+    no pasan por la sesión, deben llamar a bump_version(name).
+    """
+    _watched[name] = (cache, tuple(models))
+
+
+watch(VERSION_NAME, reference_cache, REFERENCE_MODELS)
+# El catálogo de cuentas (y su ETag) vive en cache.py, que no puede importar este módulo
+watch('account', account_cache, (AccountAccount,))
+
+
+def current_version(name=VERSION_NAME):
+    version = db.session.execute(
+        select(ReferenceVersion.version).where(ReferenceVersion.name == name)
+    ).scalar()
+    return version or 0
+
+
+def check_version():
+    """Descarta las copias en memoria cuyas tablas modificó otro proceso.
+
+    Se llama al inicio de cada petición: una sola consulta de los contadores.
+    """
+    versions = dict(db.session.execute(
+        select(ReferenceVersion.name, ReferenceVersion.version).where(ReferenceVersion.name.in_(_watched))
+    ).all())
+    for name, (cache, _) in _watched.items():
+        version = versions.get(name) or 0
+        if version != _seen_versions.get(name):
+            cache.invalidate()
+            _seen_versions[name] = version
+
+
+def bump_version(name, session=None):
+    """Incrementa el contador ``name`` en la transacción actual; si se revierte, no cuenta"""
+    session = session or db.session
+    table = ReferenceVersion.__table__
+    conn = session.connection()
+    updated = conn.execute(
+        update(table).where(table.c.name == name).values(version=table.c.version + 1)
+    ).rowcount
+    if not updated:
+        conn.execute(table.insert().values(name=name, version=1))
+    session.info.setdefault('versions_changed', set()).add(name)
+
+
+def _touches(session, models):
+    for obj in session.new | session.deleted:
+        if isinstance(obj, models):
+            return True
+    return any(isinstance(obj, models) and session.is_modified(obj) for obj in session.dirty)
+
+
+@event.listens_for(Session, 'after_flush')
+def _bump_versions(session, flush_context):
+    changed = session.info.get('versions_changed', ())
+    for name, (_, models) in _watched.items():
+        if name not in changed and _touches(session, models):
+            bump_version(name, session)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_after_commit(session):
+    for name in session.info.pop('versions_changed', ()):
+        # Hay contadores sin copia local propia (los consulta quien los usa)
+        if name in _watched:
+            _watched[name][0].invalidate()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_change(session):
+    session.info.pop('versions_changed', None)
@@ -0,0 +1,393 @@
+from datetime import datetime
+from decimal import Decimal
+
+from sqlalchemy import and_, func, insert, or_, select, update
+
+from app import db
+from app.models import SaleOrder, SaleOrderLine, Material, Customer, JournalEntry, JournalItem
+from app.utils import allocation, receivables, sales_cube
+from app.utils.currency import set_amount_currency
+from app.utils.pricing import fill_prices
+from app.utils.sequences import next_number, next_numbers
+
+
+def parse_sale_lines(form):
+    """Líneas de venta del formulario: listas id_material[], quantity[] y price[].
+
+    Un precio vacío queda en None para tomarlo de la lista de precios.
+    """
+    materials = form.getlist('id_material[]')
+    quantities = form.getlist('quantity[]')
+    prices = form.getlist('price[]')
+
+    lines = []
+    for position, (mat_code, qty, price) in enumerate(zip(materials, quantities, prices), start=1):
+        if not mat_code:
+            continue
+        qty = int(qty or 0)
+        if qty <= 0:
+            raise ValueError(f"Línea {position}: la cantidad debe ser mayor a cero")
+        lines.append((mat_code, qty, Decimal(price) if price else None))
+
+    if not lines:
+        raise ValueError("La venta debe tener al menos una línea")
+    return lines
+
+
+def _check_accounts(acc_debit, acc_credit):
+    if not acc_debit or not acc_credit:
+        raise ValueError("Las cuentas contables (débito/crédito) no fueron seleccionadas correctamente.")
+
+
+def _post_entry(sale, acc_debit, acc_credit, username, entry_number):
+    """Asiento único de la venta: total al debe (cobro) y al haber (venta)"""
+    return _post_entries([sale], acc_debit, acc_credit, username, [entry_number])[0]
+
+
+def _post_entries(sales, acc_debit, acc_credit, username, entry_numbers):
+    """Un asiento por venta, todos escritos en un mismo flush"""
+    today = datetime.utcnow().date()
+    entries = []
+    items = []
+    for sale, entry_number in zip(sales, entry_numbers):
+        entry_items = [
+            JournalItem(account_id=acc_debit, debit=sale.total_amount, credit=0),
+            JournalItem(account_id=acc_credit, debit=0, credit=sale.total_amount),
+        ]
+        entries.append(JournalEntry(
+            number=entry_number,
+            date=today,
+            description=f"Venta {sale.id_sale_order} - Cliente: {sale.id_customer}",
+            reference=sale.id_sale_order,
+            created_by=username,
+            items=entry_items
+        ))
+        items.extend(entry_items)
+    set_amount_currency(items, today)
+    db.session.add_all(entries)
+    db.session.flush()
+    return entries
+
+
+def post_sale(sale_id, id_customer, lines, acc_debit, acc_credit, username, location_id=None,
+              policy=None, dispatch=True, currency='MXN', entry_number=None):
+    """Registra una venta de N líneas en la transacción actual (sin commit).
+
+    Las líneas sin precio toman el de la lista de precios del cliente; el
+    resto lo hace post_sales. El folio del asiento se reserva al inicio, antes
+    de escribir en la sesión; quien registre varias ventas en la misma
+    transacción debe pasar ``entry_number`` ya reservado (o usar post_sales).
+    """
+    if dispatch:
+        _check_accounts(acc_debit, acc_credit)
+        if entry_number is None:
+            entry_number = next_number('journal')
+
+    lines = fill_prices(id_customer, lines, currency)
+    order = {'sale_id': sale_id, 'id_customer': id_customer, 'currency': currency, 'lines': lines}
+    return post_sales([order], acc_debit, acc_credit, username, location_id=location_id, policy=policy,
+                      dispatch=dispatch, entry_numbers=[entry_number] if dispatch else None)[0]
+
+
+def post_sales(orders, acc_debit, acc_credit, username, location_id=None, policy=None,
+               dispatch=True, entry_numbers=None):
+    """Registra varias ventas con precio en la transacción actual (sin commit).
+
+    ``orders`` es una lista de dicts con sale_id, id_customer, currency y
+    lines [(material, cantidad, precio)]. El stock de todas se asigna entre
+    bodegas con una sola consulta del motor de asignación y queda reservado;
+    cabeceras, líneas, reservas, salidas, asientos y resumen se escriben en
+    bloque. Con ``dispatch`` las reservas se consumen en el acto y cada venta
+    genera su asiento; sin él quedan 'reservado' hasta confirmarlas. Lanza
+    ValueError si falta stock, un material no existe, no se indicaron las
+    cuentas o una venta excede el límite de crédito del cliente.
+
+    Los folios de asiento (uno por venta) se reservan al inicio si no se pasan.
+    """
+    if dispatch:
+        _check_accounts(acc_debit, acc_credit)
+        if entry_numbers is None:
+            entry_numbers = next_numbers('journal', len(orders))
+
+    # Cantidad requerida por material, por venta y en total (puede repetirse en varias líneas)
+    required = {}
+    required_by_sale = []
+    totals = {}
+    credit = {}
+    for order in orders:
+        sale_required = {}
+        for mat_code, qty, _ in order['lines']:
+            sale_required[mat_code] = sale_required.get(mat_code, 0) + qty
+            required[mat_code] = required.get(mat_code, 0) + qty
+        required_by_sale.append((order['sale_id'], sale_required))
+        total = sum((qty * price for _, qty, price in order['lines']), Decimal('0'))
+        totals[order['sale_id']] = total
+        credit[order['id_customer']] = credit.get(order['id_customer'], Decimal('0')) + total
+
+    existing = {mat_code for (mat_code,) in db.session.query(Material.id_material)
+                .filter(Material.id_material.in_(required))}
+    missing = [mat_code for mat_code in required if mat_code not in existing]
+    if missing:
+        raise ValueError(f"Los materiales no existen: {', '.join(missing)}")
+
+    # El saldo por cobrar solo aumenta al despachar; la reserva solo lo verifica
+    for id_customer, amount in credit.items():
+        if dispatch:
+            receivables.charge(id_customer, amount)
+        else:
+            receivables.check_credit(id_customer, amount)
+
+    allocations = allocation.split(
+        allocation.allocate(required, location_id=location_id, policy=policy),
+        required_by_sale
+    )
+
+    # Cabeceras de las Órdenes de Venta
+    sales = [
+        SaleOrder(
+            id_sale_order=order['sale_id'],
+            id_customer=order['id_customer'],
+            total_amount=totals[order['sale_id']],
+            currency=order['currency'],
+            status='aprobado' if dispatch else 'reservado',
+            created_by=username
+        )
+        for order in orders
+    ]
+    db.session.add_all(sales)
+    db.session.flush()
+
+    # Líneas en bloque
+    db.session.execute(insert(SaleOrderLine), [
+        {
+            'id_sale_order': order['sale_id'],
+            'id_material': mat_code,
+            'quantity': qty,
+            'unit_price': price,
+            'subtotal': qty * price
+        }
+        for order in orders
+        for mat_code, qty, price in order['lines']
+    ])
+
+    allocation.reserve_many(allocations, username)
+    if dispatch:
+        sale_ids = [order['sale_id'] for order in orders]
+        allocation.consume_many(sale_ids, username)
+        _post_entries(sales, acc_debit, acc_credit, username, entry_numbers)
+        sales_cube.record_sales(sale_ids)
+
+    return sales
+
+
+def confirm_sale(sale, acc_debit, acc_credit, username, entry_number=None):
+    """Despacha una venta reservada: consume sus reservas y genera el asiento"""
+    if sale.status != 'reservado':
+        raise ValueError(f"La venta {sale.id_sale_order} no está reservada")
+    _check_accounts(acc_debit, acc_credit)
+    if entry_number is None:
+        entry_number = next_number('journal')
+
+    receivables.charge(sale.id_customer, sale.total_amount)
+    allocation.consume(sale.id_sale_order, username)
+    sale.status = 'aprobado'
+    entry = _post_entry(sale, acc_debit, acc_credit, username, entry_number)
+    sales_cube.record_sale(sale.id_sale_order)
+    return entry
+
+
+# Ventas despachadas que admiten devolución o anulación
+RETURNABLE_STATUSES = ('aprobado', 'devuelto parcial')
+
+
+def _post_reversal(sale, amount, username, entry_number, description):
+    """Asiento inverso al de la venta por el importe devuelto.
+
+    Cada línea del asiento original se registra con el lado contrario por
+    ``amount`` (los asientos de venta tienen una línea al debe y otra al haber
+    por el total, así el inverso siempre cuadra).
+    """
+    original = JournalEntry.query.filter_by(reference=sale.id_sale_order).order_by(JournalEntry.id).first()
+    if original is None:
+        raise ValueError(f"No se encontró el asiento contable de la venta {sale.id_sale_order}")
+
+    entry = JournalEntry(
+        number=entry_number,
+        description=description,
+        reference=sale.id_sale_order,
+        created_by=username
+    )
+    db.session.add(entry)
+    db.session.flush()
+
+    items = [
+        JournalItem(
+            entry_id=entry.id,
+            account_id=item.account_id,
+            debit=amount if item.credit else 0,
+            credit=amount if item.debit else 0
+        )
+        for item in original.items
+    ]
+    set_amount_currency(items, entry.date)
+    db.session.add_all(items)
+    return entry
+
+
+def return_sale(sale, quantities, username, cancel=False, entry_number=None):
+    """Devuelve total o parcialmente una venta despachada en la transacción actual.
+
+    ``quantities`` es un dict id de línea -> cantidad a devolver; con
+    ``cancel`` se devuelve todo lo pendiente y la venta queda 'cancelado'.
+    Genera las ENTRADAS de inventario a las bodegas de origen, el asiento
+    inverso por el importe devuelto y descuenta el resumen de ventas y el
+    saldo por cobrar del cliente, todo con operaciones en bloque. Lanza ValueError si alguna cantidad no es válida.
+    """
+    if sale.status not in RETURNABLE_STATUSES:
+        raise ValueError(f"La venta {sale.id_sale_order} no admite devoluciones (estado: {sale.status})")
+    if entry_number is None:
+        entry_number = next_number('journal')
+
+    lines = {line.id: line for line in SaleOrderLine.query.filter_by(id_sale_order=sale.id_sale_order)}
+    if cancel:
+        quantities = {line_id: line.quantity - (line.returned_quantity or 0) for line_id, line in lines.items()}
+
+    line_updates = []
+    by_material = {}
+    amount = Decimal('0')
+    cube_deltas = {}
+    for line_id, qty in quantities.items():
+        if not qty:
+            continue
+        line = lines.get(line_id)
+        if line is None:
+            raise ValueError(f"La línea {line_id} no pertenece a la venta {sale.id_sale_order}")
+        returned = line.returned_quantity or 0
+        pending = line.quantity - returned
+        if qty < 0 or qty > pending:
+            raise ValueError(f"{line.id_material}: se pueden devolver como máximo {pending} unidades")
+
+        line_updates.append({'id': line_id, 'returned_quantity': returned + qty})
+        by_material[line.id_material] = by_material.get(line.id_material, 0) + qty
+        line_amount = qty * line.unit_price
+        amount += line_amount
+
+        delta = cube_deltas.setdefault(line.id_material, {
+            'day': sale.issue_date,
+            'id_customer': sale.id_customer,
+            'id_material': line.id_material,
+            'currency': sale.currency,
+            'quantity': 0,
+            'revenue': Decimal('0'),
+            'line_count': 0,
+        })
+        delta['quantity'] -= qty
+        delta['revenue'] -= line_amount
+        if qty == pending:
+            delta['line_count'] -= 1
+
+    if not line_updates:
+        raise ValueError("No se indicaron cantidades a devolver")
+
+    db.session.execute(update(SaleOrderLine), line_updates)
+    allocation.restock(sale.id_sale_order, by_material, username)
+
+    label = "Anulación" if cancel else "Devolución"
+    entry = _post_reversal(sale, amount, username, entry_number,
+                           f"{label} venta {sale.id_sale_order} - Cliente: {sale.id_customer}")
+    sales_cube.apply_deltas(list(cube_deltas.values()))
+    receivables.discharge(sale.id_customer, amount)
+
+    updated = {u['id']: u['returned_quantity'] for u in line_updates}
+    fully_returned = all(updated.get(line_id, line.returned_quantity or 0) >= line.quantity
+                         for line_id, line in lines.items())
+    if cancel:
+        sale.status = 'cancelado'
+    else:
+        sale.status = 'devuelto' if fully_returned else 'devuelto parcial'
+    return entry
+
+
+def release_sale(sale):
+    """Cancela una venta reservada y libera su stock"""
+    if sale.status != 'reservado':
+        raise ValueError(f"La venta {sale.id_sale_order} no está reservada")
+    allocation.release(sale.id_sale_order)
+    sale.status = 'cancelado'
+
+
+# ================================
+# Listado paginado (keyset)
+# ================================
+
+SALE_STATUSES = ['aprobado', 'reservado', 'devuelto parcial', 'devuelto', 'cancelado', 'vencido']
+
+
+def encode_cursor(issue_date, id_):
+    return f"{issue_date.strftime('%Y-%m-%d')}_{id_}"
+
+
+def decode_cursor(cursor):
+    """Cursor 'AAAA-MM-DD_id' -> (fecha, id); None si no es válido"""
+    try:
+        date_part, id_part = cursor.split('_', 1)
+        return datetime.strptime(date_part, '%Y-%m-%d').date(), int(id_part)
+    except (AttributeError, ValueError):
+        return None
+
+
+def sale_page(filters, after=None, before=None, per_page=50):
+    """Una página de ventas ordenada por fecha e id descendentes.
+
+    La paginación es por keyset (fecha, id) sobre el índice de fecha, así el
+    costo no depende de cuántas páginas hay antes. Cliente y número de líneas
+    vienen en la misma consulta. Devuelve (filas, cursor_anterior, cursor_siguiente).
+    """
+    line_count = select(func.count(SaleOrderLine.id)).where(
+        SaleOrderLine.id_sale_order == SaleOrder.id_sale_order
+    ).correlate(SaleOrder).scalar_subquery()
+
+    query = db.session.query(
+        SaleOrder.id,
+        SaleOrder.id_sale_order,
+        SaleOrder.id_customer,
+        Customer.name.label('customer_name'),
+        SaleOrder.issue_date,
+        SaleOrder.total_amount,
+        SaleOrder.status,
+        line_count.label('line_count')
+    ).outerjoin(Customer, Customer.id_customer == SaleOrder.id_customer)
+
+    if filters.get('id_customer'):
+        query = query.filter(SaleOrder.id_customer == filters['id_customer'])
+    if filters.get('status'):
+        query = query.filter(SaleOrder.status == filters['status'])
+    if filters.get('date_from'):
+        query = query.filter(SaleOrder.issue_date >= filters['date_from'])
+    if filters.get('date_to'):
+        query = query.filter(SaleOrder.issue_date <= filters['date_to'])
+
+    after = decode_cursor(after) if after else None
+    before = decode_cursor(before) if before else None
+    if before:
+        # Página anterior: se recorre en orden ascendente y se invierte
+        date_, id_ = before
+        query = query.filter(or_(SaleOrder.issue_date > date_,
+                                 and_(SaleOrder.issue_date == date_, SaleOrder.id > id_)))
+        rows = query.order_by(SaleOrder.issue_date.asc(), SaleOrder.id.asc()).limit(per_page + 1).all()
+        has_more = len(rows) > per_page
+        rows = list(reversed(rows[:per_page]))
+        has_prev, has_next = has_more, True
+    else:
+        if after:
+            date_, id_ = after
+            query = query.filter(or_(SaleOrder.issue_date < date_,
+                                     and_(SaleOrder.issue_date == date_, SaleOrder.id < id_)))
+        rows = query.order_by(SaleOrder.issue_date.desc(), SaleOrder.id.desc()).limit(per_page + 1).all()
+        has_next = len(rows) > per_page
+        rows = rows[:per_page]
+        has_prev = after is not None
+
+    prev_cursor = encode_cursor(rows[0].issue_date, rows[0].id) if rows and has_prev else None
+    next_cursor = encode_cursor(rows[-1].issue_date, rows[-1].id) if rows and has_next else None
+    return rows, prev_cursor, next_cursor
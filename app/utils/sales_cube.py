@@ -0,0 +1,160 @@
+from collections import OrderedDict
+from decimal import Decimal
+
+from sqlalchemy import case, func, insert, type_coerce, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app import db
+from app.models import Money, SaleOrder, SaleOrderLine, SalesDailySummary
+
+# Estados de venta que cuentan como vendidos en el resumen (solo lo no devuelto)
+POSTED_STATUSES = ('aprobado', 'devuelto parcial')
+
+# Dimensiones y medidas permitidas en las consultas del cubo
+DIMENSIONS = OrderedDict([
+    ('day', SalesDailySummary.day),
+    ('customer', SalesDailySummary.id_customer),
+    ('material', SalesDailySummary.id_material),
+    ('currency', SalesDailySummary.currency),
+])
+MEASURES = OrderedDict([
+    ('quantity', SalesDailySummary.quantity),
+    ('revenue', SalesDailySummary.revenue),
+    ('lines', SalesDailySummary.line_count),
+])
+KEY_COLUMNS = ('day', 'id_customer', 'id_material', 'currency')
+
+
+def sale_deltas(sale_ids, sign=1):
+    """Aportes de las ventas al resumen, agrupados por clave del cubo (una consulta).
+
+    Solo cuenta la parte no devuelta de cada línea.
+    """
+    pending = SaleOrderLine.quantity - SaleOrderLine.returned_quantity
+    rows = db.session.query(
+        SaleOrder.issue_date,
+        SaleOrder.id_customer,
+        SaleOrderLine.id_material,
+        SaleOrder.currency,
+        func.sum(pending),
+        func.sum(type_coerce(SaleOrderLine.subtotal - SaleOrderLine.returned_quantity * SaleOrderLine.unit_price,
+                             Money)),
+        func.sum(case((pending > 0, 1), else_=0))
+    ).join(SaleOrderLine, SaleOrderLine.id_sale_order == SaleOrder.id_sale_order
+    ).filter(SaleOrder.id_sale_order.in_(sale_ids)
+    ).group_by(SaleOrder.issue_date, SaleOrder.id_customer,
+               SaleOrderLine.id_material, SaleOrder.currency).all()
+
+    return [
+        {
+            'day': day,
+            'id_customer': id_customer,
+            'id_material': id_material,
+            'currency': currency,
+            'quantity': sign * int(quantity or 0),
+            'revenue': sign * (revenue or Decimal('0')),
+            'line_count': sign * int(lines or 0),
+        }
+        for day, id_customer, id_material, currency, quantity, revenue, lines in rows
+    ]
+
+
+def apply_deltas(deltas):
+    """Suma los aportes al resumen en la transacción actual (upsert en bloque)"""
+    if not deltas:
+        return
+    table = SalesDailySummary.__table__
+    dialect = db.engine.dialect.name
+
+    if dialect in ('sqlite', 'postgresql'):
+        dialect_insert = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+        stmt = dialect_insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(KEY_COLUMNS),
+            set_={
+                'quantity': table.c.quantity + stmt.excluded.quantity,
+                'revenue': table.c.revenue + stmt.excluded.revenue,
+                'line_count': table.c.line_count + stmt.excluded.line_count,
+            }
+        )
+        db.session.execute(stmt, deltas)
+        return
+
+    # Otros motores: UPDATE y, si la clave no existe, INSERT
+    for delta in deltas:
+        updated = db.session.execute(
+            update(table).where(*(table.c[k] == delta[k] for k in KEY_COLUMNS)).values(
+                quantity=table.c.quantity + delta['quantity'],
+                revenue=table.c.revenue + delta['revenue'],
+                line_count=table.c.line_count + delta['line_count'],
+            )
+        ).rowcount
+        if not updated:
+            db.session.execute(insert(table), [delta])
+
+
+def record_sale(sale_id, sign=1):
+    """Agrega (sign=1) o descuenta (sign=-1) una venta del resumen"""
+    record_sales([sale_id], sign)
+
+
+def record_sales(sale_ids, sign=1):
+    """Como record_sale para muchas ventas, en bloques de 500"""
+    for start in range(0, len(sale_ids), 500):
+        apply_deltas(sale_deltas(sale_ids[start:start + 500], sign))
+
+
+def rebuild():
+    """Recalcula el resumen completo desde las líneas de venta. Devuelve filas"""
+    db.session.execute(SalesDailySummary.__table__.delete())
+    sale_ids = [sale_id for (sale_id,) in db.session.query(SaleOrder.id_sale_order)
+                .filter(SaleOrder.status.in_(POSTED_STATUSES))]
+    record_sales(sale_ids)
+    return db.session.query(func.count(SalesDailySummary.id)).scalar()
+
+
+def query_cube(dimensions, measures, date_from=None, date_to=None, granularity='day', filters=None):
+    """Consulta el resumen agrupando por las dimensiones pedidas.
+
+    ``granularity='month'`` agrupa los días por mes (la suma por mes se hace
+    sobre las filas ya agregadas por día). ``filters`` restringe por valor de
+    dimensión, p. ej. {'customer': 'C1'}. Lanza ValueError ante nombres no
+    permitidos.
+    """
+    unknown = [d for d in dimensions if d not in DIMENSIONS] + [m for m in measures if m not in MEASURES]
+    if unknown or granularity not in ('day', 'month'):
+        raise ValueError(f"Parámetros no permitidos: {', '.join(unknown) or granularity}")
+    if not measures:
+        raise ValueError("Debe indicar al menos una medida")
+
+    group_columns = [DIMENSIONS[d] for d in dimensions]
+    query = db.session.query(*group_columns, *(func.sum(MEASURES[m]) for m in measures))
+    if date_from:
+        query = query.filter(SalesDailySummary.day >= date_from)
+    if date_to:
+        query = query.filter(SalesDailySummary.day <= date_to)
+    for name, value in (filters or {}).items():
+        if name not in DIMENSIONS:
+            raise ValueError(f"Parámetros no permitidos: {name}")
+        query = query.filter(DIMENSIONS[name] == value)
+    if group_columns:
+        query = query.group_by(*group_columns).order_by(*group_columns)
+
+    result = OrderedDict()
+    for row in query.all():
+        key = []
+        for name, value in zip(dimensions, row[:len(dimensions)]):
+            if name == 'day':
+                value = value.strftime('%Y-%m') if granularity == 'month' else value.strftime('%Y-%m-%d')
+            key.append(value)
+        key = tuple(key)
+        totals = result.setdefault(key, [Decimal('0')] * len(measures))
+        for i, (name, value) in enumerate(zip(measures, row[len(dimensions):])):
+            totals[i] += Decimal(str(value or 0))
+
+    return [
+        dict(zip(dimensions, key), **{
+            name: (str(value) if name == 'revenue' else int(value)) for name, value in zip(measures, totals)
+        })
+        for key, totals in result.items()
+    ]
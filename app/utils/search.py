@@ -0,0 +1,164 @@
+from sqlalchemy import case, func, literal_column, or_, text
+
+from app import db
+from app.models import Customer, Material, Supplier
+
+# Columnas indexadas para búsqueda de texto por entidad (códigos, nombres e identificación fiscal)
+SEARCH_INDEXES = {
+    'material': (Material, ['id_material', 'name']),
+    'customer': (Customer, ['id_customer', 'name', 'legal_name', 'text_id']),
+    'supplier': (Supplier, ['id_suplier', 'name', 'legal_name', 'text_id']),
+}
+
+# Los trigramas necesitan al menos 3 caracteres; términos más cortos usan LIKE
+MIN_TERM_LENGTH = 3
+
+_available = {}
+
+
+def _table(entity):
+    return SEARCH_INDEXES[entity][0].__tablename__
+
+
+def _sqlite_statements(entity):
+    table = _table(entity)
+    columns = SEARCH_INDEXES[entity][1]
+    search = f'{table}_search'
+    cols = ', '.join(columns)
+    new_cols = ', '.join(f'new.{col}' for col in columns)
+    old_cols = ', '.join(f'old.{col}' for col in columns)
+    return [
+        # Tabla FTS5 de contenido externo: guarda solo el índice, el texto se lee de la tabla original
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {search} USING fts5("
+        f"{cols}, content='{table}', content_rowid='id', tokenize='trigram')",
+        f"CREATE TRIGGER IF NOT EXISTS {search}_ai AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO {search} (rowid, {cols}) VALUES (new.id, {new_cols}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {search}_ad AFTER DELETE ON {table} BEGIN "
+        f"INSERT INTO {search} ({search}, rowid, {cols}) VALUES ('delete', old.id, {old_cols}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {search}_au AFTER UPDATE OF {cols} ON {table} BEGIN "
+        f"INSERT INTO {search} ({search}, rowid, {cols}) VALUES ('delete', old.id, {old_cols}); "
+        f"INSERT INTO {search} (rowid, {cols}) VALUES (new.id, {new_cols}); END",
+        f"INSERT INTO {search} ({search}) VALUES ('rebuild')",
+    ]
+
+
+def _postgresql_statements(entity):
+    table = _table(entity)
+    return [
+        f'CREATE INDEX IF NOT EXISTS ix_{table}_{col}_trgm ON {table} USING gin ({col} gin_trgm_ops)'
+        for col in SEARCH_INDEXES[entity][1]
+    ]
+
+
+def create_search_indexes():
+    """Crea (o reconstruye) los índices de búsqueda de todas las entidades.
+
+    SQLite: tablas FTS5 con tokenizador trigram y triggers que las mantienen
+    al insertar, actualizar o borrar. PostgreSQL: índices GIN pg_trgm por
+    columna. En otros motores no hace nada y las búsquedas usan LIKE.
+    """
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        db.session.execute(text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+    for entity in SEARCH_INDEXES:
+        if dialect == 'sqlite':
+            statements = _sqlite_statements(entity)
+        elif dialect == 'postgresql':
+            statements = _postgresql_statements(entity)
+        else:
+            statements = []
+        for statement in statements:
+            db.session.execute(text(statement))
+    _available.clear()
+
+
+def has_index(entity):
+    """Si la base de datos tiene el índice de búsqueda de la entidad (se consulta una vez por proceso)"""
+    key = (str(db.engine.url), entity)
+    if key not in _available:
+        dialect = db.engine.dialect.name
+        table = _table(entity)
+        if dialect == 'sqlite':
+            found = db.session.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                {'name': f'{table}_search'}
+            ).first()
+        elif dialect == 'postgresql':
+            found = db.session.execute(
+                text("SELECT 1 FROM pg_indexes WHERE indexname = :name"),
+                {'name': f'ix_{table}_{SEARCH_INDEXES[entity][1][0]}_trgm'}
+            ).first()
+        else:
+            found = None
+        _available[key] = found is not None
+    return _available[key]
+
+
+def _fts_query(term, columns):
+    """Expresión MATCH de FTS5: el término como frase literal limitado a las columnas"""
+    phrase = '"' + term.replace('"', '""') + '"'
+    return '{' + ' '.join(columns) + '} : ' + phrase
+
+
+def search_filter(entity, term, columns=None):
+    """Condición sobre el modelo que cumplen las filas con ``term`` en las columnas indexadas.
+
+    No limita las coincidencias, así que se puede combinar con otros filtros,
+    conteos y exportaciones. Con índice en SQLite es ``id IN (SELECT rowid
+    FROM <tabla>_search WHERE ... MATCH ...)``; en PostgreSQL, ILIKE sobre los
+    índices GIN de trigramas. Sin índice, o con términos de menos de 3
+    caracteres, ``contains`` (LIKE '%term%'). None si el término está vacío.
+    """
+    term = (term or '').strip()
+    if not term:
+        return None
+
+    model, indexed = SEARCH_INDEXES[entity]
+    columns = columns or indexed
+    attrs = [getattr(model, col) for col in columns]
+
+    if len(term) < MIN_TERM_LENGTH or not has_index(entity):
+        return or_(*[attr.contains(term) for attr in attrs])
+
+    if db.engine.dialect.name == 'sqlite':
+        search = f'{_table(entity)}_search'
+        matches = db.select(literal_column('rowid')).select_from(text(search)).where(
+            text(f'{search} MATCH :match').bindparams(match=_fts_query(term, columns))
+        )
+        return model.id.in_(matches)
+
+    # PostgreSQL: ILIKE usa los índices GIN de trigramas de cada columna
+    pattern = '%' + term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+    return or_(*[attr.ilike(pattern) for attr in attrs])
+
+
+def apply_search(query, entity, term, columns=None):
+    """Filtra la consulta del modelo por ``term`` (ver search_filter) y la ordena por relevancia.
+
+    Con índice, el orden de relevancia va antes del que agregue quien llama
+    (en SQLite: coincidencia exacta, luego al inicio, luego en medio; en
+    PostgreSQL: similitud de trigramas). Sin índice o con términos cortos solo
+    se filtra, como antes.
+    """
+    condition = search_filter(entity, term, columns)
+    if condition is None:
+        return query
+    query = query.filter(condition)
+
+    term = term.strip()
+    model, indexed = SEARCH_INDEXES[entity]
+    if len(term) < MIN_TERM_LENGTH or not has_index(entity):
+        return query
+    attrs = [getattr(model, col) for col in columns or indexed]
+
+    if db.engine.dialect.name == 'sqlite':
+        relevance = case(
+            (or_(*[func.lower(attr) == term.lower() for attr in attrs]), 0),
+            (or_(*[attr.startswith(term, autoescape=True) for attr in attrs]), 1),
+            else_=2
+        )
+        return query.order_by(relevance)
+
+    similarity = func.greatest(*[func.similarity(func.coalesce(attr, ''), term) for attr in attrs]) \
+        if len(attrs) > 1 else func.similarity(attrs[0], term)
+    return query.order_by(similarity.desc())
@@ -0,0 +1,87 @@
+import threading
+
+from flask import current_app
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+
+
+class SequenceAllocator:
+    """Folios de documentos reservados por bloques.
+
+    Cada proceso reserva ``SEQUENCE_BLOCK_SIZE`` números de golpe incrementando
+    document_sequence en una transacción propia y los entrega desde memoria, de
+    modo que solo hay una ida a la base de datos por bloque. Dos procesos nunca
+    reciben el mismo bloque; los números no usados de un bloque se pierden al
+    reiniciar (puede haber huecos, nunca duplicados).
+
+    La reserva usa una conexión aparte: en SQLite debe pedirse el folio antes
+    de escribir en la sesión, o la segunda conexión esperaría al bloqueo de la
+    primera.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._blocks = {}  # code -> [siguiente, fin) del bloque vigente
+
+    def next_numbers(self, code, count=1):
+        """Lista de ``count`` folios con prefijo para la secuencia ``code``"""
+        prefix = current_app.config['SEQUENCE_PREFIXES'][code]
+        numbers = []
+        with self._lock:
+            while len(numbers) < count:
+                block = self._blocks.get(code)
+                if block is None or block[0] >= block[1]:
+                    size = max(current_app.config['SEQUENCE_BLOCK_SIZE'], count - len(numbers))
+                    block = self._blocks[code] = self._reserve(code, size)
+                take = min(count - len(numbers), block[1] - block[0])
+                numbers.extend(range(block[0], block[0] + take))
+                block[0] += take
+        return [f"{prefix}{number:06d}" for number in numbers]
+
+    def next_number(self, code):
+        return self.next_numbers(code)[0]
+
+    def reset(self):
+        """Descarta los bloques en memoria (p. ej. tras reiniciar la secuencia)"""
+        with self._lock:
+            self._blocks.clear()
+
+    @staticmethod
+    def _reserve(code, size):
+        for _ in range(2):
+            with db.engine.begin() as conn:
+                # El UPDATE toma el bloqueo de la fila antes de leer el nuevo valor
+                updated = conn.execute(
+                    text('UPDATE document_sequence SET next_value = next_value + :size WHERE code = :code'),
+                    {'size': size, 'code': code}
+                ).rowcount
+                if updated:
+                    end = conn.execute(
+                        text('SELECT next_value FROM document_sequence WHERE code = :code'),
+                        {'code': code}
+                    ).scalar()
+                    return [end - size, end]
+            try:
+                with db.engine.begin() as conn:
+                    conn.execute(
+                        text('INSERT INTO document_sequence (code, next_value) VALUES (:code, :next_value)'),
+                        {'code': code, 'next_value': 1 + size}
+                    )
+                return [1, 1 + size]
+            except IntegrityError:
+                # Otro proceso creó la secuencia al mismo tiempo: reintentar el UPDATE
+                continue
+        raise RuntimeError(f"No se pudo reservar un bloque para la secuencia {code}")
+
+
+sequences = SequenceAllocator()
+
+
+def next_number(code):
+    return sequences.next_number(code)
+
+
+def next_numbers(code, count):
+    return sequences.next_numbers(code, count)
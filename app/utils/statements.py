@@ -0,0 +1,286 @@
+from datetime import datetime
+from decimal import Decimal
+
+from sqlalchemy import and_, case, event, func, inspect, select
+from sqlalchemy.orm import object_session
+
+from app import db
+from app.models import AccountAccount, AccountType, AccountGroup, JournalEntry, JournalItem, ReferenceVersion
+from app.utils.cache import LRUCache
+from app.utils.reference import bump_version
+
+# Secciones de los estados financieros según el prefijo del tipo de cuenta
+BALANCE_SECTIONS = [
+    ('ACT', 'Activo'),
+    ('PAS', 'Pasivo'),
+    ('CAPITAL', 'Capital'),
+]
+INCOME_SECTIONS = [
+    ('INGRESOS', 'Ingresos'),
+    ('GASTOS', 'Gastos'),
+    ('RESULTADOS', 'Otros Resultados'),
+]
+
+
+def previous_year(value):
+    """Misma fecha un año antes (29 de febrero pasa a 28)"""
+    try:
+        return value.replace(year=value.year - 1)
+    except ValueError:
+        return value.replace(year=value.year - 1, day=28)
+
+
+def _to_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    return value
+
+
+def _to_decimal(value):
+    if value is None:
+        return Decimal('0')
+    if isinstance(value, Decimal):
+        return value
+    return Decimal(str(value))
+
+
+def _section_for(type_id, sections):
+    for prefix, label in sections:
+        if type_id and type_id.upper().startswith(prefix):
+            return label
+    return None
+
+
+def _period_sum(column, date_from, date_to):
+    condition = JournalEntry.date <= date_to
+    if date_from:
+        condition = and_(JournalEntry.date >= date_from, condition)
+    return func.sum(case((condition, column), else_=0))
+
+
+def _aggregate(periods):
+    """Saldos por tipo, grupo y naturaleza para varios periodos en una sola consulta.
+
+    ``periods`` es una lista de tuplas (desde, hasta); ``desde`` puede ser None
+    para acumular desde el inicio. Devuelve filas con un saldo por periodo.
+    """
+    columns = []
+    for date_from, date_to in periods:
+        columns.append(_period_sum(JournalItem.debit, date_from, date_to))
+        columns.append(_period_sum(JournalItem.credit, date_from, date_to))
+
+    query = db.session.query(
+        AccountAccount.account_type,
+        AccountType.name,
+        AccountAccount.account_group,
+        AccountGroup.name,
+        AccountAccount.nature,
+        *columns
+    ).join(JournalItem, JournalItem.account_id == AccountAccount.id_account
+    ).join(JournalEntry, JournalEntry.id == JournalItem.entry_id
+    ).outerjoin(AccountType, AccountType.id == AccountAccount.account_type_id
+    ).outerjoin(AccountGroup, AccountGroup.id == AccountAccount.account_group_id
+    ).filter(JournalEntry.date <= max(date_to for _, date_to in periods))
+
+    earliest = [date_from for date_from, _ in periods]
+    if all(earliest):
+        query = query.filter(JournalEntry.date >= min(earliest))
+
+    rows = query.group_by(
+        AccountAccount.account_type, AccountType.name,
+        AccountAccount.account_group, AccountGroup.name,
+        AccountAccount.nature
+    ).all()
+
+    result = []
+    for type_id, type_name, group_id, group_name, nature, *sums in rows:
+        balances = []
+        for i in range(len(periods)):
+            debit = _to_decimal(sums[2 * i])
+            credit = _to_decimal(sums[2 * i + 1])
+            # DEUDORA: Debe - Haber | ACREEDORA: Haber - Debe
+            balances.append(debit - credit if nature == 'DEUDORA' else credit - debit)
+        result.append((type_id, type_name or type_id, group_id, group_name or group_id, balances))
+    return result
+
+
+def _build_sections(rows, sections, width):
+    built = {label: {'name': label, 'rows': {}, 'totals': [Decimal('0')] * width} for _, label in sections}
+    for type_id, type_name, group_id, group_name, balances in rows:
+        label = _section_for(type_id, sections)
+        if not label:
+            continue
+        section = built[label]
+        key = (type_name, group_name)
+        row = section['rows'].setdefault(key, {'type': type_name, 'group': group_name,
+                                               'amounts': [Decimal('0')] * width})
+        for i, amount in enumerate(balances):
+            row['amounts'][i] += amount
+            section['totals'][i] += amount
+
+    ordered = []
+    for _, label in sections:
+        section = built[label]
+        section['rows'] = sorted(section['rows'].values(), key=lambda r: (r['type'], r['group']))
+        ordered.append(section)
+    return ordered
+
+
+def balance_sheet(date_to, compare_to):
+    """Balance general al corte con columna comparativa"""
+    periods = [(None, date_to), (None, compare_to)]
+    rows = _aggregate(periods)
+    sections = _build_sections(rows, BALANCE_SECTIONS, len(periods))
+
+    # El resultado acumulado de ingresos y gastos se presenta dentro del capital
+    income = _build_sections(rows, INCOME_SECTIONS, len(periods))
+    net_result = _net_result(income, len(periods))
+    capital = sections[2]
+    capital['rows'].append({'type': 'Resultado del ejercicio', 'group': '', 'amounts': net_result})
+    capital['totals'] = [total + result for total, result in zip(capital['totals'], net_result)]
+
+    liabilities_equity = [l + c for l, c in zip(sections[1]['totals'], capital['totals'])]
+    return {
+        'kind': 'balance_sheet',
+        'title': 'Balance General',
+        'columns': [f"Al {date_to.strftime('%Y-%m-%d')}", f"Al {compare_to.strftime('%Y-%m-%d')}"],
+        'sections': sections,
+        'summary': [('Total Pasivo + Capital', liabilities_equity)],
+    }
+
+
+def income_statement(date_from, date_to, compare_from, compare_to):
+    """Estado de resultados del periodo con columna comparativa"""
+    periods = [(date_from, date_to), (compare_from, compare_to)]
+    sections = _build_sections(_aggregate(periods), INCOME_SECTIONS, len(periods))
+    return {
+        'kind': 'income_statement',
+        'title': 'Estado de Resultados',
+        'columns': [f"{a.strftime('%Y-%m-%d')} a {b.strftime('%Y-%m-%d')}" for a, b in periods],
+        'sections': sections,
+        'summary': [('Resultado del periodo', _net_result(sections, len(periods)))],
+    }
+
+
+def _net_result(income_sections, width):
+    by_name = {section['name']: section['totals'] for section in income_sections}
+    result = [Decimal('0')] * width
+    for i in range(width):
+        result[i] = (by_name['Ingresos'][i] - by_name['Gastos'][i] + by_name['Otros Resultados'][i])
+    return result
+
+
+# ================================
+# Caché de estados renderizados
+# ================================
+
+# Cada combinación de fechas y comparación de la consulta es una entrada
+CACHE_SIZE = 128
+CACHE_TTL = 600
+
+# Contadores en reference_version: uno por mes con asientos modificados y uno
+# general para los cambios de cuentas, que afectan a todos los periodos
+STATEMENT_VERSION = 'statement'
+
+
+def _month_version(value):
+    return f"{STATEMENT_VERSION}:{value.strftime('%Y-%m')}"
+
+
+def _statement_versions(ranges):
+    """Contadores que cubren ``ranges``: cambian si otro proceso registra un asiento en el periodo"""
+    table = ReferenceVersion.__table__
+    versions = db.session.execute(
+        select(table.c.name, table.c.version).where(table.c.name.like(f'{STATEMENT_VERSION}%'))
+    ).all()
+    bounds = [(start and _month_version(start), _month_version(end)) for start, end in ranges]
+    return tuple(sorted(
+        (name, version) for name, version in versions
+        if name == STATEMENT_VERSION
+        or any((start is None or start <= name) and name <= end for start, end in bounds)
+    ))
+
+
+class StatementCache:
+    """Estados financieros renderizados por periodo.
+
+    La clave de cada entrada incluye los contadores de los meses que cubren
+    sus rangos de fechas; registrar o modificar un asiento (o una de sus
+    líneas) en cualquier proceso incrementa el contador de su mes y las
+    entradas que lo incluyen dejan de usarse. Las entradas viven en un
+    LRUCache: a lo sumo CACHE_SIZE combinaciones de fechas y comparación,
+    durante CACHE_TTL segundos.
+    """
+
+    def __init__(self, maxsize=CACHE_SIZE, ttl=CACHE_TTL):
+        self._cache = LRUCache(maxsize=maxsize, ttl=ttl)
+
+    def get_or_render(self, key, ranges, render):
+        return self._cache.get((key, _statement_versions(ranges)), render)
+
+    def invalidate(self):
+        self._cache.invalidate()
+
+
+statement_cache = StatementCache()
+
+
+# Las fechas afectadas se acumulan durante el flush y sus contadores se
+# incrementan en la misma transacción: si se revierte, no cuentan
+_ALL_DATES = object()
+
+
+def _mark_dirty(target, *dates):
+    session = object_session(target)
+    if session is None:
+        statement_cache.invalidate()
+        return
+    pending = session.info.setdefault('statement_dates', set())
+    pending.update(_ALL_DATES if d is None else _to_date(d) for d in dates)
+
+
+@event.listens_for(JournalEntry, 'after_insert')
+@event.listens_for(JournalEntry, 'after_delete')
+def _journal_entry_changed(mapper, connection, target):
+    _mark_dirty(target, target.date)
+
+
+@event.listens_for(JournalEntry, 'after_update')
+def _journal_entry_updated(mapper, connection, target):
+    # Si cambió la fecha, también se invalida el periodo anterior
+    _mark_dirty(target, target.date, *inspect(target).attrs.date.history.deleted)
+
+
+@event.listens_for(JournalItem, 'after_insert')
+@event.listens_for(JournalItem, 'after_update')
+@event.listens_for(JournalItem, 'after_delete')
+def _journal_item_changed(mapper, connection, target):
+    # Una línea agregada, corregida o borrada cambia los saldos en la fecha de
+    # su asiento (y en la del anterior si se movió de asiento)
+    entry_ids = {target.entry_id, *inspect(target).attrs.entry_id.history.deleted} - {None}
+    dates = connection.execute(select(JournalEntry.date).where(JournalEntry.id.in_(entry_ids))).scalars().all()
+    _mark_dirty(target, *dates)
+
+
+@event.listens_for(AccountAccount, 'after_update')
+@event.listens_for(AccountAccount, 'after_delete')
+def _account_changed(mapper, connection, target):
+    # Cambiar tipo, grupo o naturaleza de una cuenta afecta a todos los periodos
+    _mark_dirty(target, None)
+
+
+@event.listens_for(db.session, 'after_flush')
+def _bump_statement_versions(session, flush_context):
+    pending = session.info.pop('statement_dates', None)
+    if not pending:
+        return
+    if _ALL_DATES in pending:
+        bump_version(STATEMENT_VERSION, session)
+        return
+    for name in sorted({_month_version(entry_date) for entry_date in pending}):
+        bump_version(name, session)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_pending(session):
+    session.info.pop('statement_dates', None)
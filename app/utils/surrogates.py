@@ -0,0 +1,124 @@
+from collections import namedtuple
+from itertools import chain
+
+from sqlalchemy import bindparam, event, select, update
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import get_history, set_committed_value
+
+from app.models import (
+    AccountAccount, AccountGroup, AccountNature, AccountType, Customer, CustomerPayment, DiscountRule,
+    InventoryMovement, InventoryStock, Material, MaterialType, PriceListItem, PurchaseOrder, PurchaseOrderLine,
+    SaleOrder, SaleOrderLine, SaleQuotation, SaleQuotationLine, SalesDailySummary, StockReservation, Supplier, Unit
+)
+
+# Columna de código que se conserva (model.code), su clave entera (model.key) y
+# la tabla y código a los que apunta (target.target_code)
+Reference = namedtuple('Reference', ['model', 'code', 'key', 'target', 'target_code'])
+
+SURROGATE_KEYS = [
+    Reference(PurchaseOrder, 'id_supplier', 'supplier_id', Supplier, 'id_suplier'),
+    Reference(PurchaseOrderLine, 'id_purchase_order', 'purchase_order_id', PurchaseOrder, 'id_purchase_order'),
+    Reference(PurchaseOrderLine, 'id_material', 'material_id', Material, 'id_material'),
+    Reference(Material, 'unit', 'unit_id', Unit, 'symbol'),
+    Reference(Material, 'type', 'type_id', MaterialType, 'name'),
+    Reference(AccountAccount, 'account_type', 'account_type_id', AccountType, 'id_account_type'),
+    Reference(AccountAccount, 'account_group', 'account_group_id', AccountGroup, 'id_account_group'),
+    Reference(AccountAccount, 'nature', 'nature_id', AccountNature, 'id_account_nature'),
+]
+
+# Tablas que guardan el código sin clave entera: al renombrar el código se
+# actualizan por el valor anterior para no dejar historia huérfana. Las que
+# tienen clave foránea al código la declaran ON UPDATE CASCADE, así que en los
+# motores que la aplican la base ya las actualizó y aquí no cambia nada
+CODE_REFERENCES = {
+    (Material, 'id_material'): [
+        SaleOrderLine.id_material, SaleQuotationLine.id_material, InventoryStock.id_material,
+        InventoryMovement.id_material, StockReservation.id_material, PriceListItem.id_material,
+        DiscountRule.id_material, SalesDailySummary.id_material,
+    ],
+    (Customer, 'id_customer'): [
+        SaleOrder.id_customer, SaleQuotation.id_customer, CustomerPayment.id_customer,
+        SalesDailySummary.id_customer,
+    ],
+}
+
+
+def _resolve(connection, reference, codes):
+    """Código -> id de la tabla destino (los códigos destino son únicos)"""
+    target_code = getattr(reference.target, reference.target_code)
+    return dict(connection.execute(select(target_code, reference.target.id).where(target_code.in_(codes))).all())
+
+
+def _changed(session, obj, attr):
+    return obj in session.new or get_history(obj, attr).has_changes()
+
+
+def _sync_keys(session, connection):
+    """Completa las claves enteras de las filas insertadas o con código cambiado en el flush"""
+    for reference in SURROGATE_KEYS:
+        objects = [
+            obj for obj in chain(session.new, session.dirty)
+            if isinstance(obj, reference.model) and _changed(session, obj, reference.code)
+        ]
+        if not objects:
+            continue
+        ids = _resolve(connection, reference, {getattr(obj, reference.code) for obj in objects})
+        table = reference.model.__table__
+        connection.execute(
+            update(table).where(table.c.id == bindparam('_id')).values({reference.key: bindparam('_key')}),
+            [{'_id': obj.id, '_key': ids.get(getattr(obj, reference.code))} for obj in objects]
+        )
+        for obj in objects:
+            set_committed_value(obj, reference.key, ids.get(getattr(obj, reference.code)))
+
+
+def _renamed(obj, attr):
+    """(anterior, nuevo) si el flush cambió el código; (None, None) si no"""
+    history = get_history(obj, attr)
+    if history.deleted and history.added and history.deleted[0] != history.added[0]:
+        return history.deleted[0], history.added[0]
+    return None, None
+
+
+def _propagate_renames(session, connection):
+    """Lleva el código nuevo a las filas que apuntan al registro renombrado"""
+    for obj in session.dirty:
+        for reference in SURROGATE_KEYS:
+            if isinstance(obj, reference.target):
+                old, new = _renamed(obj, reference.target_code)
+                if old is not None:
+                    table = reference.model.__table__
+                    connection.execute(
+                        update(table).where(table.c[reference.key] == obj.id).values(
+                            {reference.code: new})
+                    )
+        for (model, code), columns in CODE_REFERENCES.items():
+            if isinstance(obj, model):
+                old, new = _renamed(obj, code)
+                if old is not None:
+                    for column in columns:
+                        connection.execute(update(column.table).where(column == old).values({column.key: new}))
+
+
+def _adopt_orphans(session, connection):
+    """Asigna un registro nuevo a las filas que ya tenían su código pero sin clave entera"""
+    for obj in session.new:
+        for reference in SURROGATE_KEYS:
+            if isinstance(obj, reference.target):
+                table = reference.model.__table__
+                connection.execute(
+                    update(table).where(
+                        table.c[reference.key].is_(None),
+                        table.c[reference.code] == getattr(obj, reference.target_code)
+                    ).values({reference.key: obj.id})
+                )
+
+
+@event.listens_for(Session, 'after_flush')
+def _maintain_references(session, flush_context):
+    # Las filas ya están escritas (también las padre nuevas del mismo flush), así
+    # que las claves se resuelven con SQL directo en la misma transacción
+    connection = session.connection()
+    _propagate_renames(session, connection)
+    _adopt_orphans(session, connection)
+    _sync_keys(session, connection)
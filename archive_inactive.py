@@ -0,0 +1,27 @@
+"""Archiva materiales, clientes y proveedores inactivos.
+
+Pensado para ejecutarse periódicamente (cron): marca como archivados los
+registros con estado inactivo que no han cambiado en los últimos N días.
+Siguen en sus tablas, pero los listados, grillas y exportaciones los omiten
+salvo que se pidan con archived=1.
+
+    python archive_inactive.py --days 365
+    python archive_inactive.py --entity customer
+"""
+import argparse
+
+from app import create_app, db
+from app.utils.archive import ARCHIVE_AFTER_DAYS, ARCHIVE_SOURCES, archive_inactive
+
+parser = argparse.ArgumentParser(description='Archivar datos maestros inactivos')
+parser.add_argument('--days', type=int, default=ARCHIVE_AFTER_DAYS, help='Días sin cambios para archivar')
+parser.add_argument('--entity', choices=sorted(ARCHIVE_SOURCES), help='Solo esta entidad (por defecto todas)')
+args = parser.parse_args()
+
+app = create_app()
+
+with app.app_context():
+    for entity in [args.entity] if args.entity else ARCHIVE_SOURCES:
+        count = archive_inactive(entity, days=args.days)
+        db.session.commit()
+        print(f"{entity}: {count} archivados")
@@ -0,0 +1,69 @@
+"""Rendimiento de la carga masiva de materiales.
+
+Genera un catálogo CSV con el formato de la plantilla de materiales y lo
+carga dos veces en una base de datos de prueba (por defecto un SQLite
+temporal; se puede indicar otra con DATABASE_URL): la primera inserta todas
+las filas y la segunda las actualiza.
+
+    python benchmark_bulk_import.py --rows 500000
+"""
+import argparse
+import csv
+import os
+import tempfile
+import tracemalloc
+
+parser = argparse.ArgumentParser(description='Benchmark de carga masiva de materiales')
+parser.add_argument('--rows', type=int, default=500000, help='Filas del catálogo')
+parser.add_argument('--chunk-size', type=int, default=None, help='Filas por bloque (por defecto CHUNK_SIZE)')
+parser.add_argument('--memory', action='store_true', help='Medir la memoria máxima (tracemalloc, más lento)')
+args = parser.parse_args()
+
+workdir = tempfile.mkdtemp()
+if not os.environ.get('DATABASE_URL'):
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(workdir, 'benchmark.db')
+
+from app import create_app, db
+from app.models import MaterialType
+from app.utils.bulk_import import CHUNK_SIZE, import_materials
+
+app = create_app()
+
+
+def write_catalogue(path, rows):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['ID_Material', 'Nombre', 'Descripcion', 'Unidad', 'Tipo', 'Estado'])
+        for i in range(rows):
+            writer.writerow([f'BM-{i:07d}', f'Material {i}', f'Descripción del material {i}',
+                             'pza', 'BM-Tipo', '1'])
+
+
+def run(label, path):
+    if args.memory:
+        tracemalloc.start()
+    with open(path, newline='', encoding='utf-8-sig') as stream:
+        result = import_materials(stream, 'benchmark', chunk_size=args.chunk_size or CHUNK_SIZE)
+    db.session.commit()
+    line = (f"{label:<13} creados {result.created:>8}  actualizados {result.updated:>8}  "
+            f"{result.seconds:7.1f} s  {result.rate:10,.0f} filas/s")
+    if args.memory:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        line += f"  memoria máx. {peak / 2 ** 20:6.1f} MB"
+    print(line)
+
+
+with app.app_context():
+    db.create_all()
+    if not MaterialType.query.filter_by(name='BM-Tipo').first():
+        db.session.add(MaterialType(name='BM-Tipo'))
+        db.session.commit()
+
+    path = os.path.join(workdir, 'catalogo.csv')
+    write_catalogue(path, args.rows)
+    print(f"Base de datos: {db.engine.url.render_as_string(hide_password=True)}")
+    print(f"Catálogo: {args.rows} filas, bloques de {args.chunk_size or CHUNK_SIZE}\n")
+
+    run('Inserción', path)
+    run('Actualización', path)
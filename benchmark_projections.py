@@ -0,0 +1,120 @@
+"""Memoria y CPU de las proyecciones de columnas frente a cargar entidades.
+
+Llena una base de datos de prueba (por defecto un SQLite temporal; se puede
+indicar otra con DATABASE_URL) con materiales y clientes, y lee todas las
+filas de tres formas: objetos completos del ORM, la proyección de la vista
+de lista y la de exportación recorrida por bloques. Los resultados se
+muestran por cada 100 000 filas.
+
+    python benchmark_projections.py --rows 200000
+"""
+import argparse
+import gc
+import os
+import tempfile
+import time
+import tracemalloc
+
+parser = argparse.ArgumentParser(description='Benchmark de proyecciones de columnas')
+parser.add_argument('--rows', type=int, default=200000, help='Filas por entidad')
+parser.add_argument('--repeat', type=int, default=3, help='Repeticiones de cada lectura (se toma la mejor)')
+args = parser.parse_args()
+
+if not os.environ.get('DATABASE_URL'):
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'benchmark.db')
+
+from app import create_app, db
+from app.models import Customer, Material
+from app.utils.projections import project, stream
+
+app = create_app()
+
+PER_ROWS = 100000
+
+
+def seed(model, key, make_row):
+    existing = db.session.query(model).filter(getattr(model, key).like('BM-%')).count()
+    rows = [make_row(i) for i in range(existing, args.rows)]
+    for start in range(0, len(rows), 5000):
+        db.session.execute(model.__table__.insert(), rows[start:start + 5000])
+    db.session.commit()
+
+
+def material_row(i):
+    return {'id_material': f'BM-{i:07d}', 'name': f'Material {i}', 'description': f'Descripción del material {i}',
+            'unit': 'pza', 'type': 'BM-Tipo', 'status': True, 'created_by': 'benchmark'}
+
+
+def customer_row(i):
+    return {'id_customer': f'BM-{i:07d}', 'legal_name': f'Cliente {i} SA de CV', 'name': f'Cliente {i}',
+            'country': 'Mexico', 'currency': 'MXN', 'text_id': f'XAX{i:010d}', 'city': 'Monterrey',
+            'address': f'Calle {i}', 'phone': '8180000000', 'email': f'cliente{i}@example.com',
+            'contact_name': 'Contacto', 'status': True, 'created_by': 'benchmark', 'receivable_balance': 0}
+
+
+def load_entities(model):
+    rows = model.query.order_by(model.id).all()
+    return len(rows), rows
+
+
+def load_list(entity, model):
+    rows = project(model.query, entity, 'list').order_by(model.id).all()
+    return len(rows), rows
+
+
+def walk_export(entity, model):
+    count = 0
+    for _ in stream(project(model.query, entity, 'export').order_by(model.id)):
+        count += 1
+    return count, None
+
+
+def measure(read):
+    """(segundos, MB máximos) de la lectura; la sesión se limpia antes de cada una"""
+    best = None
+    for _ in range(args.repeat):
+        db.session.expunge_all()
+        gc.collect()
+        start = time.perf_counter()
+        count, rows = read()
+        seconds = time.perf_counter() - start
+        del rows
+        best = seconds if best is None else min(best, seconds)
+
+    db.session.expunge_all()
+    gc.collect()
+    tracemalloc.start()
+    count, rows = read()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del rows
+    db.session.expunge_all()
+    return count, best, peak / 2 ** 20
+
+
+def report(label, count, seconds, megabytes, baseline=None):
+    scale = PER_ROWS / count if count else 0
+    line = f"  {label:<26} {seconds * scale:7.3f} s   {megabytes * scale:8.1f} MB"
+    if baseline:
+        line += f"   ({seconds / baseline[0]:4.0%} del tiempo, {megabytes / baseline[1]:4.0%} de la memoria)"
+    print(line)
+
+
+with app.app_context():
+    db.create_all()
+    seed(Material, 'id_material', material_row)
+    seed(Customer, 'id_customer', customer_row)
+
+    print(f"Base de datos: {db.engine.url.render_as_string(hide_password=True)}")
+    print(f"{args.rows} filas por entidad; tiempo y memoria máxima por cada {PER_ROWS:,} filas\n")
+
+    for entity, model in [('material', Material), ('customer', Customer)]:
+        print(entity)
+        count, seconds, megabytes = measure(lambda: load_entities(model))
+        report('Entidades del ORM', count, seconds, megabytes)
+        baseline = (seconds, megabytes)
+        count, seconds, megabytes = measure(lambda: load_list(entity, model))
+        report('Proyección de lista', count, seconds, megabytes, baseline)
+        count, seconds, megabytes = measure(lambda: walk_export(entity, model))
+        report('Exportación por bloques', count, seconds, megabytes, baseline)
+        print()
@@ -0,0 +1,94 @@
+"""Rendimiento de la conversión de cotizaciones en ventas.
+
+Crea una base de datos de prueba (por defecto un SQLite temporal; se puede
+indicar otra con DATABASE_URL), registra N cotizaciones aceptadas y compara
+la conversión en lote (una transacción) contra la conversión una por una.
+
+    python benchmark_quotations.py --quotations 500 --lines 5
+"""
+import argparse
+import os
+import tempfile
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+parser = argparse.ArgumentParser(description='Benchmark de conversión de cotizaciones')
+parser.add_argument('--quotations', type=int, default=500, help='Cotizaciones por corrida')
+parser.add_argument('--lines', type=int, default=5, help='Líneas por cotización')
+parser.add_argument('--materials', type=int, default=50, help='Materiales distintos')
+args = parser.parse_args()
+
+if not os.environ.get('DATABASE_URL'):
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'benchmark.db')
+
+from app import create_app, db
+from app.models import (
+    AccountAccount, Customer, InventoryStock, Location, Material, SaleQuotation
+)
+from app.utils.quotations import create_quotation, convert_quotations
+from app.utils.sequences import next_numbers
+
+app = create_app()
+
+
+def seed():
+    db.create_all()
+    for code, name in [('BM-1105', 'Clientes'), ('BM-4105', 'Ventas')]:
+        if not AccountAccount.query.filter_by(id_account=code).first():
+            db.session.add(AccountAccount(id_account=code, code=code, name=name, account_type='BM',
+                                          account_group='BM', nature='BM', currency_id=app.config['FUNCTIONAL_CURRENCY'],
+                                          country_id='MX', status=True, created_by='benchmark'))
+    if not Customer.query.filter_by(id_customer='BM-CLI').first():
+        db.session.add(Customer(id_customer='BM-CLI', legal_name='Cliente Benchmark', name='Benchmark',
+                                country='Mexico', currency=app.config['FUNCTIONAL_CURRENCY'], created_by='benchmark'))
+    location = Location.query.filter_by(code='BM-BOD').first()
+    if location is None:
+        location = Location(name='Bodega Benchmark', code='BM-BOD', created_by='benchmark')
+        db.session.add(location)
+        db.session.flush()
+    for i in range(args.materials):
+        mat_code = f'BM-MAT-{i:03d}'
+        if not Material.query.filter_by(id_material=mat_code).first():
+            db.session.add(Material(id_material=mat_code, name=mat_code, unit='pza', type='Insumo', created_by='benchmark'))
+        stock = InventoryStock.query.filter_by(id_material=mat_code, id_location=location.id).first()
+        if stock is None:
+            db.session.add(InventoryStock(id_material=mat_code, id_location=location.id, quantity=10 ** 9,
+                                          unit_type='pza', created_by='benchmark'))
+    db.session.commit()
+    return location.id
+
+
+def make_quotations(count):
+    numbers = next_numbers('quotation', count)
+    valid_until = date.today() + timedelta(days=30)
+    for n, id_quotation in enumerate(numbers):
+        lines = [(f'BM-MAT-{(n + i) % args.materials:03d}', 1 + i, Decimal('10.00')) for i in range(args.lines)]
+        quotation = create_quotation(id_quotation, 'BM-CLI', lines, 'benchmark', valid_until=valid_until)
+        quotation.status = 'aceptada'
+    db.session.commit()
+    return SaleQuotation.query.filter(SaleQuotation.id_quotation.in_(numbers)).order_by(SaleQuotation.id).all()
+
+
+def report(label, seconds, count):
+    print(f"{label:<28} {seconds:8.2f} s  {count / seconds:10.1f} cotizaciones/s")
+
+
+with app.app_context():
+    location_id = seed()
+    total = args.quotations
+    print(f"Base de datos: {db.engine.url.render_as_string(hide_password=True)}")
+    print(f"{total} cotizaciones de {args.lines} líneas\n")
+
+    quotations = make_quotations(total)
+    start = time.perf_counter()
+    convert_quotations(quotations, 'BM-1105', 'BM-4105', 'benchmark', location_id=location_id)
+    db.session.commit()
+    report('Lote (una transacción)', time.perf_counter() - start, total)
+
+    quotations = make_quotations(total)
+    start = time.perf_counter()
+    for quotation in quotations:
+        convert_quotations([quotation], 'BM-1105', 'BM-4105', 'benchmark', location_id=location_id)
+        db.session.commit()
+    report('Una por una', time.perf_counter() - start, total)
@@ -5,6 +5,33 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///erp.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
+    # Moneda funcional de la contabilidad (símbolo de Currency)
+    FUNCTIONAL_CURRENCY = os.environ.get('FUNCTIONAL_CURRENCY') or 'MXN'
+    
+    # Folios de documentos: prefijo por secuencia y números reservados por bloque en cada proceso
+    SEQUENCE_PREFIXES = {
+        'sale': os.environ.get('SEQUENCE_PREFIX_SALE') or 'VTA-',
+        'purchase': os.environ.get('SEQUENCE_PREFIX_PURCHASE') or 'OC-',
+        'journal': os.environ.get('SEQUENCE_PREFIX_JOURNAL') or 'AS-',
+        'quotation': os.environ.get('SEQUENCE_PREFIX_QUOTATION') or 'COT-',
+    }
+    SEQUENCE_BLOCK_SIZE = int(os.environ.get('SEQUENCE_BLOCK_SIZE') or 50)
+    
+    # Asignación de stock en ventas: main (bodega principal primero), nearest (prioridad), largest (mayor stock)
+    ALLOCATION_POLICY = os.environ.get('ALLOCATION_POLICY') or 'main'
+    RESERVATION_TTL_MINUTES = int(os.environ.get('RESERVATION_TTL_MINUTES') or 1440)
+    
+    # Días de vigencia por defecto de una cotización
+    QUOTATION_VALID_DAYS = int(os.environ.get('QUOTATION_VALID_DAYS') or 30)
+    
+    # Tiempo que se guarda el resultado de una solicitud con clave de idempotencia
+    IDEMPOTENCY_TTL_HOURS = int(os.environ.get('IDEMPOTENCY_TTL_HOURS') or 24)
+    # Segundos tras los que una clave 'en proceso' se considera abandonada (el proceso murió
+    # antes de confirmar). Debe ser mucho mayor que la solicitud más lenta (conversión de
+    # cotizaciones en lote, devoluciones grandes): si el original sigue en curso, su commit
+    # falla en lugar de duplicar el registro, pero el usuario ve un error
+    IDEMPOTENCY_STALE_SECONDS = int(os.environ.get('IDEMPOTENCY_STALE_SECONDS') or 900)
+    
     # Configuración de logos
     LOGO_LOGIN = 'images/logos/logo.jpg'
     LOGO_NAVBAR = 'images/logos/logo.jpg'
@@ -0,0 +1,369 @@
+from app import create_app, db
+from sqlalchemy import Integer, inspect, text
+from datetime import datetime
+
+# Migraciones de esquema para bases de datos existentes.
+# db.create_all() crea las tablas nuevas, pero no agrega columnas ni índices a
+# tablas que ya existen; cada paso se registra en schema_migration y solo se
+# aplica una vez.
+
+
+def _has_column(table, column):
+    return column in {col['name'] for col in inspect(db.engine).get_columns(table)}
+
+
+def _add_column(table, column, ddl):
+    if not _has_column(table, column):
+        db.session.execute(text(f'ALTER TABLE {table} ADD COLUMN {column} {ddl}'))
+
+
+def journal_item_amount_currency():
+    """Importe en moneda de la cuenta para revaluación"""
+    _add_column('journal_item', 'amount_currency', 'NUMERIC(15, 2)')
+
+
+def account_account_path():
+    """Ruta materializada de la jerarquía de cuentas"""
+    from app.utils.account_tree import compute_paths
+
+    _add_column('account_account', 'path', 'VARCHAR(500)')
+    db.session.execute(text('CREATE INDEX IF NOT EXISTS ix_account_account_path ON account_account (path)'))
+
+    parents = dict(db.session.execute(text('SELECT id_account, parent_account FROM account_account')).all())
+    paths = compute_paths(parents)
+    if paths:
+        db.session.execute(
+            text('UPDATE account_account SET path = :path WHERE id_account = :id_account'),
+            [{'id_account': id_account, 'path': path} for id_account, path in paths.items()]
+        )
+
+
+def account_account_path_repair():
+    """Rutas faltantes de cuentas insertadas fuera de la aplicación e índice por bytes en PostgreSQL"""
+    from app.utils.account_tree import compute_paths
+
+    if db.engine.dialect.name == 'postgresql':
+        # Los subárboles se consultan por rango de path con COLLATE "C"
+        db.session.execute(text(
+            'CREATE INDEX IF NOT EXISTS ix_account_account_path_c ON account_account (path COLLATE "C")'
+        ))
+
+    rows = db.session.execute(text('SELECT id_account, parent_account, path FROM account_account')).all()
+    paths = compute_paths({id_account: parent for id_account, parent, _ in rows})
+    missing = [{'id_account': id_account, 'path': paths[id_account]} for id_account, _, path in rows if path is None]
+    if missing:
+        db.session.execute(
+            text('UPDATE account_account SET path = :path WHERE id_account = :id_account'), missing
+        )
+
+
+# Columnas monetarias que pasan a centavos enteros (tipo Money)
+MONEY_COLUMNS = [
+    ('journal_item', 'debit'),
+    ('journal_item', 'credit'),
+    ('journal_item', 'amount_currency'),
+    ('purchase_order', 'total_amount'),
+    ('purchase_order_line', 'price'),
+    ('sale_order', 'total_amount'),
+    ('sale_order_line', 'unit_price'),
+    ('sale_order_line', 'subtotal'),
+]
+
+
+def money_to_cents():
+    """Importes monetarios como enteros en centavos"""
+    dialect = db.engine.dialect.name
+    inspector = inspect(db.engine)
+    for table, column in MONEY_COLUMNS:
+        types = {col['name']: col['type'] for col in inspector.get_columns(table)}
+        # Las columnas ya enteras (creadas por db.create_all() con el tipo Money)
+        # ya están en centavos y no se vuelven a multiplicar
+        if column not in types or isinstance(types[column], Integer):
+            continue
+        if dialect == 'sqlite':
+            # SQLite no permite cambiar el tipo de una columna. En las columnas
+            # de afinidad REAL los centavos quedan como flotantes con valor
+            # entero: Money los convierte con int() al leer y SUM() es exacto
+            # mientras el total no pase de 2**53 centavos
+            db.session.execute(text(
+                f'UPDATE {table} SET {column} = CAST(ROUND({column} * 100) AS INTEGER) '
+                f'WHERE {column} IS NOT NULL'
+            ))
+        elif dialect == 'postgresql':
+            db.session.execute(text(
+                f'ALTER TABLE {table} ALTER COLUMN {column} TYPE BIGINT USING ROUND({column} * 100)'
+            ))
+        else:
+            db.session.execute(text(f'UPDATE {table} SET {column} = ROUND({column} * 100)'))
+            db.session.execute(text(f'ALTER TABLE {table} MODIFY {column} BIGINT'))
+
+
+def journal_entry_number():
+    """Folio de secuencia en los asientos contables"""
+    from flask import current_app
+
+    _add_column('journal_entry', 'number', 'VARCHAR(30)')
+    db.session.execute(text('CREATE UNIQUE INDEX IF NOT EXISTS ix_journal_entry_number ON journal_entry (number)'))
+
+    # Los asientos existentes toman su id como folio y la secuencia continúa después
+    prefix = current_app.config['SEQUENCE_PREFIXES']['journal']
+    ids = [id_ for (id_,) in db.session.execute(text('SELECT id FROM journal_entry WHERE number IS NULL'))]
+    if ids:
+        db.session.execute(
+            text('UPDATE journal_entry SET number = :number WHERE id = :id'),
+            [{'id': id_, 'number': f"{prefix}{id_:06d}"} for id_ in ids]
+        )
+    last = db.session.execute(text('SELECT MAX(id) FROM journal_entry')).scalar() or 0
+    if last and not db.session.execute(text("SELECT 1 FROM document_sequence WHERE code = 'journal'")).first():
+        db.session.execute(
+            text("INSERT INTO document_sequence (code, next_value) VALUES ('journal', :next_value)"),
+            {'next_value': last + 1}
+        )
+
+
+def location_priority():
+    """Prioridad de las bodegas para la asignación de stock"""
+    _add_column('locations_inventory', 'priority', 'INTEGER DEFAULT 0')
+    db.session.execute(text('UPDATE locations_inventory SET priority = 0 WHERE priority IS NULL'))
+
+
+def sale_order_list_indexes():
+    """Índices del listado paginado de ventas"""
+    db.session.execute(text('CREATE INDEX IF NOT EXISTS ix_sale_order_issue_date_id ON sale_order (issue_date, id)'))
+    db.session.execute(text(
+        'CREATE INDEX IF NOT EXISTS ix_sale_order_customer_issue_date ON sale_order (id_customer, issue_date, id)'
+    ))
+    db.session.execute(text(
+        'CREATE INDEX IF NOT EXISTS ix_sale_order_line_id_sale_order ON sale_order_line (id_sale_order)'
+    ))
+
+
+def sales_daily_summary():
+    """Resumen diario de ventas calculado desde las ventas existentes"""
+    from app.utils.sales_cube import rebuild
+
+    # El cálculo descuenta lo devuelto de cada línea
+    _add_column('sale_order_line', 'returned_quantity', 'INTEGER NOT NULL DEFAULT 0')
+    rebuild()
+
+
+def sale_returns():
+    """Cantidades devueltas en ventas y salidas de ventas anteriores como reservas consumidas"""
+    _add_column('sale_order_line', 'returned_quantity', 'INTEGER NOT NULL DEFAULT 0')
+    _add_column('stock_reservation', 'returned_quantity', 'INTEGER NOT NULL DEFAULT 0')
+    db.session.execute(text('CREATE INDEX IF NOT EXISTS ix_journal_entry_reference ON journal_entry (reference)'))
+
+    # Las devoluciones regresan el stock a las bodegas de las reservas consumidas;
+    # las ventas registradas antes de las reservas las toman de sus movimientos de salida
+    db.session.execute(text(
+        "INSERT INTO stock_reservation (id_sale_order, id_location, id_material, quantity, returned_quantity, "
+        "status, expires_at, created_at, created_by) "
+        "SELECT substr(m.notes, 7), m.id_location, m.id_material, m.quantity, 0, 'consumido', "
+        "COALESCE(m.created_at, CURRENT_TIMESTAMP), COALESCE(m.created_at, CURRENT_TIMESTAMP), m.created_by "
+        "FROM inventory_movements m "
+        "WHERE m.movement_type = 'SALIDA' AND m.notes LIKE 'Venta %' "
+        "AND NOT EXISTS (SELECT 1 FROM stock_reservation r WHERE r.id_sale_order = substr(m.notes, 7))"
+    ))
+
+
+def customer_credit():
+    """Límite de crédito y saldo por cobrar de los clientes"""
+    _add_column('customer', 'credit_limit', 'BIGINT')
+    _add_column('customer', 'receivable_balance', 'BIGINT NOT NULL DEFAULT 0')
+
+    # Saldo inicial: lo no devuelto de las ventas despachadas menos los cobros (en centavos)
+    db.session.execute(text(
+        "UPDATE customer SET receivable_balance = "
+        "COALESCE((SELECT SUM(l.subtotal - COALESCE(l.returned_quantity, 0) * l.unit_price) "
+        "FROM sale_order_line l JOIN sale_order s ON s.id_sale_order = l.id_sale_order "
+        "WHERE s.id_customer = customer.id_customer AND s.status IN ('aprobado', 'devuelto parcial')), 0) - "
+        "COALESCE((SELECT SUM(p.amount) FROM customer_payment p WHERE p.id_customer = customer.id_customer), 0)"
+    ))
+
+
+def search_indexes():
+    """Índices de búsqueda de texto (FTS5 trigram / pg_trgm) en materiales, clientes y proveedores"""
+    from app.utils.search import create_search_indexes
+
+    create_search_indexes()
+
+
+def autocomplete_indexes():
+    """Índices sobre lower(código) y lower(nombre) para el autocompletado por prefijo"""
+    for table, code in [('material', 'id_material'), ('supplier', 'id_suplier'),
+                        ('customer', 'id_customer'), ('locations_inventory', 'code')]:
+        for column in (code, 'name'):
+            db.session.execute(text(
+                f'CREATE INDEX IF NOT EXISTS ix_{table}_{column}_lower ON {table} (lower({column}))'
+            ))
+
+
+def reference_version():
+    """Contador de versión de los datos de referencia en memoria"""
+    db.session.execute(text(
+        "INSERT INTO reference_version (name, version) "
+        "SELECT 'reference', 0 WHERE NOT EXISTS (SELECT 1 FROM reference_version WHERE name = 'reference')"
+    ))
+
+
+def grid_indexes():
+    """Índices (columna, id) para ordenar, paginar y contar facetas en las grillas"""
+    for table, columns in [('material', ['name', 'type', 'created_at', 'status']),
+                           ('supplier', ['name', 'country', 'created_at', 'status']),
+                           ('customer', ['name', 'country', 'created_at', 'status'])]:
+        for column in columns:
+            db.session.execute(text(
+                f'CREATE INDEX IF NOT EXISTS ix_{table}_grid_{column} ON {table} ({column}, id)'
+            ))
+
+
+def archived_master_data():
+    """Fecha de archivo en materiales, clientes y proveedores e índices parciales de filas vigentes"""
+    from app.models import Customer, Material, Supplier
+
+    for table in ('material', 'supplier', 'customer'):
+        _add_column(table, 'archived_at', 'TIMESTAMP')
+    # Los índices completos se reemplazan por los parciales definidos en models.py
+    for model in (Material, Supplier, Customer):
+        for index in model.__table__.indexes:
+            if index.name.endswith('_lower') or '_grid_' in index.name:
+                db.session.execute(text(f'DROP INDEX IF EXISTS {index.name}'))
+                index.create(db.session.connection())
+
+
+def journal_item_amount_currency_backfill():
+    """Importe en moneda extranjera de las líneas anteriores, con el tipo de cambio de su fecha"""
+    from app.utils.currency import backfill_amount_currency
+
+    # Va después de money_to_cents: debe y haber ya están en centavos
+    backfill_amount_currency()
+
+
+# (tabla, clave entera, columna de código, tabla destino, código destino)
+SURROGATE_KEYS = [
+    ('purchase_order', 'supplier_id', 'id_supplier', 'supplier', 'id_suplier'),
+    ('purchase_order_line', 'purchase_order_id', 'id_purchase_order', 'purchase_order', 'id_purchase_order'),
+    ('purchase_order_line', 'material_id', 'id_material', 'material', 'id_material'),
+    ('material', 'unit_id', 'unit', 'unit', 'symbol'),
+    ('material', 'type_id', 'type', 'material_type', 'name'),
+    ('account_account', 'account_type_id', 'account_type', 'account_type', 'id_account_type'),
+    ('account_account', 'account_group_id', 'account_group', 'account_group', 'id_account_group'),
+    ('account_account', 'nature_id', 'nature', 'account_nature', 'id_account_nature'),
+]
+
+
+def surrogate_keys():
+    """Claves enteras con índice junto a los códigos de proveedor, orden, material, unidad, tipo y cuenta"""
+    for table, key, code, target, target_code in SURROGATE_KEYS:
+        _add_column(table, key, f'INTEGER REFERENCES {target} (id)')
+        # Relleno en bloque: un UPDATE por columna; si el código destino se repite gana el id menor
+        db.session.execute(text(
+            f'UPDATE {table} SET {key} = (SELECT MIN(t.id) FROM {target} t WHERE t.{target_code} = {table}.{code}) '
+            f'WHERE {key} IS NULL'
+        ))
+        db.session.execute(text(f'CREATE INDEX IF NOT EXISTS ix_{table}_{key} ON {table} ({key})'))
+
+
+# (tabla, columna) con clave foránea a un código que se puede renombrar
+CODE_FOREIGN_KEYS = [
+    ('sale_order', 'id_customer'),
+    ('sale_quotation', 'id_customer'),
+    ('inventory_movements', 'id_material'),
+    ('inventory_stock', 'id_material'),
+    ('stock_reservation', 'id_material'),
+    ('sale_order_line', 'id_material'),
+    ('sale_quotation_line', 'id_material'),
+    ('price_list_item', 'id_material'),
+    ('discount_rule', 'id_material'),
+]
+
+
+def reference_code_constraints():
+    """Símbolo de unidad único y claves foráneas a códigos de cliente y material con ON UPDATE CASCADE"""
+    duplicates = db.session.execute(text('SELECT symbol FROM unit GROUP BY symbol HAVING COUNT(*) > 1')).scalars().all()
+    if duplicates:
+        raise RuntimeError(f"Unidades con el mismo símbolo, unifíquelas antes de migrar: {', '.join(duplicates)}")
+    inspector = inspect(db.engine)
+    unique = [c['column_names'] for c in inspector.get_unique_constraints('unit')] + \
+        [i['column_names'] for i in inspector.get_indexes('unit') if i['unique']]
+    if ['symbol'] not in unique:
+        db.session.execute(text('CREATE UNIQUE INDEX IF NOT EXISTS uq_unit_symbol ON unit (symbol)'))
+
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        # SQLite no permite cambiar una restricción existente y la aplicación no
+        # activa PRAGMA foreign_keys: los renombres los propaga app/utils/surrogates.py
+        return
+    drop = 'DROP FOREIGN KEY' if dialect == 'mysql' else 'DROP CONSTRAINT'
+    for table, column in CODE_FOREIGN_KEYS:
+        for fk in inspector.get_foreign_keys(table):
+            if fk['constrained_columns'] != [column] or fk['options'].get('onupdate') == 'CASCADE':
+                continue
+            target, target_column = fk['referred_table'], fk['referred_columns'][0]
+            db.session.execute(text(f"ALTER TABLE {table} {drop} {fk['name']}"))
+            db.session.execute(text(
+                f"ALTER TABLE {table} ADD CONSTRAINT {fk['name']} FOREIGN KEY ({column}) "
+                f"REFERENCES {target} ({target_column}) ON UPDATE CASCADE"
+            ))
+
+
+MIGRATIONS = [
+    ('journal_item_amount_currency', journal_item_amount_currency),
+    ('account_account_path', account_account_path),
+    ('money_to_cents', money_to_cents),
+    ('journal_entry_number', journal_entry_number),
+    ('location_priority', location_priority),
+    ('sale_order_list_indexes', sale_order_list_indexes),
+    ('sales_daily_summary', sales_daily_summary),
+    ('sale_returns', sale_returns),
+    ('customer_credit', customer_credit),
+    ('search_indexes', search_indexes),
+    ('autocomplete_indexes', autocomplete_indexes),
+    ('reference_version', reference_version),
+    ('surrogate_keys', surrogate_keys),
+    ('grid_indexes', grid_indexes),
+    ('archived_master_data', archived_master_data),
+    ('journal_item_amount_currency_backfill', journal_item_amount_currency_backfill),
+    ('reference_code_constraints', reference_code_constraints),
+    ('account_account_path_repair', account_account_path_repair),
+]
+
+
+def run_migrations():
+    app = create_app()
+
+    with app.app_context():
+        print("Iniciando migración de base de datos...")
+
+        # Tablas nuevas definidas en models.py
+        db.create_all()
+
+        db.session.execute(text(
+            'CREATE TABLE IF NOT EXISTS schema_migration ('
+            'name VARCHAR(100) PRIMARY KEY, applied_at TIMESTAMP)'
+        ))
+        db.session.commit()
+        applied = {name for (name,) in db.session.execute(text('SELECT name FROM schema_migration'))}
+
+        for name, migration in MIGRATIONS:
+            if name in applied:
+                continue
+            print(f"Aplicando {name}: {migration.__doc__}")
+            try:
+                migration()
+                db.session.execute(
+                    text('INSERT INTO schema_migration (name, applied_at) VALUES (:name, :applied_at)'),
+                    {'name': name, 'applied_at': datetime.utcnow()}
+                )
+                db.session.commit()
+                print(f"✓ {name}")
+            except Exception as e:
+                db.session.rollback()
+                print(f"❌ ERROR en {name}: {str(e)}")
+                raise
+
+        print("\n✅ BASE DE DATOS ACTUALIZADA")
+
+
+if __name__ == '__main__':
+    run_migrations()